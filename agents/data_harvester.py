@@ -1,78 +1,262 @@
 import os
-from datetime import datetime
-from github.github_client import get_commits, get_commit_details, get_pull_requests, get_pull_request_reviews
-from store.db import log_event
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from github.github_client import iter_commits, get_commit_details_bulk, iter_pull_requests, get_pull_request_reviews_bulk
+from store.db import (
+    log_event, save_commits, save_pull_requests, load_commits, load_pull_requests,
+    get_harvest_state, save_harvest_state, get_known_commit_shas, save_author_logins,
+)
+
+# DB-first mode: reports within this many seconds of the last harvest are served from SQLite (0 = always harvest)
+HARVEST_MAX_STALENESS_SECONDS = int(os.getenv("HARVEST_MAX_STALENESS_SECONDS", "900"))
+# Incremental runs re-list commits from this long before the previous fetch, so commits pushed late (rebased,
+# cherry-picked, merged from a branch) with older dates are still picked up; already stored shas are skipped
+HARVEST_COMMIT_OVERLAP_SECONDS = int(os.getenv("HARVEST_COMMIT_OVERLAP_SECONDS", "86400"))
+
+
+def commit_diff_record(sha, commit_details):
+    """Builds a commit_diff_data record from a GitHub commit-details payload."""
+    files_changed_in_commit = commit_details.get("files", [])
+    return {
+        "sha": sha,
+        "author": (commit_details.get("author") or {}).get("login", "unknown"),
+        "date": commit_details.get("commit", {}).get("author", {}).get("date"),
+        "additions": sum(file.get("additions", 0) for file in files_changed_in_commit),
+        "deletions": sum(file.get("deletions", 0) for file in files_changed_in_commit),
+        "files": len(files_changed_in_commit),
+        # Kept for the file hotspot index; save_commits routes it there instead of the commits table
+        "file_changes": [
+            [file["filename"], file.get("additions", 0), file.get("deletions", 0)]
+            for file in files_changed_in_commit if file.get("filename")
+        ],
+    }
+
+def author_logins(all_commit_details):
+    """{git author email: GitHub login or None} from commit-details payloads, for mapping git identities to logins."""
+    logins = {}
+    for commit_details in all_commit_details:
+        email = ((commit_details.get("commit") or {}).get("author") or {}).get("email")
+        if email:
+            logins[email] = (commit_details.get("author") or {}).get("login")
+    return logins
+
+def pull_request_record(pr, first_review_time):
+    """Builds a pull_request_details record from a GitHub pull request payload."""
+    return {
+        "number": pr.get("number"),
+        "title": pr.get("title"),
+        "state": pr.get("state"),
+        "created_at": pr.get("created_at"),
+        "closed_at": pr.get("closed_at"),
+        "merged_at": pr.get("merged_at"),
+        "updated_at": pr.get("updated_at"),
+        "author": (pr.get("user") or {}).get("login", "unknown"),
+        "additions": pr.get("additions", 0), # These are high-level for PR
+        "deletions": pr.get("deletions", 0), # These are high-level for PR
+        "changed_files": pr.get("changed_files", 0), # This is high-level for PR
+        "first_review_at": first_review_time,
+    }
+
+def _timestamp(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def commits_mark(marks, overlap_seconds=HARVEST_COMMIT_OVERLAP_SECONDS):
+    """
+    Where an incremental run starts listing commits: overlap_seconds before the previous fetch.
+
+    Commit dates are not monotonic in push order, so the newest date seen is no safe mark on its
+    own; states from before commits_fetched_at fall back to it.
+    """
+    if marks.get("commits_fetched_at"):
+        fetched_at = datetime.fromisoformat(marks["commits_fetched_at"].replace("Z", "+00:00"))
+        return _timestamp(fetched_at - timedelta(seconds=overlap_seconds))
+    return marks.get("last_commit_date")
+
+def covers(covered_since, since):
+    """True if a store holding everything from covered_since on also holds everything from since on."""
+    if covered_since is None:
+        return False
+    return covered_since == "" or (since is not None and covered_since <= since)
+
+def commit_store_row(record, repo):
+    """Maps a commit_diff_data record onto the commits table columns."""
+    return {
+        "sha": record["sha"],
+        "repo": repo,
+        "author": record["author"],
+        "date": record["date"],
+        "additions": record["additions"],
+        "deletions": record["deletions"],
+        "files_changed": record["files"],
+        "file_changes": record.get("file_changes"),
+    }
 
 
 class DataHarvester:
-    def __init__(self, owner, repo):
+    def __init__(self, owner, repo, max_workers=None, window_days=7, max_commits=None, batch_size=100, full_resync=False, store_only=False,
+                 max_staleness_seconds=None):
         self.owner = owner
         self.repo = repo
+        self.full_name = f"{owner}/{repo}" # Key for this repo's rows and high-water marks in the store
+        self.max_workers = max_workers # None falls back to GITHUB_MAX_WORKERS; 1 fetches sequentially
+        self.window_days = window_days # Reporting window pushed down to the GitHub API
+        self.max_commits = max_commits # Optional cap on commits per run (None = whole window)
+        self.batch_size = batch_size # Commit details are fetched one page-sized batch at a time
+        self.full_resync = full_resync # Ignore high-water marks and re-crawl the whole window
+        self.store_only = store_only # Read the window from SQLite (e.g. kept fresh by webhooks) with zero API calls
+        self.max_staleness_seconds = max_staleness_seconds # Skip the harvest if the last one is younger than this
 
     def run(self, state):
         print("DataHarvester state (input):", state)
+        started_at = time.time()
+        run_id = state.get("run_id") or uuid.uuid4().hex # ties every agent's log events to this report
         repo_info = {"owner": self.owner, "repo": self.repo}
 
+        window_since = None # window_days=None harvests the whole history
+        if self.window_days is not None:
+            window_since = _timestamp(datetime.now(timezone.utc) - timedelta(days=self.window_days))
+
+        # Incremental mode: only ask GitHub for objects newer than what the store already holds
+        stored_marks = get_harvest_state(self.full_name)
+        marks = None if self.full_resync else stored_marks
+
+        if self.store_only or self._is_fresh(marks, window_since):
+            log_event("DataHarvester", "load_from_store", repo_info, {"store_only": self.store_only, "marks": marks},
+                      run_id=run_id, started_at=started_at)
+            return {
+                "run_id": run_id,
+                "repo": self.full_name,
+                "window_since": window_since or "", # "" = the whole history
+                "commit_diff_data": load_commits(self.full_name, since=window_since),
+                "pull_request_details": load_pull_requests(self.full_name, updated_since=window_since),
+            }
+
+        covered_since = marks.get("covered_since") if marks else None
+        prs_since = window_since
+        if marks and covers(covered_since, window_since):
+            # The store already reaches back past the window: only fetch what is newer than the marks
+            commit_ranges = [(max(window_since or "", commits_mark(marks) or "") or None, None)]
+            prs_since = max(window_since or "", marks.get("last_pr_updated_at") or "") or None
+        elif marks and covered_since is not None and commits_mark(marks):
+            # A wider window than the store covers: fetch the missing older range plus anything new
+            commit_ranges = [(window_since, covered_since), (max(covered_since, commits_mark(marks)), None)]
+        else:
+            commit_ranges = [(window_since, None)]
+
         # --- 1. Fetch and Process Commit Data ---
-        commits_raw = get_commits(self.owner, self.repo)
-        pr_data = [] # Renaming this variable to avoid confusion, it stores commit-level diffs
-        
-        # Limit to 10 commits for demo purposes to avoid hitting API rate limits quickly
-        for commit_summary in commits_raw[:10]:
-            sha = commit_summary.get("sha")
-            
-            # Fetch full commit details to get file changes for additions/deletions
-            commit_details = get_commit_details(self.owner, self.repo, sha)
-            files_changed_in_commit = commit_details.get("files", []) 
-
-            pr_data.append({
-                "sha": sha,
-                "author": commit_details.get("author", {}).get("login", "unknown"),
-                "date": commit_details.get("commit", {}).get("author", {}).get("date"),
-                "additions": sum(file.get("additions", 0) for file in files_changed_in_commit),
-                "deletions": sum(file.get("deletions", 0) for file in files_changed_in_commit),
-                "files": len(files_changed_in_commit)
-            })
-
-        log_event("DataHarvester", "harvest_commits", repo_info, pr_data)
+        commits_fetched_at = _timestamp(datetime.now(timezone.utc)) # anything pushed from here on is left to the next run
+        pr_data = [] # Commit-level diffs, despite the historical name
+        for since, until in commit_ranges:
+            pr_data += self._harvest_commits(since, until)
+        log_event("DataHarvester", "harvest_commits", repo_info, pr_data, run_id=run_id, started_at=started_at)
 
         # --- 2. Fetch and Process Pull Request Data ---
-        pull_requests_raw = get_pull_requests(self.owner, self.repo, state="closed", per_page=10) # Fetch closed PRs
+        prs_started_at = time.time()
+        pull_request_data = self._harvest_pull_requests(prs_since)
+        log_event("DataHarvester", "harvest_prs", repo_info, pull_request_data, run_id=run_id, started_at=prs_started_at)
+
+        # --- 3. Merge the delta into the store and advance the high-water marks ---
+        # A run capped by max_commits may have stopped short of the window start, so it extends no coverage
+        # and leaves the commit mark where it was
+        truncated = self.max_commits is not None and len(pr_data) >= self.max_commits
+        covered_since = None if truncated else ("" if window_since is None else window_since)
+        self._merge(pr_data, pull_request_data, marks, covered_since, (stored_marks or {}).get("covered_since"),
+                    None if truncated else commits_fetched_at)
+
+        # Return the whole window (stored rows plus this run's delta) in the state
+        return {
+            "run_id": run_id,
+            "repo": self.full_name,
+            "window_since": window_since or "", # "" = the whole history
+            "commit_diff_data": load_commits(self.full_name, since=window_since),
+            "pull_request_details": load_pull_requests(self.full_name, updated_since=window_since),
+        }
+
+    def _harvest_commits(self, since, until=None):
+        """Returns commit_diff_data records for commits dated at or after since (and before until)."""
+        # Commits in the window are streamed page by page; only the pages the window needs are downloaded
+        commits_raw = islice(iter_commits(self.owner, self.repo, since=since, until=until), self.max_commits)
+        pr_data = []
+
+        while True:
+            shas = [commit_summary.get("sha") for commit_summary in islice(commits_raw, self.batch_size)]
+            if not shas:
+                break
+            if not self.full_resync:
+                # `since` is inclusive, so the boundary commit comes back again; skip commits we already hold
+                known = get_known_commit_shas(self.full_name, shas)
+                shas = [sha for sha in shas if sha not in known]
+
+            # Fetch full commit details (file changes for additions/deletions) in parallel
+            all_commit_details = get_commit_details_bulk(self.owner, self.repo, shas, max_workers=self.max_workers)
+            save_author_logins(author_logins(all_commit_details)) # lets the git backend name authors by login too
+
+            for sha, commit_details in zip(shas, all_commit_details):
+                pr_data.append(commit_diff_record(sha, commit_details))
+        return pr_data
+
+    def _harvest_pull_requests(self, since):
+        """Returns pull_request_details records for closed PRs updated at or after since."""
+        # Paging stops at the first PR last updated before `since`
+        pull_requests_raw = list(iter_pull_requests(self.owner, self.repo, state="closed", since=since))
         pull_request_data = []
 
-        for pr in pull_requests_raw:
-            pr_number = pr.get("number")
-            
-            # Fetch reviews for each PR to calculate review latency
-            reviews = get_pull_request_reviews(self.owner, self.repo, pr_number)
-            
+        # Fetch reviews for every PR in parallel to calculate review latency
+        pr_numbers = [pr.get("number") for pr in pull_requests_raw]
+        all_reviews = get_pull_request_reviews_bulk(self.owner, self.repo, pr_numbers, max_workers=self.max_workers)
+
+        for pr, pr_number, reviews in zip(pull_requests_raw, pr_numbers, all_reviews):
             first_review_time = None
             if reviews:
                 # Find the earliest review submission time
                 first_review_time = min([r.get("submitted_at") for r in reviews if r.get("submitted_at")], default=None)
 
-            pull_request_data.append({
-                "number": pr_number,
-                "title": pr.get("title"),
-                "state": pr.get("state"),
-                "created_at": pr.get("created_at"),
-                "closed_at": pr.get("closed_at"),
-                "merged_at": pr.get("merged_at"),
-                "author": pr.get("user", {}).get("login", "unknown"),
-                "additions": pr.get("additions", 0), # These are high-level for PR
-                "deletions": pr.get("deletions", 0), # These are high-level for PR
-                "changed_files": pr.get("changed_files", 0), # This is high-level for PR
-                "first_review_at": first_review_time,
-                "commits_url": pr.get("commits_url"), # URL to fetch commits for this PR if needed
-            })
-        
-        log_event("DataHarvester", "harvest_prs", repo_info, pull_request_data)
-
-        # Return both types of data in the state
-        return {
-            "commit_diff_data": pr_data, # Renamed from pr_data to be more specific
-            "pull_request_details": pull_request_data
-        }
+            pull_request_data.append(pull_request_record(pr, first_review_time))
+        return pull_request_data
+
+    def _is_fresh(self, marks, window_since):
+        """
+        True if the store was harvested within max_staleness_seconds and already reaches back to
+        window_since, so the API can be skipped. A recent but narrower harvest is not fresh for a wider window.
+        """
+        if not self.max_staleness_seconds or not marks or not marks.get("last_harvested_at"):
+            return False
+        if not covers(marks.get("covered_since"), window_since):
+            return False
+        harvested_at = datetime.fromisoformat(marks["last_harvested_at"].replace("Z", "+00:00"))
+        return (datetime.now(timezone.utc) - harvested_at).total_seconds() < self.max_staleness_seconds
+
+    def _merge(self, commit_diff_data, pull_request_data, marks, covered_since=None, stored_covered_since=None,
+               commits_fetched_at=None):
+        # Write-through: each table is upserted in one bulk transaction
+        saved = True
+        if commit_diff_data:
+            saved &= save_commits([commit_store_row(c, self.full_name) for c in commit_diff_data], repo=self.full_name)
+        if pull_request_data:
+            saved &= save_pull_requests(pull_request_data, repo=self.full_name)
+        if not saved:
+            print(f"⚠️  Keeping the old high-water marks for {self.full_name}; the next run re-fetches this delta.")
+            return
+
+        marks = dict(marks or {})
+        newest_commit = max(commit_diff_data, key=lambda c: (c["date"] or "", c["sha"]), default=None)
+        if newest_commit and (newest_commit["date"] or "") >= (marks.get("last_commit_date") or ""):
+            marks["last_commit_date"] = newest_commit["date"]
+            marks["last_commit_sha"] = newest_commit["sha"]
+        if commits_fetched_at:
+            marks["commits_fetched_at"] = commits_fetched_at
+        newest_pr_update = max((pr["updated_at"] or "" for pr in pull_request_data), default="")
+        if newest_pr_update > (marks.get("last_pr_updated_at") or ""):
+            marks["last_pr_updated_at"] = newest_pr_update
+        marks["last_harvested_at"] = _timestamp(datetime.now(timezone.utc))
+        # This run filled the store from covered_since up to now; it joins whatever was already covered
+        if covered_since is not None:
+            marks["covered_since"] = min(covered_since, stored_covered_since) if stored_covered_since is not None else covered_since
+        else:
+            marks["covered_since"] = stored_covered_since
+        save_harvest_state(self.full_name, marks)
 
 
 """
@@ -82,7 +266,7 @@ Imports: Added get_pull_requests and get_pull_request_reviews.
 
 Commit Data Processing:
     Renamed pr_data to commit_diff_data to be more explicit that it contains commit-level diffs, not PR details.
-    Limited commits_raw to [:10] for demonstration to manage API rate limits.
+    Commits are streamed for the reporting window (window_days, pushed down to the API as `since`) instead of a fixed [:10] slice.
     Added author and date extraction from commit_details for per-author stats later.
 
 New PR Data Processing:
@@ -91,6 +275,25 @@ New PR Data Processing:
     Collects crucial PR fields like number, title, state, created_at, closed_at, merged_at, author, additions, deletions, changed_files, and first_review_at.
     Logs the PR harvesting event.
 
+Incremental Harvesting:
+    Per-repo high-water marks (when commits were last listed, newest commit date/SHA, newest PR updated_at) live in
+    the harvest_state table. Commits are re-listed from HARVEST_COMMIT_OVERLAP_SECONDS before the previous fetch,
+    since commit dates don't follow push order, and stored shas are skipped. Each run fetches only objects past those marks, merges them into commits/pull_requests via save_commits/save_pull_requests,
+    and returns the window from the store. Pass full_resync=True to ignore the marks and re-crawl the window.
+    harvest_state.covered_since records how far back the stored data is complete; a window reaching further back
+    (e.g. 30 days after a 7-day run) also fetches the missing older range, so the store never answers with a partial window.
+
+Store-only Mode:
+    With store_only=True the window is read straight from SQLite (kept current by the GitHub webhook receiver
+    in bot/github_webhook.py), so a report costs no GitHub API calls at all.
+
+Multi-repo Store:
+    Rows are keyed on (repo, sha) / (repo, number), so many repos can share one database; the state carries "repo".
+
+DB-first Mode:
+    With max_staleness_seconds set (build_graph uses HARVEST_MAX_STALENESS_SECONDS), a run that finds the repo harvested
+    within that TTL (harvest_state.last_harvested_at) reads the window from SQLite and makes no GitHub calls.
+
 Return Value: The run method now returns a dictionary containing two keys:
 
     "commit_diff_data": Your original commit-level diffs.
@@ -1,24 +1,205 @@
-from store.db import log_event
-from datetime import datetime
+import os
+import time
+import hashlib
+from agents.metrics_engine import commit_columns, compute_aggregates
+from agents.metrics_accumulator import MetricsAccumulator
+from agents.timeseries import ChurnTimeSeries
+from agents.quantile_sketch import QuantileSketch, SKETCH_METRICS, new_sketches
+from store.db import (
+    log_event, iter_stored_commits, iter_stored_pull_requests, get_author_churn, get_weekly_pr_metrics,
+    iter_new_commits, iter_changed_pull_requests, list_repos, get_metric_sketch, get_hotspot_files, get_hotspot_directories, get_cochanged_files,
+    load_accumulator_state, save_accumulator_state,
+)
+from datetime import datetime, timedelta
 from collections import defaultdict
 
 
+# "numpy" (columnar, vectorized) or "python" (reference single-pass loop); both give the same result dict
+DIFF_ANALYST_ENGINE = os.getenv("DIFF_ANALYST_ENGINE", "numpy")
+
+
+def _state_reference(state):
+    """
+    A small stand-in for a harvested state in the run log: repo, window and a content hash of the commit shas.
+
+    The commits and PRs themselves are already in the store (and in the harvester's own log events).
+    """
+    shas = sorted(c.get("sha") or "" for c in state.get("commit_diff_data", []))
+    return {
+        "repo": state.get("repo"),
+        "window_since": state.get("window_since"),
+        "commits": len(shas),
+        "commit_shas_sha256": hashlib.sha256("\n".join(shas).encode()).hexdigest(),
+        "pull_requests": len(state.get("pull_request_details", [])),
+    }
+
+
 class DiffAnalyst:
+    def __init__(self, engine=DIFF_ANALYST_ENGINE, timeseries=None):
+        self.engine = engine
+        self.timeseries = timeseries or ChurnTimeSeries()
+
     def run(self, state):
         print("DiffAnalyst state (input):", state)
+        started_at = time.time()
         
         commit_diff_data = state.get("commit_diff_data", [])
         pull_request_details = state.get("pull_request_details", [])
 
+        result = self.analyze(commit_diff_data, pull_request_details, repo=state.get("repo"), since=state.get("window_since"))
+
+        log_event("DiffAnalyst", "analyze_metrics", _state_reference(state), result, run_id=state.get("run_id"), started_at=started_at)
+        
+        # Pass the original data along with the new analysis
+        state["analysis"] = result
+        state["pr_data_for_chart"] = commit_diff_data # Keep this for charting in the next step
+        return state
+
+    def run_window(self, repo, since=None, until=None, authors=None):
+        """
+        Analyzes a repo's [since, until) window straight from the store.
+
+        Commits and PRs are streamed from SQLite through analyze_reference()'s single pass, so memory stays
+        flat no matter how much history the window covers.
+        """
+        started_at = time.time()
+        window = {"repo": repo, "since": since, "until": until, "authors": authors}
+        result = self.analyze_reference(
+            iter_stored_commits(repo, since, until, authors),
+            iter_stored_pull_requests(repo, since, until, authors, window_field="created_at"),
+            # An author filter sees only part of each bucket, so its pass mustn't move the repo's baselines
+            repo=None if authors else repo, since=since or "", until=until,
+        )
+        log_event("DiffAnalyst", "analyze_window", window, result, started_at=started_at)
+        return result
+
+    def run_repos(self, repos=None, since=None, until=None):
+        """Analyzes the same window for each repo (default: every repo in the store); returns {repo: metrics}."""
+        return {repo: self.run_window(repo, since, until) for repo in (repos or list_repos())}
+
+    def run_incremental(self, repo, key=None):
+        """
+        Reports a repo's full stored history by folding only what changed since the last call.
+
+        The MetricsAccumulator saved under key (default: the repo) is loaded, rows stored since its
+        last fold (by store insertion order, so backfilled older commits count too) and PRs updated
+        since then are applied, settled entries are pruned, and the state is saved back, so each
+        report costs O(delta) instead of a re-read of history. Churn signals are rescored from the
+        week of the oldest new commit on.
+        """
+        started_at = time.time()
+        key = key or repo
+        accumulator = MetricsAccumulator.from_dict(load_accumulator_state(key))
+        new_commits = list(iter_new_commits(repo, accumulator.commit_watermark.get(repo)))
+        accumulator.add_commits(new_commits, repo)
+        accumulator.add_pull_requests(iter_changed_pull_requests(
+            repo, accumulator.pr_seq_watermark.get(repo), accumulator.pr_watermark.get(repo)), repo)
+        days = [c["date"][:10] for c in new_commits if c.get("date")]
+        if days:
+            day = datetime.fromisoformat(min(days)).date()
+            since_week = (day - timedelta(days=day.weekday())).isoformat()
+            signals = self.timeseries.analyze_rollups(repo, since_day=since_week, commits=new_commits)
+            accumulator.add_churn_signals(signals, repo, since=since_week)
+        accumulator.prune()
+        save_accumulator_state(key, accumulator.to_dict())
+
+        result = self.summarize_accumulator(accumulator)
+        log_event("DiffAnalyst", "analyze_incremental", {"repo": repo, "key": key}, result, started_at=started_at)
+        return result
+
+    def run_rollups(self, repo, since_day=None, until_day=None):
+        """
+        Builds the metrics dict for a long window (month/quarter) from the rollup tables.
+
+        Reads a few hundred daily/weekly rollup rows instead of scanning raw commits and PRs;
+        PR metrics cover the ISO weeks overlapping [since_day, until_day). Spikes are the stored
+        commits the churn baselines flag, read through the (repo, date) index.
+        """
+        started_at = time.time()
+        since_week = until_week = None
+        if since_day:
+            day = datetime.fromisoformat(since_day[:10]).date()
+            since_week = (day - timedelta(days=day.weekday())).isoformat()
+        if until_day:
+            until_week = until_day[:10]
+
+        per_author_diffs = {
+            row["author"]: {k: row[k] for k in ("additions", "deletions", "files_changed", "commits")}
+            for row in get_author_churn(repo, since_day, until_day)
+        }
+        weeks = get_weekly_pr_metrics(repo, since_week, until_week)
+        merged = sum(w["merged_count"] for w in weeks)
+        cycle_count = sum(w["cycle_time_count"] for w in weeks)
+        review_count = sum(w["review_latency_count"] for w in weeks)
+        avg_cycle_time_hours = sum(w["cycle_time_seconds_sum"] for w in weeks) / cycle_count / 3600 if cycle_count else 0
+        avg_review_latency_hours = sum(w["review_latency_seconds_sum"] for w in weeks) / review_count / 3600 if review_count else 0
+
+        total_adds = sum(a["additions"] for a in per_author_diffs.values())
+        total_dels = sum(a["deletions"] for a in per_author_diffs.values())
+        total_commits = sum(a["commits"] for a in per_author_diffs.values())
+        signals = self.timeseries.analyze_rollups(repo, since_day, until_day)
+        # Sketches are kept per ISO week, so percentiles cover whole weeks like the PR metrics
+        sketches = {metric: get_metric_sketch(repo, metric, since_week, until_week) for metric in SKETCH_METRICS}
+        result = self._summarize(signals, total_adds, total_dels, per_author_diffs, total_commits,
+                                 merged, avg_review_latency_hours, avg_cycle_time_hours, sketches)
+        log_event("DiffAnalyst", "analyze_rollups", {"repo": repo, "since": since_day, "until": until_day}, result, started_at=started_at)
+        return result
+
+    def run_hotspots(self, repo, since_day=None, until_day=None, limit=10, depth=None):
+        """
+        Top-N hotspot files and directories for a window, read from the precomputed file index.
+
+        Covers the ISO weeks overlapping [since_day, until_day); each top file also lists the files
+        it most often changed together with in those weeks.
+        """
+        started_at = time.time()
+        files = get_hotspot_files(repo, since_day, until_day, limit)
+        for file in files:
+            file["cochanged_with"] = get_cochanged_files(repo, file["path"], since_day, until_day, limit=3)
+        result = {
+            "hotspot_files": files,
+            "hotspot_directories": get_hotspot_directories(repo, since_day, until_day, limit, depth),
+        }
+        log_event("DiffAnalyst", "analyze_hotspots", {"repo": repo, "since": since_day, "until": until_day}, result, started_at=started_at)
+        return result
+
+    def analyze(self, commit_diff_data, pull_request_details, repo=None, since=None, until=None):
+        """
+        Computes the metrics dict with the configured engine.
+
+        Spikes and risk flags come from the churn time series of repo over [since, until) (see
+        ChurnTimeSeries.analyze); without a repo they are scored against baselines of this pass only.
+        """
+        if self.engine == "numpy":
+            commits = list(commit_diff_data)
+            columns = commit_columns(commits) # shared by the time series and the aggregates
+            signals = self.timeseries.analyze(commits, repo, since, until, columns=columns)
+            return self._summarize(signals, *compute_aggregates(commits, list(pull_request_details), columns))
+        return self.analyze_reference(sorted(commit_diff_data, key=lambda c: (c.get("date") or "", c["sha"])),
+                                      pull_request_details, repo, since, until)
+
+    def analyze_reference(self, commit_diff_data, pull_request_details, repo=None, since=None, until=None):
+        """
+        Computes the metrics dict in one pass over each input, so plain iterators/generators work too.
+
+        Commits must come in (date, sha) order, as the store streams them, for the churn time series.
+        """
         # --- Basic Churn & Spikes (Existing) ---
-        spikes = [p for p in commit_diff_data if (p["additions"] + p["deletions"]) > 500]
-        total_adds_commits = sum(p["additions"] for p in commit_diff_data)
-        total_dels_commits = sum(p["deletions"] for p in commit_diff_data)
-        total_churn_commits = total_adds_commits + total_dels_commits
+        scan = self.timeseries.scan(repo, since, until)
+        total_adds_commits = 0
+        total_dels_commits = 0
+        total_commits = 0
 
         # --- Per-Author Diff Stats ---
         per_author_diffs = defaultdict(lambda: {"additions": 0, "deletions": 0, "files_changed": 0, "commits": 0})
+        sketches = new_sketches() # p50/p90/p99 in fixed memory
         for commit in commit_diff_data:
+            total_commits += 1
+            sketches["commit_churn"].add(commit["additions"] + commit["deletions"])
+            scan.add(commit)
+            total_adds_commits += commit["additions"]
+            total_dels_commits += commit["deletions"]
+
             author = commit.get("author", "unknown")
             per_author_diffs[author]["additions"] += commit.get("additions", 0)
             per_author_diffs[author]["deletions"] += commit.get("deletions", 0)
@@ -43,6 +224,7 @@ class DiffAnalyst:
                     cycle_time = (merged_at - created_at).total_seconds()
                     total_cycle_time_seconds += cycle_time
                     cycle_time_prs_count += 1
+                    sketches["cycle_time_hours"].add(cycle_time / 3600)
                 except (ValueError, KeyError):
                     pass # Handle cases where dates are missing or malformed
 
@@ -55,26 +237,31 @@ class DiffAnalyst:
                     if review_latency >= 0: # Ensure review didn't happen before creation
                         total_review_latency_seconds += review_latency
                         review_latency_prs_count += 1
+                        sketches["review_latency_hours"].add(review_latency / 3600)
                 except (ValueError, KeyError):
                     pass
 
         avg_review_latency_hours = (total_review_latency_seconds / review_latency_prs_count / 3600) if review_latency_prs_count > 0 else 0
         avg_cycle_time_hours = (total_cycle_time_seconds / cycle_time_prs_count / 3600) if cycle_time_prs_count > 0 else 0
 
+        return self._summarize(scan.finish(), total_adds_commits, total_dels_commits, dict(per_author_diffs), total_commits,
+                               pr_throughput_count, avg_review_latency_hours, avg_cycle_time_hours, sketches)
+
+    def summarize_accumulator(self, accumulator):
+        """The metrics dict for a MetricsAccumulator, e.g. one merged from several repos' states."""
+        return self._summarize(accumulator.churn_signals(), *accumulator.aggregates())
+
+    def _summarize(self, churn_signals, total_adds_commits, total_dels_commits, per_author_diffs, total_commits,
+                   pr_throughput_count, avg_review_latency_hours, avg_cycle_time_hours, sketches=None):
+        """Derives the CI, risk and DORA fields and assembles the result dict shared by every analysis path."""
+        total_churn_commits = total_adds_commits + total_dels_commits
+
         # --- CI Failures (Simulated for MVP) ---
         # For an MVP, we'll simulate CI failures as we don't have CI system integration.
         # Let's say 10% of commits are "failures".
-        total_commits = len(commit_diff_data)
         simulated_ci_failures = int(total_commits * 0.10) if total_commits > 0 else 0
         change_failure_rate = (simulated_ci_failures / total_commits) * 100 if total_commits > 0 else 0
 
-        # --- Defect Risk Flag (Heuristic) ---
-        # Link code-churn outliers to defect risk
-        defect_risk_flag = "Low"
-        if total_churn_commits > 1000 and len(spikes) >= 1: # Example heuristic
-            defect_risk_flag = "Medium"
-        if total_churn_commits > 2000 and len(spikes) >= 2:
-            defect_risk_flag = "High"
 
         # --- DORA Metrics (Derived from calculated metrics) ---
         # Lead Time for Changes: Already calculated as avg_cycle_time_hours
@@ -86,27 +273,28 @@ class DiffAnalyst:
         mean_time_to_recovery_hours = 0 # Placeholder for now
 
         result = {
-            "spikes": spikes,
+            "spikes": churn_signals["spikes"],
             "total_additions": total_adds_commits,
             "total_deletions": total_dels_commits,
             "churn_score": total_churn_commits,
-            "per_author_diffs": dict(per_author_diffs), # Convert defaultdict to dict for output
+            "per_author_diffs": per_author_diffs,
             "pr_throughput_count": pr_throughput_count,
             "avg_review_latency_hours": round(avg_review_latency_hours, 2),
             "avg_cycle_time_hours": round(avg_cycle_time_hours, 2),
             "simulated_ci_failures": simulated_ci_failures,
             "change_failure_rate_percent": round(change_failure_rate, 2),
-            "defect_risk_flag": defect_risk_flag,
+            # Churn outliers against the repo's own baselines, linked to defect risk
+            "defect_risk_flag": churn_signals["defect_risk_flag"],
+            "churn_anomalies": churn_signals["churn_anomalies"],
+            "risk_flags": churn_signals["risk_flags"],
             # DORA Mapping
             "dora_lead_time_for_changes_hours": round(avg_cycle_time_hours, 2),
             "dora_deployment_frequency": pr_throughput_count, # Simplified to PR throughput
             "dora_change_failure_rate_percent": round(change_failure_rate, 2),
             "dora_mttr_hours": mean_time_to_recovery_hours, # Placeholder
         }
-
-        log_event("DiffAnalyst", "analyze_metrics", state, result)
-        
-        # Pass the original data along with the new analysis
-        state["analysis"] = result
-        state["pr_data_for_chart"] = commit_diff_data # Keep this for charting in the next step
-        return state
+        # Percentiles next to the means, so a single week-old PR doesn't hide the typical case
+        sketches = sketches or {}
+        for metric in SKETCH_METRICS:
+            result.update(sketches.get(metric, QuantileSketch()).percentiles(metric))
+        return result
@@ -0,0 +1,153 @@
+import os
+import base64
+import subprocess
+from dotenv import load_dotenv
+from agents.data_harvester import DataHarvester, author_logins
+from github.github_client import get_commit_details_bulk
+from store.db import get_author_logins, save_author_logins
+
+load_dotenv()
+
+# Where bare mirrors are kept when no existing checkout path is given
+GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR", "mirrors")
+
+# Field/record separators that cannot appear in git's formatted output
+_RECORD_SEP = "\x1e"
+_FIELD_SEP = "\x1f"
+
+
+class GitMirrorHarvester(DataHarvester):
+    """
+    DataHarvester backend that reads commit stats from a local git repository instead of the commits API.
+
+    One `git log --numstat` pass yields author, date, additions, deletions and file counts for every
+    commit in the window, in the same commit_diff_data shape DataHarvester produces. Pull requests still
+    come from the GitHub API unless fetch_pull_requests=False, which makes the harvester fully offline.
+
+    Authors are GitHub logins, as with the API backend: author emails are mapped through the
+    author_logins table (filled by every API harvest), and with resolve_logins an unknown email costs
+    one commit lookup, after which it is known. Emails with no GitHub account keep the git name.
+    """
+
+    def __init__(self, owner, repo, repo_path=None, mirror_dir=GIT_MIRROR_DIR, fetch_pull_requests=True,
+                 resolve_logins=None, **kwargs):
+        super().__init__(owner, repo, **kwargs)
+        self.repo_path = repo_path # Existing checkout or bare repo; if None a mirror is maintained under mirror_dir
+        self.mirror_path = os.path.join(mirror_dir, owner, f"{repo}.git")
+        self.fetch_pull_requests = fetch_pull_requests
+        # Look up unknown author emails on the API (default: only when the harvester uses the API anyway)
+        self.resolve_logins = fetch_pull_requests if resolve_logins is None else resolve_logins
+
+    def _harvest_commits(self, since, until=None):
+        git_dir = self.repo_path or self._sync_mirror()
+        args = [
+            "log", "--numstat", "--no-renames", "--diff-merges=first-parent",
+            f"--format={_RECORD_SEP}%H{_FIELD_SEP}%an{_FIELD_SEP}%ae{_FIELD_SEP}%ad",
+            "--date=format-local:%Y-%m-%dT%H:%M:%SZ",
+        ]
+        if since:
+            args.append(f"--since={since}")
+        if until:
+            args.append(f"--until={until}")
+        if self.max_commits:
+            args.append(f"--max-count={self.max_commits}")
+
+        # TZ=UTC so format-local dates come out in the same Z form the GitHub API uses
+        proc = subprocess.Popen(
+            ["git", "-C", git_dir, *args], stdout=subprocess.PIPE, text=True,
+            encoding="utf-8", errors="replace", env=dict(os.environ, TZ="UTC"),
+        )
+        pr_data = list(parse_numstat_log(proc.stdout))
+        if proc.wait() != 0:
+            raise RuntimeError(f"git log failed for {git_dir} (exit code {proc.returncode})")
+        self._map_authors_to_logins(pr_data)
+        return pr_data
+
+    def _map_authors_to_logins(self, pr_data):
+        """Replaces git author names with GitHub logins where the author email is (or can be) mapped to one."""
+        unresolved = {c["author_email"]: c["sha"] for c in pr_data if c["author_email"] and not _noreply_login(c["author_email"])}
+        logins = get_author_logins(unresolved)
+        missing = {email: sha for email, sha in unresolved.items() if email.lower() not in logins}
+        if missing and self.resolve_logins:
+            try:
+                # One (immutable, cached) commit per unknown email; GitHub reports the login it maps to
+                details = get_commit_details_bulk(self.owner, self.repo, list(missing.values()), max_workers=self.max_workers)
+                learned = author_logins(details)
+                learned.update({email: None for email in missing if email not in learned})
+                save_author_logins(learned)
+                logins.update({email.lower(): login for email, login in learned.items()})
+            except Exception as e:
+                print(f"⚠️  Couldn't resolve {len(missing)} author email(s) to GitHub logins, keeping git names: {e}")
+        for commit in pr_data:
+            email = commit.pop("author_email")
+            login = logins.get((email or "").lower())
+            if login:
+                commit["author"] = login
+
+    def _harvest_pull_requests(self, since):
+        if not self.fetch_pull_requests:
+            return []
+        return super()._harvest_pull_requests(since)
+
+    def _sync_mirror(self):
+        """Clones a bare mirror on first use, then fetches only what changed since the last run."""
+        git_config = []
+        token = os.getenv("GITHUB_TOKEN")
+        if token:
+            # Passed per invocation so the token is never written into the mirror's config
+            basic = base64.b64encode(f"x-access-token:{token}".encode()).decode()
+            git_config = ["-c", f"http.extraHeader=Authorization: Basic {basic}"]
+
+        if os.path.isdir(self.mirror_path):
+            subprocess.run(["git", *git_config, "-C", self.mirror_path, "fetch", "--prune", "--quiet"], check=True)
+        else:
+            os.makedirs(os.path.dirname(self.mirror_path), exist_ok=True)
+            url = f"https://github.com/{self.owner}/{self.repo}.git"
+            subprocess.run(["git", *git_config, "clone", "--mirror", "--quiet", url, self.mirror_path], check=True)
+        return self.mirror_path
+
+
+def _noreply_login(email):
+    # GitHub noreply addresses ("123+login@users.noreply.github.com") carry the login
+    if email.endswith("@users.noreply.github.com"):
+        return email.split("@")[0].split("+")[-1]
+    return None
+
+def _author_login(name, email):
+    # The git name until GitMirrorHarvester maps the email to a login
+    return _noreply_login(email) or name or "unknown"
+
+def parse_numstat_log(lines):
+    """
+    Turns `git log --numstat` output (in GitMirrorHarvester's format) into commit_diff_data records.
+
+    Each record also carries the raw author_email, which GitMirrorHarvester maps to a login and drops.
+    """
+    record = None
+    for line in lines:
+        line = line.rstrip("\n")
+        if line.startswith(_RECORD_SEP):
+            if record:
+                yield record
+            sha, name, email, date = line[1:].split(_FIELD_SEP)
+            record = {
+                "sha": sha,
+                "author": _author_login(name, email),
+                "author_email": email,
+                "date": date,
+                "additions": 0,
+                "deletions": 0,
+                "files": 0,
+                "file_changes": [],
+            }
+        elif line and record:
+            added, deleted, path = line.split("\t", 2)
+            # Binary files report "-" for both counts; the API counts them as 0 lines
+            added = int(added) if added != "-" else 0
+            deleted = int(deleted) if deleted != "-" else 0
+            record["additions"] += added
+            record["deletions"] += deleted
+            record["files"] += 1
+            record["file_changes"].append([path, added, deleted])
+    if record:
+        yield record
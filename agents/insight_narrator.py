@@ -1,60 +1,279 @@
 import os
 import json
+import time
+import asyncio
+import threading
+from functools import lru_cache
+from concurrent.futures import wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from store.db import log_event
+from agents.prompt_compactor import compact_json
+from agents.quantile_sketch import QuantileSketch
+from agents.report_template import closing_remarks, render_template_report
+from agents.narration_cache import NarrationCache, NARRATION_CACHE_ENABLED, narration_key
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
 
 # Load environment variables from .env
 load_dotenv()
 
+# Bump whenever the prompt template changes, so cached narrations from the old prompt are not reused
+PROMPT_VERSION = "2"
+
+# Seconds a narration may take before the local template report is posted instead (0 = wait indefinitely)
+NARRATION_LATENCY_BUDGET_SECONDS = float(os.getenv("NARRATION_LATENCY_BUDGET_SECONDS", "30"))
+# Hard per-request client timeout when there is no latency budget, so no request can hang forever
+NARRATION_CLIENT_TIMEOUT_SECONDS = float(os.getenv("NARRATION_CLIENT_TIMEOUT_SECONDS", "120"))
+# A hedged second request fires once the first has been outstanding for this percentile of past latencies...
+NARRATION_HEDGE_PERCENTILE = float(os.getenv("NARRATION_HEDGE_PERCENTILE", "0.9"))
+# ...or for this many seconds until NARRATION_HEDGE_MIN_SAMPLES latencies have been observed
+NARRATION_HEDGE_DELAY_SECONDS = float(os.getenv("NARRATION_HEDGE_DELAY_SECONDS", "8"))
+NARRATION_HEDGE_MIN_SAMPLES = int(os.getenv("NARRATION_HEDGE_MIN_SAMPLES", "5"))
+# Async batch narration (many repos / teams): parallel requests, request rate cap and retries per item
+NARRATION_BATCH_CONCURRENCY = int(os.getenv("NARRATION_BATCH_CONCURRENCY", "4"))
+NARRATION_BATCH_RPS = float(os.getenv("NARRATION_BATCH_RPS", "2"))
+NARRATION_BATCH_RETRIES = int(os.getenv("NARRATION_BATCH_RETRIES", "2"))
+NARRATION_BATCH_BACKOFF_SECONDS = float(os.getenv("NARRATION_BATCH_BACKOFF_SECONDS", "1"))
+
+# Built once and shared by every narrator
+PROMPT_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", """
+    You are an expert Engineering Productivity Analyst. Your task is to analyze development metrics and generate a concise, actionable report for engineering leadership.
+    Focus on DORA metrics, code churn, and identified risks. The report should be clear, professional, and highlight key takeaways.
+
+    Metrics provided in JSON format: {metrics_json}
+    """),
+    ("user", """
+    Generate a weekly engineering productivity report based on the provided metrics. Highlight DORA metrics, significant churn, and any defect risks. Keep it under 200 words.
+
+    Conclude the report with the following closing remarks, which are derived from the metrics; do not add claims the metrics don't support:
+    "{closing_remarks}
+    Best Regards,
+    {report_author_name}
+    {report_author_position}"
+    """)
+])
+# Past winning latencies per (model, mode), shared so hedge delays keep learning across narrators:
+# "stream" is the time to the first token, "invoke" the time to the full completion
+_LATENCIES = {}
+_LATENCIES_LOCK = threading.Lock()
+# Event loop (on a daemon thread) running every hedged attempt, so the losers can be cancelled outright
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+# Which path produced each uncached summary, counted across every narrator in the process
+_STATS = {"primary": 0, "hedge": 0, "fallback": 0}
+_STATS_LOCK = threading.Lock()
+
+
+def _record_outcome(outcome):
+    with _STATS_LOCK:
+        _STATS[outcome] += 1
+
+def _record_latency(model_name, mode, seconds):
+    with _LATENCIES_LOCK:
+        _LATENCIES.setdefault((model_name, mode), QuantileSketch()).add(seconds)
+
+def _latency_quantile(model_name, mode, q, min_samples):
+    """The q-quantile of past latencies, or None with fewer than min_samples of them."""
+    with _LATENCIES_LOCK:
+        sketch = _LATENCIES.get((model_name, mode))
+        if sketch is None or sketch.count < min_samples:
+            return None
+        return sketch.quantile(q)
+
+def _narration_loop():
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="narrate", daemon=True).start()
+        return _LOOP
+
+def get_narration_stats():
+    """Process-wide narration outcomes: primary / hedge / fallback (template) counts and the share of each."""
+    with _STATS_LOCK:
+        stats = dict(_STATS)
+    total = sum(stats.values())
+    stats["total"] = total
+    for outcome in ("primary", "hedge", "fallback"):
+        stats[f"{outcome}_rate"] = round(stats[outcome] / total, 3) if total else 0.0
+    return stats
+
+
+@lru_cache(maxsize=None)
+def _llm_client(model_name, api_key, api_base, latency_budget_seconds):
+    """One ChatOpenAI client (and its HTTP connection pool) per model and settings, reused by every narrator."""
+    # The hedge is the retry, so a budgeted request is not retried by the client and gives up at the budget
+    client_options = {"timeout": latency_budget_seconds, "max_retries": 0} if latency_budget_seconds > 0 else {}
+    client_options.setdefault("timeout", NARRATION_CLIENT_TIMEOUT_SECONDS)
+    return ChatOpenAI(model=model_name, openai_api_key=api_key, openai_api_base=api_base, temperature=0.7, **client_options)
+
+
+class _Race:
+    """First attempt to claim() wins; close() turns every later claim down (budget spent)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.winner = None
+
+    def claim(self, name):
+        with self._lock:
+            if self.winner is None:
+                self.winner = name
+            return self.winner == name
+
+    def close(self):
+        return self.claim("budget")
+
+class _AsyncRateLimiter:
+    """Spaces request starts at least 1 / rps seconds apart (rps <= 0 = unlimited)."""
+
+    def __init__(self, rps):
+        self.interval = 1 / rps if rps > 0 else 0
+        self.next_at = 0.0
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self.next_at)
+        self.next_at = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
 class InsightNarrator:
-    def __init__(self, report_author_name="Ranjith Surineni", report_author_position="Engineering Analyst"):
+    def __init__(self, report_author_name="Ranjith Surineni", report_author_position="Engineering Analyst",
+                 cache=None, use_cache=NARRATION_CACHE_ENABLED, bypass_cache=False,
+                 latency_budget_seconds=NARRATION_LATENCY_BUDGET_SECONDS):
+        # bypass_cache skips the lookup (forces a fresh narration) but still stores the result
         # Load values from .env safely
         model_name = os.getenv("OPENROUTER_MODEL_NAME")
+        fallback_model_name = os.getenv("OPENROUTER_FALLBACK_MODEL_NAME") # optional: hedged requests go here
         api_key = os.getenv("OPENROUTER_API_KEY")
         api_base = os.getenv("OPENROUTER_API_BASE")
 
         if not api_key:
             raise ValueError("❌ OPENROUTER_API_KEY not found in .env file.")
         
-        # Initialize the OpenRouter-compatible LLM
-        self.llm = ChatOpenAI(
-            model=model_name,
-            openai_api_key=api_key,
-            openai_api_base=api_base,
-            temperature=0.7
-        )
-
-        # Define the prompt template for the LLM
-        self.prompt_template = ChatPromptTemplate.from_messages([
-            ("system", """
-            You are an expert Engineering Productivity Analyst. Your task is to analyze development metrics and generate a concise, actionable report for engineering leadership.
-            Focus on DORA metrics, code churn, and identified risks. The report should be clear, professional, and highlight key takeaways.
-
-            Metrics provided in JSON format: {metrics_json}
-            """),
-            ("user", """
-            Generate a weekly engineering productivity report based on the provided metrics. Highlight DORA metrics, significant churn, and any defect risks. Keep it under 200 words.
-
-            Conclude the report with the following specific closing remarks:
-            "In conclusion, while we've made progress in reducing defects, there is room for improvement in deployment frequency and lead time. Additionally, managing code churn, especially by {most_churn_author}, should be a priority to ensure maintainable and readable code.
-            Best Regards,
-            {report_author_name}
-            {report_author_position}"
-            """)
-        ])
+        self.model_name = model_name
+        self.fallback_model_name = fallback_model_name
+        self.cache = (cache or NarrationCache()) if use_cache else None
+        self.bypass_cache = bypass_cache
+
+        self.latency_budget_seconds = latency_budget_seconds
+        # Initialize the OpenRouter-compatible LLM (shared client; constructing a narrator is cheap)
+        self.llm = _llm_client(model_name, api_key, api_base, latency_budget_seconds)
+        self.fallback_llm = _llm_client(fallback_model_name, api_key, api_base, latency_budget_seconds) if fallback_model_name else None
+        self.prompt_template = PROMPT_TEMPLATE
+
         self.report_author_name = report_author_name
         self.report_author_position = report_author_position
 
-    def run(self, state):
+    def run(self, state, on_token=None):
+        """
+        Narrates state["analysis"] into state["summary"].
+
+        With on_token, the completion is streamed and on_token(text_so_far) is called as tokens
+        arrive (a cache hit calls it once with the whole summary).
+        """
         print("InsightNarrator state (input):", state)
+        started_at = time.time()
+        run_id = state.get("run_id")
+
+        analysis, metrics, prompt_inputs, cache_key = self._prepare(state)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            log_event("InsightNarrator", "cache_hit", cache_key, cached, run_id=run_id, started_at=started_at)
+            if on_token:
+                on_token(cached)
+            state["summary"] = cached
+            return state
+
+        outcome, summary, errors = self._narrate(prompt_inputs, on_token)
+        if outcome:
+            _record_outcome(outcome)
+            if cache_key:
+                self.cache.put(cache_key, summary, self.model_name)
+            log_event("InsightNarrator", "LLM_Prompt", metrics, summary, run_id=run_id, started_at=started_at)
+        else:
+            # Budget spent or every request failed: a deterministic report beats a raw JSON dump
+            _record_outcome("fallback")
+            reason = "; ".join(errors) or f"no response within {self.latency_budget_seconds}s"
+            summary = self._template(analysis, prompt_inputs)
+            if on_token:
+                on_token(summary)
+            log_event("InsightNarrator", "LLM_Error", metrics, reason, run_id=run_id, started_at=started_at)
+            print(f"⚠️  AI insights unavailable ({reason}), sent the template report.")
+
+        state["summary"] = summary
+        return state
+
+    async def arun_batch(self, states, concurrency=NARRATION_BATCH_CONCURRENCY, rps=NARRATION_BATCH_RPS,
+                         retries=NARRATION_BATCH_RETRIES):
+        """
+        Narrates many states (e.g. one per repo or team) concurrently; returns them in order with "summary" set.
+
+        At most `concurrency` requests are in flight and request starts are capped at `rps` per
+        second. Each item is retried with backoff on its own; an item that still fails gets the
+        template report and a "narration_error", without affecting the rest of the batch.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        limiter = _AsyncRateLimiter(rps)
+
+        async def narrate(state):
+            async with semaphore:
+                return await self._anarrate(dict(state), limiter, retries)
+
+        return await asyncio.gather(*(narrate(state) for state in states))
+
+    def run_batch(self, states, **kwargs):
+        """Blocking wrapper around arun_batch() for scripts and worker threads."""
+        return asyncio.run(self.arun_batch(states, **kwargs))
+
+    async def _anarrate(self, state, limiter, retries):
+        started_at = time.time()
+        run_id = state.get("run_id")
+        analysis, metrics, prompt_inputs, cache_key = self._prepare(state)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            log_event("InsightNarrator", "cache_hit", cache_key, cached, run_id=run_id, started_at=started_at)
+            state["summary"] = cached
+            return state
 
+        chain = self.prompt_template | self.llm
+        budget = self.latency_budget_seconds if self.latency_budget_seconds > 0 else None
+        errors = []
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(NARRATION_BATCH_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            await limiter.acquire()
+            try:
+                summary = (await asyncio.wait_for(chain.ainvoke(prompt_inputs), budget)).content
+            except Exception as e:
+                errors.append(f"attempt {attempt + 1}: {type(e).__name__}: {e}")
+                continue
+            _record_outcome("primary")
+            if cache_key:
+                self.cache.put(cache_key, summary, self.model_name)
+            log_event("InsightNarrator", "LLM_Prompt", metrics, summary, run_id=run_id, started_at=started_at)
+            state["summary"] = summary
+            return state
+
+        _record_outcome("fallback")
+        state["narration_error"] = "; ".join(errors)
+        state["summary"] = self._template(analysis, prompt_inputs)
+        log_event("InsightNarrator", "LLM_Error", metrics, state["narration_error"], run_id=run_id, started_at=started_at)
+        return state
+
+    def _prepare(self, state):
+        """(analysis, metrics narrated, prompt inputs, cache key or None) for one state."""
         analysis = state.get("analysis", {})
-        metrics_json_string = json.dumps(analysis, indent=2)
+        # Prefer the bounded payload from PromptCompactor; the raw analysis grows with commit volume
+        metrics = state.get("narration_metrics")
+        metrics_json_string = compact_json(metrics) if metrics is not None else json.dumps(analysis, indent=2)
+        metrics = analysis if metrics is None else metrics # logged once per run, as the object that was narrated
         
         # Determine the author with the most churn for dynamic insertion
-        # Assuming 'per_author_diffs' is available in analysis
         most_churn_author = "our team" # Default value
         per_author_diffs = analysis.get("per_author_diffs", {})
         if per_author_diffs:
@@ -66,22 +285,109 @@ class InsightNarrator:
             if author_churn_scores:
                 most_churn_author = max(author_churn_scores, key=author_churn_scores.get)
 
+        prompt_inputs = {
+            "metrics_json": metrics_json_string,
+            "report_author_name": self.report_author_name,
+            "report_author_position": self.report_author_position,
+            "most_churn_author": most_churn_author, # Pass the dynamic author
+            "closing_remarks": closing_remarks(analysis, most_churn_author),
+        }
+        cache_key = None
+        if self.cache is not None:
+            cache_key = narration_key(metrics, self.model_name, PROMPT_VERSION,
+                                      self.report_author_name, self.report_author_position)
+        return analysis, metrics, prompt_inputs, cache_key
+
+    def _cached(self, cache_key):
+        if cache_key is None or self.bypass_cache:
+            return None
+        return self.cache.get(cache_key)
+
+    def _template(self, analysis, prompt_inputs):
+        return render_template_report(analysis, prompt_inputs["most_churn_author"], self.report_author_name, self.report_author_position)
+
+    def hedge_delay(self, streaming=False):
+        """
+        Seconds to wait on the primary request before hedging: a percentile of the primary model's
+        past latencies in this mode (time to first token when streaming) once enough are known.
+        """
+        mode = "stream" if streaming else "invoke"
+        delay = _latency_quantile(self.model_name, mode, NARRATION_HEDGE_PERCENTILE, NARRATION_HEDGE_MIN_SAMPLES)
+        return NARRATION_HEDGE_DELAY_SECONDS if delay is None else delay
+
+    async def _attempt(self, name, model_name, llm, prompt_inputs, on_token, race):
+        """One model request; returns its text, or None if another attempt already won."""
+        started_at = time.monotonic()
+        chain = self.prompt_template | llm
+        if not on_token:
+            text = (await chain.ainvoke(prompt_inputs)).content
+            if race.claim(name):
+                _record_latency(model_name, "invoke", time.monotonic() - started_at)
+                return text
+            return None
+        # Streaming: the first attempt to produce a token owns on_token, the others stop reading
+        text = ""
+        async for chunk in chain.astream(prompt_inputs):
+            if not chunk.content:
+                continue
+            if not race.claim(name):
+                return None
+            if not text:
+                _record_latency(model_name, "stream", time.monotonic() - started_at)
+            text += chunk.content
+            await asyncio.to_thread(on_token, text) # e.g. a Slack edit; keeps the loop free for the other attempt
+        return text
+
+    def _submit(self, name, prompt_inputs, on_token, race):
+        if name == "hedge" and self.fallback_llm is not None:
+            model_name, llm = self.fallback_model_name, self.fallback_llm
+        else:
+            model_name, llm = self.model_name, self.llm
+        return asyncio.run_coroutine_threadsafe(self._attempt(name, model_name, llm, prompt_inputs, on_token, race),
+                                                _narration_loop())
+
+    def _narrate(self, prompt_inputs, on_token=None):
+        """
+        Runs the primary request and, if it is still outstanding after hedge_delay() (or has failed),
+        one hedged request to the fallback model (or the same one). Returns (outcome, text, errors),
+        with outcome None if neither produced a summary within the latency budget. Attempts still
+        running when the race is decided are cancelled.
+        """
+        started_at = time.monotonic()
+        budget = self.latency_budget_seconds
+        deadline = started_at + budget if budget > 0 else float("inf")
+        hedge_at = started_at + self.hedge_delay(streaming=bool(on_token))
+        race = _Race()
+        errors = []
+        pending = {self._submit("primary", prompt_inputs, on_token, race): "primary"}
         try:
-            chain = self.prompt_template | self.llm
-            llm_response = chain.invoke({
-                "metrics_json": metrics_json_string,
-                "report_author_name": self.report_author_name,
-                "report_author_position": self.report_author_position,
-                "most_churn_author": most_churn_author # Pass the dynamic author
-            })
-            summary = llm_response.content
-
-            log_event("InsightNarrator", "LLM_Prompt", metrics_json_string, summary)
-        except Exception as e:
-            summary = f"⚠️  Error generating AI insights with OpenRouter: {e}. Raw analysis: {metrics_json_string}"
-            log_event("InsightNarrator", "LLM_Error", metrics_json_string, str(e))
-            print(summary)
-
-        log_event("InsightNarrator", "generate_report", analysis, summary)
-        state["summary"] = summary
-        return state
+            return self._race(pending, race, errors, deadline, hedge_at, prompt_inputs, on_token)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _race(self, pending, race, errors, deadline, hedge_at, prompt_inputs, on_token):
+        hedged = False
+        while True:
+            if pending:
+                until = deadline if hedged else min(deadline, hedge_at)
+                timeout = None if until == float("inf") else max(0, until - time.monotonic())
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        errors.append(f"{name}: {e}")
+                        if race.winner == name: # a stream that already owned on_token broke off mid-way
+                            return None, None, errors
+                        continue
+                    if text is not None and race.winner == name:
+                        return name, text, errors
+            if time.monotonic() >= deadline or (hedged and not pending):
+                break
+            if not hedged and (time.monotonic() >= hedge_at or not pending):
+                hedged = True
+                pending[self._submit("hedge", prompt_inputs, on_token, race)] = "hedge"
+        race.close() # late tokens from abandoned attempts no longer reach on_token
+        return None, None, errors
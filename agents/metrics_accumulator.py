@@ -0,0 +1,272 @@
+import os
+from datetime import datetime, timedelta
+from agents.quantile_sketch import QuantileSketch, new_sketches
+from agents.timeseries import churn_signals
+
+# Per-PR entries, spike commits and churn anomalies older than this (relative to the newest folded activity) are pruned
+ACCUMULATOR_RETENTION_DAYS = int(os.getenv("ACCUMULATOR_RETENTION_DAYS", "90"))
+
+# The PR totals and sketches a PR's contribution feeds
+PR_TOTALS = ("pr_throughput_count", "cycle_time_seconds_sum", "cycle_time_count", "review_latency_seconds_sum", "review_latency_count")
+PR_SKETCHES = ("cycle_time_hours", "review_latency_hours")
+
+
+def _seconds_between(start, end):
+    # Same parsing rules as DiffAnalyst's reference loop; None if either side is missing or malformed
+    try:
+        return (datetime.fromisoformat(end.replace("Z", "+00:00")) - datetime.fromisoformat(start.replace("Z", "+00:00"))).total_seconds()
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+def pull_request_contribution(pr):
+    """(merged, cycle seconds or None, review latency seconds or None) for one PR record."""
+    merged = bool(pr.get("merged_at"))
+    cycle = _seconds_between(pr.get("created_at"), pr.get("merged_at")) if merged else None
+    review = None
+    if pr.get("created_at") and pr.get("first_review_at"):
+        review = _seconds_between(pr["created_at"], pr["first_review_at"])
+        if review is not None and review < 0: # review before creation is ignored, as in DiffAnalyst
+            review = None
+    return [merged, cycle, review]
+
+def _days_before(timestamp, days):
+    # ISO timestamp `days` earlier, in the store's "...Z" form so it compares as a string; None if unparsable
+    try:
+        moment = datetime.fromisoformat(timestamp.replace("Z", "+00:00")) - timedelta(days=days)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class MetricsAccumulator:
+    """
+    Mergeable running state behind DiffAnalyst's metrics.
+
+    Holds counts, sums, per-author partials and quantile sketches, so new commits / PRs can be
+    folded in at O(delta) cost and shards (repos, days, workers) combined with merge(). Commits
+    are assumed to be partitioned between shards; rows read from the store carry its insertion
+    order ("seq"), and those at or below the repo's seq watermark are skipped, so commits harvested
+    late with older dates still count exactly once. PRs change over time, so each one's
+    contribution is kept under "repo#number" and replaced when the PR is folded again (merges keep
+    the most recently updated copy) until prune() freezes it into frozen_prs, which merges add as
+    they are. Spikes and churn anomalies come
+    from ChurnTimeSeries passes and are kept with add_churn_signals().
+    """
+
+    VERSION = 4 # states saved with another layout are discarded and rebuilt from the store
+
+    def __init__(self):
+        self.version = self.VERSION
+        self.total_commits = 0
+        self.additions = 0
+        self.deletions = 0
+        self.spikes = [] # flagged commits, by (date, sha)
+        self.churn_anomalies = [] # flagged day/week buckets, each tagged with its repo
+        self.per_author = {} # author -> {"additions", "deletions", "files_changed", "commits", "first_seen"}
+        self.commit_watermark = {} # repo -> highest store seq of a folded commit
+        self.newest_commit_date = {} # repo -> newest folded commit date
+        self.prs = {} # "repo#number" -> {"updated_at", "contribution"}; settled PRs are pruned
+        self.pr_watermark = {} # repo -> newest folded updated_at
+        self.pr_seq_watermark = {} # repo -> highest store seq of a folded PR
+        self.pr_throughput_count = 0
+        self.cycle_time_seconds_sum = 0.0
+        self.cycle_time_count = 0
+        self.review_latency_seconds_sum = 0.0
+        self.review_latency_count = 0
+        self.sketches = new_sketches() # commit_churn / cycle_time_hours / review_latency_hours
+        # The part of the PR totals and sketches that pruned PRs contribute (already included above)
+        self.frozen_prs = {name: 0 for name in PR_TOTALS}
+        self.frozen_sketches = {metric: QuantileSketch() for metric in PR_SKETCHES}
+
+    # --- Folding deltas ---
+
+    def add_commits(self, commits, repo=""):
+        """Folds commit_diff_data records; stored commits at or below the repo's seq watermark are skipped."""
+        mark = self.commit_watermark.get(repo, 0)
+        newest = mark
+        for commit in commits:
+            seq = commit.get("seq")
+            if seq is not None:
+                if seq <= mark:
+                    continue
+                newest = max(newest, seq)
+            position = (commit.get("date") or "", commit["sha"])
+            if position[0] > self.newest_commit_date.get(repo, ""):
+                self.newest_commit_date[repo] = position[0]
+            self.total_commits += 1
+            self.additions += commit["additions"]
+            self.deletions += commit["deletions"]
+            self.sketches["commit_churn"].add(commit["additions"] + commit["deletions"])
+            author = self.per_author.setdefault(commit.get("author", "unknown"), {
+                "additions": 0, "deletions": 0, "files_changed": 0, "commits": 0, "first_seen": list(position),
+            })
+            author["additions"] += commit.get("additions", 0)
+            author["deletions"] += commit.get("deletions", 0)
+            author["files_changed"] += commit.get("files", 0)
+            author["commits"] += 1
+            author["first_seen"] = min(author["first_seen"], list(position))
+        if newest > mark:
+            self.commit_watermark[repo] = newest
+        return self
+
+    def add_churn_signals(self, signals, repo="", since=None):
+        """
+        Keeps the spikes and churn anomalies of a ChurnTimeSeries pass over repo.
+
+        The repo's anomalies in buckets from since on (default: all of them) are replaced, so a
+        bucket flagged while it was still filling up doesn't outlive a rescore.
+        """
+        spikes = {(c.get("date") or "", c["sha"]): c for c in self.spikes}
+        spikes.update(((c.get("date") or "", c["sha"]), c) for c in signals.get("spikes") or [])
+        self.spikes = [spikes[key] for key in sorted(spikes)]
+        self.churn_anomalies = [a for a in self.churn_anomalies
+                                if a.get("repo") != repo or (since is not None and a["bucket"] < since)]
+        self.churn_anomalies += [dict(a, repo=repo) for a in signals.get("churn_anomalies") or []]
+        self.churn_anomalies.sort(key=lambda a: (a["bucket"], a["repo"], a["scope"], a["period"]))
+        return self
+
+    def add_pull_requests(self, prs, repo=""):
+        """Folds pull_request_details records, replacing any earlier copy of the same PR."""
+        mark = self.pr_seq_watermark.get(repo, 0)
+        for pr in prs:
+            key, seq = f"{repo}#{pr['number']}", pr.get("seq")
+            if key not in self.prs and seq is not None and seq <= mark:
+                continue # folded before and pruned since: its contribution is frozen in the totals
+            if seq is not None and seq > self.pr_seq_watermark.get(repo, 0):
+                self.pr_seq_watermark[repo] = seq
+            if (pr.get("updated_at") or "") > self.pr_watermark.get(repo, ""):
+                self.pr_watermark[repo] = pr["updated_at"]
+            self._put_pr(key, {"updated_at": pr.get("updated_at") or "", "contribution": pull_request_contribution(pr)})
+        return self
+
+    def prune(self, retention_days=ACCUMULATOR_RETENTION_DAYS):
+        """
+        Bounds the state by history age rather than size: drops PR entries not updated within
+        retention_days of their repo's newest update, and spikes and churn anomalies older than
+        retention_days before the newest folded commit. Pruned PRs stay counted in the totals,
+        frozen (and carried through merge()); a later update to one of them is ignored.
+        """
+        cutoffs = {repo: _days_before(mark, retention_days) for repo, mark in self.pr_watermark.items()}
+        for key, entry in list(self.prs.items()):
+            cutoff = cutoffs.get(key.rsplit("#", 1)[0])
+            if cutoff and entry["updated_at"] < cutoff:
+                self._freeze_pr(self.prs.pop(key)["contribution"])
+        newest = max(self.newest_commit_date.values(), default=None)
+        cutoff = _days_before(newest, retention_days) if newest else None
+        if cutoff:
+            self.spikes = [c for c in self.spikes if (c.get("date") or "") >= cutoff]
+            self.churn_anomalies = [a for a in self.churn_anomalies if a["bucket"] >= cutoff[:10]]
+        return self
+
+    def _put_pr(self, key, entry):
+        old = self.prs.get(key)
+        if old:
+            self._apply_pr(old["contribution"], -1)
+        self.prs[key] = entry
+        self._apply_pr(entry["contribution"], +1)
+
+    def _apply_pr(self, contribution, sign):
+        merged, cycle, review = contribution
+        if merged:
+            self.pr_throughput_count += sign
+        if cycle is not None:
+            self.cycle_time_seconds_sum += sign * cycle
+            self.cycle_time_count += sign
+            self.sketches["cycle_time_hours"].add(cycle / 3600, sign)
+        if review is not None:
+            self.review_latency_seconds_sum += sign * review
+            self.review_latency_count += sign
+            self.sketches["review_latency_hours"].add(review / 3600, sign)
+
+    def _freeze_pr(self, contribution):
+        merged, cycle, review = contribution
+        frozen = self.frozen_prs
+        frozen["pr_throughput_count"] += 1 if merged else 0
+        if cycle is not None:
+            frozen["cycle_time_seconds_sum"] += cycle
+            frozen["cycle_time_count"] += 1
+            self.frozen_sketches["cycle_time_hours"].add(cycle / 3600)
+        if review is not None:
+            frozen["review_latency_seconds_sum"] += review
+            frozen["review_latency_count"] += 1
+            self.frozen_sketches["review_latency_hours"].add(review / 3600)
+
+    # --- Combining shards ---
+
+    def merge(self, other):
+        """Returns a new accumulator covering both self and other (associative and commutative)."""
+        merged = MetricsAccumulator.from_dict(self.to_dict())
+        merged.total_commits += other.total_commits
+        merged.additions += other.additions
+        merged.deletions += other.deletions
+        merged.sketches["commit_churn"] = merged.sketches["commit_churn"].merge(other.sketches["commit_churn"])
+        spikes = {(c.get("date") or "", c["sha"]): c for c in merged.spikes + other.spikes}
+        merged.spikes = [spikes[key] for key in sorted(spikes)]
+        anomalies = {(a["bucket"], a["repo"], a["scope"], a["period"]): a for a in merged.churn_anomalies + other.churn_anomalies}
+        merged.churn_anomalies = [anomalies[key] for key in sorted(anomalies)]
+        for name, partial in other.per_author.items():
+            mine = merged.per_author.setdefault(name, dict(partial, additions=0, deletions=0, files_changed=0, commits=0))
+            for column in ("additions", "deletions", "files_changed", "commits"):
+                mine[column] += partial[column]
+            mine["first_seen"] = min(mine["first_seen"], partial["first_seen"])
+        # other's pruned PRs only survive in its totals: carry that part over, then replay its live entries
+        for name in PR_TOTALS:
+            setattr(merged, name, getattr(merged, name) + other.frozen_prs[name])
+            merged.frozen_prs[name] += other.frozen_prs[name]
+        for metric in PR_SKETCHES:
+            merged.sketches[metric] = merged.sketches[metric].merge(other.frozen_sketches[metric])
+            merged.frozen_sketches[metric] = merged.frozen_sketches[metric].merge(other.frozen_sketches[metric])
+        for name in ("commit_watermark", "newest_commit_date", "pr_watermark", "pr_seq_watermark"):
+            mine = getattr(merged, name)
+            for repo, mark in getattr(other, name).items():
+                mine[repo] = max(mine.get(repo, mark), mark)
+        for key, entry in other.prs.items():
+            mine = merged.prs.get(key)
+            # Newest update wins; equal timestamps fall back to a stable order so merge stays commutative
+            if mine is None or (entry["updated_at"], repr(entry["contribution"])) > (mine["updated_at"], repr(mine["contribution"])):
+                merged._put_pr(key, entry)
+        return merged
+
+    # --- Output / persistence ---
+
+    def churn_signals(self):
+        """The retained spikes and churn anomalies as report fields (the first argument DiffAnalyst._summarize takes)."""
+        return churn_signals(list(self.spikes), list(self.churn_anomalies))
+
+    def aggregates(self):
+        """The positional arguments DiffAnalyst._summarize takes after the churn signals."""
+        per_author_diffs = {
+            name: {k: partial[k] for k in ("additions", "deletions", "files_changed", "commits")}
+            for name, partial in sorted(self.per_author.items(), key=lambda item: item[1]["first_seen"])
+        }
+        avg_cycle = self.cycle_time_seconds_sum / self.cycle_time_count / 3600 if self.cycle_time_count else 0
+        avg_review = self.review_latency_seconds_sum / self.review_latency_count / 3600 if self.review_latency_count else 0
+        return (self.additions, self.deletions, per_author_diffs, self.total_commits,
+                self.pr_throughput_count, avg_review, avg_cycle, self.sketches)
+
+    def to_dict(self):
+        state = dict(vars(self))
+        state["sketches"] = {metric: sketch.to_dict() for metric, sketch in self.sketches.items()}
+        state["frozen_sketches"] = {metric: sketch.to_dict() for metric, sketch in self.frozen_sketches.items()}
+        return state
+
+    @classmethod
+    def from_dict(cls, data):
+        accumulator = cls()
+        if data and data.get("version") != cls.VERSION:
+            return accumulator # e.g. (date, sha) watermarks from before seq: start over rather than misread them
+        for name, value in (data or {}).items():
+            if name in ("sketches", "frozen_sketches"):
+                getattr(accumulator, name).update({metric: QuantileSketch.from_dict(sketch) for metric, sketch in value.items()})
+            elif hasattr(accumulator, name): # fields from older states (e.g. histograms) are dropped
+                setattr(accumulator, name, _copy(value))
+        return accumulator
+
+
+def _copy(value):
+    # Deep enough copy of the JSON-shaped state so merge() never mutates its inputs
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
@@ -0,0 +1,103 @@
+import warnings
+from operator import itemgetter
+from datetime import datetime, timezone
+import numpy as np
+from agents.quantile_sketch import new_sketches
+
+NAT = np.iinfo(np.int64).min # int64 view of NaT; marks missing / unparseable timestamps
+
+
+def parse_timestamps(values):
+    """
+    Parses ISO-8601 strings into an int64 array of UTC epoch microseconds (NAT where missing or malformed).
+
+    GitHub's "...Z" form is parsed in one vectorized call; anything numpy can't take (offsets, junk)
+    falls back to datetime.fromisoformat one value at a time.
+    """
+    stripped = [v[:-1] if isinstance(v, str) and v.endswith("Z") else (v or None) for v in values]
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error") # numpy only warns on "+02:00"-style offsets; take the slow path instead
+            return np.array(stripped, dtype="datetime64[us]").view(np.int64)
+    except (ValueError, TypeError, UserWarning):
+        return np.array([_parse_one(v) for v in values], dtype=np.int64)
+
+def _parse_one(value):
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, TypeError, AttributeError):
+        return NAT
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp()) * 1_000_000 + parsed.microsecond
+
+
+def _int_column(records, key):
+    return np.fromiter(map(itemgetter(key), records), dtype=np.int64, count=len(records))
+
+def commit_columns(commits):
+    """Loads commit_diff_data records into columnar arrays, interning authors to integer codes."""
+    # Pulling columns out of dicts is the expensive part; C-level map/itemgetter keeps it to one cheap pass each
+    authors = [c.get("author", "unknown") for c in commits]
+    author_codes = {author: code for code, author in enumerate(dict.fromkeys(authors))} # first-seen order
+    return {
+        "additions": _int_column(commits, "additions"),
+        "deletions": _int_column(commits, "deletions"),
+        "files": np.array([c.get("files", 0) for c in commits], dtype=np.int64),
+        "author": np.fromiter(map(author_codes.__getitem__, authors), dtype=np.int64, count=len(authors)),
+        "authors": list(author_codes), # code -> author
+    }
+
+def pull_request_columns(prs):
+    """Loads pull_request_details records into columnar arrays with timestamps parsed once."""
+    merged_at_values = [pr.get("merged_at") for pr in prs]
+    return {
+        "merged": np.array([bool(merged_at) for merged_at in merged_at_values], dtype=bool),
+        "created_at": parse_timestamps([pr.get("created_at") for pr in prs]),
+        "merged_at": parse_timestamps(merged_at_values),
+        "first_review_at": parse_timestamps([pr.get("first_review_at") for pr in prs]),
+    }
+
+
+def compute_aggregates(commits, prs, cols=None):
+    """
+    Vectorized equivalent of DiffAnalyst's reference loop over materialized commit / PR lists.
+
+    Returns the positional arguments DiffAnalyst._summarize takes after the churn signals, with
+    plain Python numbers so the result dict is identical (and JSON-serializable) either way.
+    """
+    cols = commit_columns(commits)
+    churn = cols["additions"] + cols["deletions"]
+
+    n_authors = len(cols["authors"])
+    sums = {
+        "additions": np.bincount(cols["author"], weights=cols["additions"], minlength=n_authors),
+        "deletions": np.bincount(cols["author"], weights=cols["deletions"], minlength=n_authors),
+        "files_changed": np.bincount(cols["author"], weights=cols["files"], minlength=n_authors),
+        "commits": np.bincount(cols["author"], minlength=n_authors),
+    }
+    per_author_diffs = {
+        author: {name: int(column[code]) for name, column in sums.items()}
+        for code, author in enumerate(cols["authors"])
+    }
+
+    pr_cols = pull_request_columns(prs)
+    created = pr_cols["created_at"]
+    has_created = created != NAT
+
+    cycle_ok = pr_cols["merged"] & has_created & (pr_cols["merged_at"] != NAT)
+    cycle_us = pr_cols["merged_at"][cycle_ok] - created[cycle_ok]
+    review_us = pr_cols["first_review_at"] - created
+    review_ok = has_created & (pr_cols["first_review_at"] != NAT) & (review_us >= 0)
+    review_us = review_us[review_ok]
+
+    sketches = new_sketches()
+    sketches["commit_churn"].add_many(churn)
+    sketches["cycle_time_hours"].add_many(cycle_us / 1e6 / 3600)
+    sketches["review_latency_hours"].add_many(review_us / 1e6 / 3600)
+
+    avg_cycle_time_hours = int(cycle_us.sum()) / 1e6 / len(cycle_us) / 3600 if len(cycle_us) else 0
+    avg_review_latency_hours = int(review_us.sum()) / 1e6 / len(review_us) / 3600 if len(review_us) else 0
+
+    return (int(cols["additions"].sum()), int(cols["deletions"].sum()), per_author_diffs, len(commits),
+            int(pr_cols["merged"].sum()), avg_review_latency_hours, avg_cycle_time_hours, sketches)
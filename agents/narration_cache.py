@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+from store.db import get_db_connection
+
+load_dotenv()
+
+NARRATION_CACHE_ENABLED = os.getenv("NARRATION_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+NARRATION_CACHE_TTL_SECONDS = int(os.getenv("NARRATION_CACHE_TTL_SECONDS", str(24 * 3600)))
+NARRATION_CACHE_MAX_BYTES = int(os.getenv("NARRATION_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+def narration_key(metrics, model, prompt_version, author_name, author_position):
+    """Hash of everything that shapes a narration; canonical JSON so key order and whitespace don't matter."""
+    canonical = json.dumps(
+        {"metrics": metrics, "model": model, "prompt_version": prompt_version,
+         "author_name": author_name, "author_position": author_position},
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class NarrationCache:
+    """Persistent LLM narration cache in the store's narration_cache table, with a TTL and a byte budget (LRU)."""
+
+    def __init__(self, ttl_seconds=NARRATION_CACHE_TTL_SECONDS, max_bytes=NARRATION_CACHE_MAX_BYTES, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def get(self, key):
+        """Returns the cached summary for key, or None if absent or older than the TTL."""
+        db = get_db_connection()
+        now = self.clock()
+        row = db.execute("SELECT summary, created_at FROM narration_cache WHERE key = ?", [key]).fetchone()
+        with self._lock:
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self.stats["expired"] += 1
+                with db.conn:
+                    db.execute("DELETE FROM narration_cache WHERE key = ?", [key])
+                return None
+            self.stats["hits"] += 1
+        with db.conn:
+            db.execute("UPDATE narration_cache SET last_access = ? WHERE key = ?", [now, key])
+        return row[0]
+
+    def put(self, key, summary, model=None):
+        size = len(summary.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        db = get_db_connection()
+        now = self.clock()
+        with db.conn:
+            db["narration_cache"].insert({
+                "key": key, "summary": summary, "model": model, "size": size, "created_at": now, "last_access": now,
+            }, pk="key", replace=True)
+            self._evict(db, now)
+
+    def _evict(self, db, now):
+        # Expired entries go first, then least recently used ones until the table fits the byte budget
+        db.execute("DELETE FROM narration_cache WHERE created_at < ?", [now - self.ttl_seconds])
+        (total,) = db.execute("SELECT COALESCE(SUM(size), 0) FROM narration_cache").fetchone()
+        for key, size in db.execute("SELECT key, size FROM narration_cache ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM narration_cache WHERE key = ?", [key])
+            total -= size
+            with self._lock:
+                self.stats["evictions"] += 1
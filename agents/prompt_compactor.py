@@ -0,0 +1,129 @@
+import os
+import json
+import time
+from dotenv import load_dotenv
+from store.db import log_event
+
+try:
+    import tiktoken # optional: exact token counts; without it tokens are estimated as chars / 4
+except ImportError:
+    tiktoken = None
+
+load_dotenv()
+
+# Authors / spikes / anomalies listed individually in the prompt; the rest are summarized
+PROMPT_TOP_AUTHORS = int(os.getenv("PROMPT_TOP_AUTHORS", "5"))
+PROMPT_TOP_SPIKES = int(os.getenv("PROMPT_TOP_SPIKES", "5"))
+# Decimal places kept for floats in the prompt
+PROMPT_FLOAT_DIGITS = int(os.getenv("PROMPT_FLOAT_DIGITS", "1"))
+# Upper bound on the metrics JSON sent to the LLM, in tokens
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "800"))
+PROMPT_TOKENIZER_ENCODING = os.getenv("PROMPT_TOKENIZER_ENCODING", "cl100k_base")
+
+_encoding = None
+
+
+def estimate_tokens(text):
+    """Token count with tiktoken when its encoding is available, else the usual chars / 4 estimate."""
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(PROMPT_TOKENIZER_ENCODING)
+        except Exception as e: # the encoding file is downloaded on first use and may be unreachable
+            print(f"⚠️  tiktoken encoding unavailable, estimating tokens from length: {e}")
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def compact_json(data):
+    return json.dumps(data, separators=(",", ":"), sort_keys=True, default=str)
+
+def _round(value, digits):
+    if isinstance(value, float):
+        return round(value, digits)
+    if isinstance(value, dict):
+        return {k: _round(v, digits) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round(v, digits) for v in value]
+    return value
+
+def _churn(entry):
+    return (entry.get("additions") or 0) + (entry.get("deletions") or 0)
+
+
+class PromptCompactor:
+    """
+    Shrinks DiffAnalyst's analysis into a bounded prompt payload for InsightNarrator.
+
+    Keeps the scalar metrics, the top-K authors / spikes / churn anomalies (the rest become
+    counts and totals), rounds floats, and halves K until the compact JSON fits the token budget,
+    so the prompt size no longer grows with commit volume. state["analysis"] is left untouched
+    for charts and storage; the result goes to state["narration_metrics"].
+    """
+
+    def __init__(self, top_authors=PROMPT_TOP_AUTHORS, top_spikes=PROMPT_TOP_SPIKES, float_digits=PROMPT_FLOAT_DIGITS,
+                 max_tokens=PROMPT_MAX_TOKENS, count_tokens=estimate_tokens):
+        self.top_authors = top_authors
+        self.top_spikes = top_spikes
+        self.float_digits = float_digits
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+
+    def run(self, state):
+        started_at = time.time()
+        compact, tokens = self.compact(state.get("analysis", {}))
+        log_event("PromptCompactor", "compact_prompt", {"max_tokens": self.max_tokens}, {"tokens": tokens},
+                  run_id=state.get("run_id"), started_at=started_at)
+        state["narration_metrics"] = compact
+        return state
+
+    def compact(self, analysis):
+        """Returns (compact metrics dict, token count of its JSON)."""
+        top_authors, top_spikes = self.top_authors, self.top_spikes
+        while True:
+            compact = self._compact(analysis, top_authors, top_spikes)
+            tokens = self.count_tokens(compact_json(compact))
+            if tokens <= self.max_tokens or (top_authors == 0 and top_spikes == 0):
+                break
+            top_authors, top_spikes = top_authors // 2, top_spikes // 2
+        if tokens > self.max_tokens:
+            # Even the scalars alone are over budget: keep only numbers and risk flags
+            compact = {k: v for k, v in compact.items() if isinstance(v, (int, float, str))}
+            tokens = self.count_tokens(compact_json(compact))
+        return compact, tokens
+
+    def _compact(self, analysis, top_authors, top_spikes):
+        compact = {}
+        for key, value in analysis.items():
+            if key in ("per_author_diffs", "spikes", "churn_anomalies", "risk_flags"):
+                continue
+            if isinstance(value, (int, float, str, bool)) or value is None:
+                compact[key] = value
+
+        authors = sorted((analysis.get("per_author_diffs") or {}).items(), key=lambda item: (-_churn(item[1]), item[0]))
+        compact["top_authors"] = {
+            name: {k: data.get(k, 0) for k in ("additions", "deletions", "commits")} for name, data in authors[:top_authors]
+        }
+        rest = [data for _, data in authors[top_authors:]]
+        if rest:
+            compact["other_authors"] = {"count": len(rest), **{k: sum(d.get(k, 0) for d in rest) for k in ("additions", "deletions", "commits")}}
+
+        spikes = sorted(analysis.get("spikes") or [], key=lambda c: (-_churn(c), c.get("sha", "")))
+        compact["top_spikes"] = [
+            {"sha": (c.get("sha") or "")[:7], "author": c.get("author"), "date": (c.get("date") or "")[:10],
+             "churn": _churn(c), "z": c.get("churn_z")}
+            for c in spikes[:top_spikes]
+        ]
+        compact["spike_count"] = len(spikes)
+
+        anomalies = sorted(analysis.get("churn_anomalies") or [], key=lambda a: -(a.get("z_score") or 0))
+        compact["top_churn_anomalies"] = anomalies[:top_spikes]
+        compact["churn_anomaly_count"] = len(anomalies)
+
+        risk_flags = analysis.get("risk_flags") or {}
+        if risk_flags:
+            flagged = sorted((risk_flags.get("authors") or {}).items(), key=lambda item: (item[1] != "High", item[0]))
+            compact["risk_flags"] = {"repo": risk_flags.get("repo"), "authors": dict(flagged[:top_authors]),
+                                     "flagged_author_count": len(flagged)}
+        return _round(compact, self.float_digits)
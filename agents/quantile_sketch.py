@@ -0,0 +1,114 @@
+import math
+import numpy as np
+
+# Sub-buckets per power of two; relative error of a reported quantile is at most 1 / (2 * SKETCH_SUB_BUCKETS)
+SKETCH_SUB_BUCKETS = 64
+SKETCH_MAX_BINS = 2048
+PERCENTILES = (50, 90, 99)
+# Distributions DiffAnalyst reports as <metric>_p50 / _p90 / _p99
+SKETCH_METRICS = ("cycle_time_hours", "review_latency_hours", "commit_churn")
+
+
+class QuantileSketch:
+    """
+    Fixed-memory, mergeable quantile sketch over non-negative values (DDSketch-style log buckets).
+
+    Each value is counted in a log-linear bucket found with frexp, which is exact arithmetic, so the
+    scalar and NumPy paths bucket identically. Bucket counts add on merge (associative and
+    commutative) and can be subtracted to back a value out again. Memory is capped at max_bins by
+    folding the smallest buckets together; that only happens for extremely wide value ranges.
+    """
+
+    def __init__(self, sub_buckets=SKETCH_SUB_BUCKETS, max_bins=SKETCH_MAX_BINS):
+        self.sub_buckets = sub_buckets
+        self.max_bins = max_bins
+        self.zero_count = 0 # values <= 0
+        self.bins = {} # bucket key -> count
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.bins.values())
+
+    def _key(self, value):
+        mantissa, exponent = math.frexp(value)
+        return exponent * self.sub_buckets + math.floor((mantissa - 0.5) * 2 * self.sub_buckets)
+
+    def _value(self, key):
+        # Midpoint of the bucket's [lower, upper) range
+        exponent, sub = divmod(key, self.sub_buckets)
+        return math.ldexp(0.5 + (sub + 0.5) / (2 * self.sub_buckets), exponent)
+
+    def add(self, value, count=1):
+        """Counts value (a negative count removes it again)."""
+        if value <= 0:
+            self.zero_count += count
+        else:
+            self._bump(self._key(value), count)
+        return self
+
+    def add_many(self, values):
+        """Vectorized add() for a NumPy array or sequence of values."""
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        self.zero_count += int(len(values) - len(positive))
+        mantissas, exponents = np.frexp(positive)
+        keys = exponents.astype(np.int64) * self.sub_buckets + np.floor((mantissas - 0.5) * 2 * self.sub_buckets).astype(np.int64)
+        for key, count in zip(*np.unique(keys, return_counts=True)):
+            self._bump(int(key), int(count))
+        return self
+
+    def _bump(self, key, count):
+        total = self.bins.get(key, 0) + count
+        if total:
+            self.bins[key] = total
+        else:
+            self.bins.pop(key, None)
+        if len(self.bins) > self.max_bins:
+            lowest, second = sorted(self.bins)[:2]
+            self.bins[second] += self.bins.pop(lowest)
+
+    def merge(self, other):
+        """Returns a new sketch counting both inputs."""
+        merged = QuantileSketch.from_dict(self.to_dict())
+        merged.zero_count += other.zero_count
+        for key, count in other.bins.items():
+            merged._bump(key, count)
+        return merged
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 <= q <= 1); 0 for an empty sketch."""
+        total = self.count
+        if total <= 0:
+            return 0
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.bins))
+
+    def percentiles(self, prefix, ndigits=2):
+        """{"<prefix>_p50": ..., "<prefix>_p90": ..., "<prefix>_p99": ...} rounded for reports."""
+        return {f"{prefix}_p{p}": round(self.quantile(p / 100), ndigits) for p in PERCENTILES}
+
+    def to_dict(self):
+        return {
+            "sub_buckets": self.sub_buckets,
+            "max_bins": self.max_bins,
+            "zero_count": self.zero_count,
+            "bins": sorted(self.bins.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data.get("sub_buckets", SKETCH_SUB_BUCKETS), data.get("max_bins", SKETCH_MAX_BINS))
+        sketch.zero_count = data.get("zero_count", 0)
+        sketch.bins = {int(key): count for key, count in data.get("bins", [])}
+        return sketch
+
+
+def new_sketches():
+    return {metric: QuantileSketch() for metric in SKETCH_METRICS}
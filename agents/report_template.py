@@ -0,0 +1,70 @@
+def _top_spike(spikes):
+    spikes = sorted(spikes or [], key=lambda c: (-((c.get("additions") or 0) + (c.get("deletions") or 0)), c.get("sha") or ""))
+    return spikes[0] if spikes else None
+
+
+def closing_remarks(analysis, most_churn_author=None):
+    """
+    Closing sentences derived from the analysis: defect risk and what drives it, where the churn
+    came from, and a note when nothing merged. States only what the metrics show.
+    """
+    risk = analysis.get("defect_risk_flag", "Low")
+    spikes = len(analysis.get("spikes") or [])
+    anomalies = len(analysis.get("churn_anomalies") or [])
+    if risk != "Low":
+        drivers = [f"{spikes} churn spike(s)" if spikes else "", f"{anomalies} unusual day/week churn bucket(s)" if anomalies else ""]
+        sentences = [f"Defect risk is {risk}, driven by {' and '.join(d for d in drivers if d) or 'unusual churn'} "
+                     "against this repo's usual churn; those changes deserve a closer review."]
+    else:
+        sentences = ["Churn stayed within this repo's usual range, so defect risk is Low."]
+    authors = {author: (data.get("additions") or 0) + (data.get("deletions") or 0)
+               for author, data in (analysis.get("per_author_diffs") or {}).items()}
+    total = sum(authors.values())
+    if most_churn_author in authors and total and len(authors) > 1:
+        sentences.append(f"{most_churn_author} accounted for {round(100 * authors[most_churn_author] / total)}% of changed lines.")
+    if not analysis.get("pr_throughput_count"):
+        sentences.append("No pull requests were merged in this window.")
+    return " ".join(sentences)
+
+
+def render_template_report(analysis, most_churn_author="our team", report_author_name="", report_author_position=""):
+    """
+    Deterministic plain-text report rendered from the analysis dict with no LLM call.
+
+    Used when the narration misses its latency budget or every model request fails; same
+    inputs always give the same text, and rendering is pure string formatting (well under 10 ms).
+    """
+    lines = [
+        "*Weekly Engineering Productivity Report* (automated summary)",
+        "",
+        "*DORA metrics*",
+        f"• Deployment frequency (merged PRs): {analysis.get('dora_deployment_frequency', analysis.get('pr_throughput_count', 0))}",
+        f"• Lead time for changes: {analysis.get('dora_lead_time_for_changes_hours', 0)}h avg"
+        f" (p50 {analysis.get('cycle_time_hours_p50', 0)}h, p90 {analysis.get('cycle_time_hours_p90', 0)}h)",
+        f"• Change failure rate: {analysis.get('dora_change_failure_rate_percent', 0)}%",
+        f"• Review latency: {analysis.get('avg_review_latency_hours', 0)}h avg (p50 {analysis.get('review_latency_hours_p50', 0)}h)",
+        "",
+        "*Code churn*",
+        f"• +{analysis.get('total_additions', 0)} / -{analysis.get('total_deletions', 0)} lines"
+        f" (churn score {analysis.get('churn_score', 0)})",
+    ]
+    spikes = analysis.get("spikes") or []
+    top = _top_spike(spikes)
+    if top:
+        lines.append(f"• {len(spikes)} churn spike(s); largest {(top.get('sha') or '')[:7]} by {top.get('author', 'unknown')}"
+                     f" (+{top.get('additions', 0)} / -{top.get('deletions', 0)})")
+    else:
+        lines.append("• No churn spikes")
+    anomalies = analysis.get("churn_anomalies") or []
+    if anomalies:
+        lines.append(f"• {len(anomalies)} unusual day/week churn bucket(s)")
+    lines += [
+        "",
+        f"*Defect risk:* {analysis.get('defect_risk_flag', 'Low')}",
+        "",
+        closing_remarks(analysis, most_churn_author),
+        "Best Regards,",
+        report_author_name,
+        report_author_position,
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,379 @@
+import os
+import math
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from operator import itemgetter
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from dotenv import load_dotenv
+from agents.metrics_engine import commit_columns
+from store.db import iter_stored_commits, iter_daily_churn, iter_spike_commits, load_accumulator_state, save_accumulator_state
+
+load_dotenv()
+
+# Weight of the newest observation in the EWMA mean/variance (higher = adapts faster)
+TIMESERIES_ALPHA = float(os.getenv("TIMESERIES_ALPHA", "0.3"))
+# Standard deviations above the running mean (on log churn) that count as an outlier
+TIMESERIES_Z_THRESHOLD = float(os.getenv("TIMESERIES_Z_THRESHOLD", "3.0"))
+# Observations a series needs before it may flag anything
+TIMESERIES_WARMUP = int(os.getenv("TIMESERIES_WARMUP", "5"))
+# Churn below this is never flagged, however quiet the series usually is
+TIMESERIES_MIN_CHURN = int(os.getenv("TIMESERIES_MIN_CHURN", "50"))
+# Floor for the standard deviation (log scale, ~10%) so a perfectly steady series doesn't divide by zero
+MIN_STDDEV = 0.1
+# Verdicts a baseline remembers for observations it has folded, so a rerun over them flags the same ones
+MAX_FLAGGED = 100
+
+
+class EwmaDetector:
+    """Exponentially weighted running mean/variance of one series, updated in O(1) per observation."""
+
+    def __init__(self, alpha=TIMESERIES_ALPHA, mean=0.0, var=0.0, n=0, last=None, flagged=None):
+        self.alpha = alpha
+        self.mean = mean
+        self.var = var
+        self.n = n
+        self.last = last # key (bucket or [date, sha]) of the newest folded observation
+        self.flagged = flagged or {} # "key" -> [z, churn] for the newest folded observations that were flagged
+
+    def score(self, value):
+        """z-score of value against the series so far."""
+        return (value - self.mean) / max(math.sqrt(self.var), MIN_STDDEV)
+
+    def flag(self, key, z, churn):
+        self.flagged[_flag_key(key)] = [z, churn]
+        if len(self.flagged) > MAX_FLAGGED:
+            del self.flagged[min(self.flagged)]
+
+    def update(self, value, key=None):
+        if self.n == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            self.var = (1 - self.alpha) * (self.var + diff * increment)
+        self.n += 1
+        self.last = key
+
+    def to_dict(self):
+        return {"alpha": self.alpha, "mean": self.mean, "var": self.var, "n": self.n, "last": self.last, "flagged": self.flagged}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def _flag_key(key):
+    return " ".join(key) if isinstance(key, list) else key
+
+@lru_cache(maxsize=4096)
+def _week(day):
+    parsed = datetime.fromisoformat(day).date()
+    return (parsed - timedelta(days=parsed.weekday())).isoformat()
+
+def _churn(commit):
+    return (commit.get("additions") or 0) + (commit.get("deletions") or 0)
+
+def _order(commit):
+    return (commit.get("date") or "", commit["sha"])
+
+def _instant(value):
+    """Aware datetime for an ISO date or timestamp ("...Z" or with an offset); naive values are UTC."""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _sort_columns(values):
+    """ASCII strings as big-endian uint64 columns, most significant first, that sort in the strings' order."""
+    encoded = np.array(values, dtype="S")
+    width = max(8, -(-encoded.dtype.itemsize // 8) * 8)
+    return list(encoded.astype(f"S{width}").view(">u8").reshape(len(values), -1).T)
+
+def _commit_order(dates, shas):
+    """Indices that put commits in _order, without building a tuple per commit."""
+    try:
+        keys = _sort_columns(dates) + _sort_columns(shas)
+    except UnicodeEncodeError:
+        return np.array(sorted(range(len(dates)), key=lambda i: (dates[i], shas[i])), dtype=np.int64)
+    return np.lexsort(keys[::-1])
+
+def _recurrence(inputs, c, start):
+    """y[k] = c * y[k-1] + inputs[k] from y[-1] = start, in blocks short enough for c**-k to stay finite."""
+    if c <= 0:
+        return inputs.copy()
+    if c >= 1:
+        return start + np.cumsum(inputs)
+    out = np.empty_like(inputs)
+    powers = c ** np.arange(1, max(1, min(4096, int(100 / -math.log10(c)))) + 1)
+    for begin in range(0, len(inputs), len(powers)):
+        block = inputs[begin:begin + len(powers)]
+        scale = powers[:len(block)]
+        out[begin:begin + len(block)] = scale * (start + np.cumsum(block / scale))
+        start = out[begin + len(block) - 1]
+    return out
+
+def _ewma_path(values, detector):
+    """Means and variances of detector before each of values is folded in, and after the last (EwmaDetector.update in bulk)."""
+    c = 1 - detector.alpha
+    means = np.empty(len(values) + 1)
+    variances = np.empty(len(values) + 1)
+    means[0], variances[0] = detector.mean, detector.var
+    first = 0
+    if detector.n == 0 and len(values):
+        means[1], variances[1] = values[0], detector.var
+        first = 1
+    means[first + 1:] = _recurrence(detector.alpha * values[first:], c, means[first])
+    diffs = values[first:] - means[first:-1]
+    variances[first + 1:] = _recurrence(c * detector.alpha * diffs * diffs, c, variances[first])
+    return means, variances
+
+def _risk(spikes, repo_anomalies):
+    # An anomalous week, or several anomalous days/commits, is High; any single outlier is Medium
+    if any(a["period"] == "week" for a in repo_anomalies) or len(spikes) + len(repo_anomalies) >= 3:
+        return "High"
+    if spikes or repo_anomalies:
+        return "Medium"
+    return "Low"
+
+def churn_signals(spikes, anomalies):
+    """The report fields for a set of flagged commits and churn anomalies, with repo and per-author risk flags."""
+    repo_anomalies = [a for a in anomalies if a["scope"] == "repo"]
+    author_flags = {}
+    for anomaly in anomalies:
+        if anomaly["scope"] != "repo" and author_flags.get(anomaly["scope"]) != "High":
+            author_flags[anomaly["scope"]] = "High" if anomaly["period"] == "week" else "Medium"
+    risk = _risk(spikes, repo_anomalies)
+    return {
+        "spikes": spikes,
+        "churn_anomalies": anomalies,
+        "defect_risk_flag": risk,
+        "risk_flags": {"repo": risk, "authors": author_flags},
+    }
+
+
+class ChurnTimeSeries:
+    """
+    Adaptive spike detection and risk flags from churn time series.
+
+    Churn is scored on a log scale against EWMA baselines kept per repo for single commits, and per
+    repo and per author for daily and weekly buckets (days/weeks with commits). Baselines are
+    persisted per repo and only fold observations newer than the ones they have seen, and only
+    buckets the scanned window covers completely, so each report costs one pass over its own
+    window rather than a rescan of history. A repo without baselines is primed once from the store.
+    """
+
+    def __init__(self, alpha=TIMESERIES_ALPHA, z_threshold=TIMESERIES_Z_THRESHOLD,
+                 warmup=TIMESERIES_WARMUP, min_churn=TIMESERIES_MIN_CHURN, persist=True):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.min_churn = min_churn
+        self.persist = persist
+
+    def analyze(self, commits, repo=None, since=None, until=None, today=None, columns=None):
+        """
+        Returns {"spikes", "churn_anomalies", "risk_flags", "defect_risk_flag"} for the commits given.
+
+        since/until bound the window the commits were read from ("" since = the whole history,
+        None = from the first commit; until defaults to today). The commits are ordered, scored and
+        bucketed as arrays (see ChurnScan.add_many), in any order; columns is commit_columns(commits)
+        if the caller has already built it.
+        """
+        scan = self.scan(repo, since, until, today)
+        scan.add_many(list(commits), columns)
+        return scan.finish()
+
+    def analyze_rollups(self, repo, since_day=None, until_day=None, commits=None, today=None):
+        """
+        The same signals for a stored window, without reading its raw commits.
+
+        Day/week buckets are summed from the daily churn rollups. Commit-level spikes are scored for
+        the commits given (e.g. an incremental delta, which also moves the commit baseline), or else
+        for the stored commits above the lowest churn the commit baseline could flag. While that
+        baseline is still warming up, the window's commits are streamed once to build it.
+        """
+        scan = self.scan(repo, since_day or "", until_day, today)
+        for row in iter_daily_churn(repo, since_day, until_day):
+            scan.add_day(row["day"], row["author"], row["additions"] + row["deletions"])
+        if commits is None:
+            threshold = scan.spike_threshold()
+            if threshold is None:
+                commits = iter_stored_commits(repo, since_day, until_day)
+            else:
+                for commit in iter_spike_commits(repo, since_day, until_day, threshold):
+                    scan.add(commit, buckets=False, fold=False)
+        for commit in sorted(commits or [], key=_order):
+            scan.add(commit, buckets=False)
+        return scan.finish()
+
+    def scan(self, repo=None, since=None, until=None, today=None):
+        """Starts a streaming pass over [since, until): feed date-ordered commits to add(), then call finish()."""
+        baselines = {}
+        if repo and self.persist:
+            baselines = {name: EwmaDetector.from_dict(state) for name, state in (load_accumulator_state(self._key(repo)) or {}).items()}
+        until = until or today or datetime.now(timezone.utc).date().isoformat()
+        return ChurnScan(self, baselines, repo if self.persist else None, since, until, prime=bool(repo and self.persist and not baselines))
+
+    @staticmethod
+    def _key(repo):
+        return f"churn_baselines:{repo}"
+
+    def _detector(self, baselines, name):
+        if name not in baselines:
+            baselines[name] = EwmaDetector(self.alpha)
+        return baselines[name]
+
+    def _observe(self, detector, key, churn, complete=True):
+        """
+        Scores one observation and folds it into the baseline if it is new and complete; returns z or None.
+
+        An observation the baseline has already folded and flagged gets the z it was flagged with,
+        since the baseline has learned it since.
+        """
+        if _flag_key(key) in detector.flagged:
+            return detector.flagged[_flag_key(key)][0]
+        value = math.log1p(churn)
+        z = detector.score(value) if detector.n >= self.warmup else None
+        if z is not None and not (z > self.z_threshold and churn >= self.min_churn):
+            z = None
+        if complete and (detector.last is None or key > detector.last):
+            detector.update(value, key)
+            if z is not None:
+                detector.flag(key, round(z, 2), churn)
+        return z
+
+
+class ChurnScan:
+    """
+    One pass of a ChurnTimeSeries over a window, fed commit by commit (or day by day from rollups).
+
+    A day or week bucket only moves its baseline if it lies wholly inside [since, until): the
+    current day/week, and the partial first bucket of a window that starts mid-day or mid-week,
+    are scored but never folded, so a baseline never learns a part-bucket as a whole one.
+    """
+
+    def __init__(self, series, baselines, repo, since, until, prime=False):
+        self.series = series
+        self.baselines = baselines
+        self.repo = repo # baselines are saved under this repo on finish() (None: not persisted)
+        self.since = since
+        self.until = _instant(until)
+        self.prime = prime
+        self.spikes = []
+        self.buckets = {} # (scope, period, bucket) -> churn
+
+    def _start(self, first):
+        """Fixes an open window start at the first observation and primes empty baselines on the history before it."""
+        if self.since is None and first:
+            self.since = first
+        until = self.since or first
+        if self.prime and until:
+            self.prime = False
+            # First run for this repo: warm the baselines on the stored history before the window
+            warmup = ChurnScan(self.series, self.baselines, None, None, until)
+            for commit in iter_stored_commits(self.repo, until=until):
+                warmup.add(commit)
+            warmup.finish()
+
+    def add(self, commit, buckets=True, fold=True):
+        """Scores one commit against the commit baseline (folding it if fold) and adds it to its buckets."""
+        self._start(commit.get("date") or "")
+        churn = _churn(commit)
+        z = self.series._observe(self.series._detector(self.baselines, "commit"), list(_order(commit)), churn, fold)
+        if z is not None:
+            self.spikes.append(dict(commit, churn_z=round(z, 2)))
+        day = (commit.get("date") or "")[:10]
+        if buckets and day:
+            self.add_day(day, commit.get("author") or "unknown", churn)
+
+    def add_many(self, commits, columns=None):
+        """
+        add() for many commits in any order, with the commit baseline scored and folded as arrays.
+
+        Commits up to the newest one the baseline has folded are scored against it as it stands;
+        the newer ones run through the EWMA recurrence in bulk, so the verdicts, folds and buckets
+        are those of add() over the sorted commits, up to float rounding. columns is
+        commit_columns(commits), if the caller has already built it.
+        """
+        if not commits:
+            return
+        columns = columns or commit_columns(commits)
+        dates = [c.get("date") or "" for c in commits]
+        shas = list(map(itemgetter("sha"), commits))
+        order = _commit_order(dates, shas)
+        churn = (columns["additions"] + columns["deletions"])[order]
+        keys = lambda i: (dates[order[i]], shas[order[i]])
+        days = np.array(dates, dtype="U10")[order]
+        undated = np.count_nonzero(days == "") # sorted first
+        self._start(keys(undated)[0] if undated < len(commits) else "")
+
+        series = self.series
+        detector = series._detector(self.baselines, "commit")
+        folded = 0 if detector.last is None else bisect_right(range(len(commits)), tuple(detector.last), key=keys)
+        values = np.log1p(churn)
+        means, variances = _ewma_path(values[folded:], detector)
+        z = np.full(len(commits), np.nan)
+        if detector.n >= series.warmup:
+            z[:folded] = (values[:folded] - detector.mean) / max(math.sqrt(detector.var), MIN_STDDEV)
+        z[folded:] = (values[folded:] - means[:-1]) / np.maximum(np.sqrt(variances[:-1]), MIN_STDDEV)
+        z[folded:folded + max(0, series.warmup - detector.n)] = np.nan # still warming up
+        hits = (z > series.z_threshold) & (churn >= series.min_churn)
+        for key, (flagged_z, _) in detector.flagged.items():
+            # Verdicts remembered for commits the baseline has already learned
+            index = bisect_left(range(folded), tuple(key.split(" ", 1)), key=keys)
+            if index < folded and " ".join(keys(index)) == key:
+                z[index], hits[index] = flagged_z, True
+        if folded < len(commits):
+            detector.mean, detector.var = float(means[-1]), float(variances[-1])
+            detector.n += len(commits) - folded
+            detector.last = list(keys(len(commits) - 1))
+            for i in np.flatnonzero(hits[folded:])[-MAX_FLAGGED:] + folded:
+                detector.flag(list(keys(i)), round(float(z[i]), 2), int(churn[i]))
+        self.spikes.extend(dict(commits[order[i]], churn_z=round(float(z[i]), 2)) for i in np.flatnonzero(hits))
+
+        # Churn summed per (day, author) in date order, then one add_day per pair rather than per commit
+        changes = days[1:] != days[:-1]
+        starts = np.concatenate(([0], np.flatnonzero(changes) + 1))
+        runs = np.concatenate(([0], np.cumsum(changes)))
+        n_authors = len(columns["authors"])
+        pairs, pair_of = np.unique(runs * n_authors + columns["author"][order], return_inverse=True)
+        sums = np.bincount(pair_of, weights=churn, minlength=len(pairs))
+        for pair, total in zip(pairs.tolist(), sums.tolist()):
+            day = str(days[starts[pair // n_authors]])
+            if day:
+                self.add_day(day, columns["authors"][pair % n_authors] or "unknown", int(total))
+
+    def add_day(self, day, author, churn):
+        """Adds churn already summed for one author and day (e.g. a rollup row)."""
+        self._start(day)
+        for scope in ("repo", author or "unknown"):
+            for period, bucket in (("day", day), ("week", _week(day))):
+                self.buckets[(scope, period, bucket)] = self.buckets.get((scope, period, bucket), 0) + churn
+
+    def spike_threshold(self):
+        """Churn that a commit must exceed to be flagged against the current commit baseline (None while warming up)."""
+        self._start("")
+        detector = self.baselines.get("commit")
+        if detector is None or detector.n < self.series.warmup:
+            return None
+        bound = detector.mean + self.series.z_threshold * max(math.sqrt(detector.var), MIN_STDDEV)
+        # Commits flagged before the baseline learned them stay spikes, even below today's bound
+        lowest_flagged = min((churn for _, churn in detector.flagged.values()), default=math.inf)
+        return max(self.series.min_churn - 1, min(math.floor(math.expm1(bound)), lowest_flagged - 1))
+
+    def _complete(self, period, bucket):
+        start = _instant(bucket)
+        end = start + timedelta(days=1 if period == "day" else 7)
+        return (not self.since or start >= _instant(self.since)) and end <= self.until
+
+    def finish(self):
+        """Scores the buckets, folds the complete ones, saves the baselines and returns the churn signals."""
+        anomalies = []
+        for (scope, period, bucket), churn in sorted(self.buckets.items(), key=lambda item: (item[0][2], item[0][0] != "repo", item[0][0], item[0][1])):
+            z = self.series._observe(self.series._detector(self.baselines, f"{scope}:{period}"), bucket, churn,
+                                     self._complete(period, bucket))
+            if z is not None:
+                anomalies.append({"scope": scope, "period": period, "bucket": bucket, "churn": churn, "z_score": round(z, 2)})
+        if self.repo:
+            save_accumulator_state(self.series._key(self.repo), {name: detector.to_dict() for name, detector in self.baselines.items()})
+        return churn_signals(sorted(self.spikes, key=_order), anomalies)
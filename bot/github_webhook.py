@@ -0,0 +1,195 @@
+import os
+import hmac
+import json
+import queue
+import hashlib
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+from agents.data_harvester import commit_diff_record, pull_request_record, commit_store_row
+from github.github_client import get_commit_details_bulk
+from github.rate_limiter import request_priority, BACKGROUND
+from store.db import save_commits, upsert_pull_requests, record_first_reviews
+
+load_dotenv()
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
+GITHUB_WEBHOOK_PORT = int(os.getenv("GITHUB_WEBHOOK_PORT", "3001"))
+WEBHOOK_PATH = "/github/webhook"
+HANDLED_EVENTS = {"push", "pull_request", "pull_request_review"}
+
+
+def verify_signature(secret, body, signature_header):
+    """Checks GitHub's X-Hub-Signature-256 HMAC for a raw request body."""
+    if not secret or not signature_header or not signature_header.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature_header[len("sha256="):])
+
+def _utc(timestamp):
+    # Push payloads carry local offsets ("...-04:00"); the store uses GitHub's UTC "Z" form
+    if not timestamp:
+        return timestamp
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class WebhookIngestor:
+    """
+    Buffers verified webhook deliveries and upserts them into the store in batches.
+
+    `submit` only enqueues the raw body, so accepting a delivery is O(1); parsing, commit
+    enrichment and SQLite writes all happen on the background writer thread.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=1.0, max_queue=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._writer, name="github-webhook-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, event, body):
+        """Enqueues one delivery; returns False if the buffer is full."""
+        try:
+            self._queue.put_nowait((event, body))
+            return True
+        except queue.Full:
+            return False
+
+    def _writer(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            try:
+                self.ingest(batch)
+            except Exception as e:
+                print(f"❌ Failed to ingest {len(batch)} webhook deliveries: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Blocks until every delivery submitted so far has been written."""
+        self._queue.join()
+
+    def ingest(self, batch):
+        """
+        Turns a batch of (event, raw body) deliveries into commit / pull request upserts.
+
+        A delivery that can't be parsed is logged and skipped without affecting the rest of the
+        batch; returns {"ingested", "failed"} delivery counts.
+        """
+        pushed = {} # repo -> {sha: push payload commit}
+        prs = {} # (repo, number) -> latest PR record
+        reviews = {} # repo -> [(number, submitted_at)]
+
+        failed = 0
+        for event, body in batch:
+            try:
+                self._collect(event, json.loads(body), pushed, prs, reviews)
+            except Exception as e:
+                failed += 1
+                print(f"❌ Skipping malformed {event} webhook delivery: {type(e).__name__}: {e}")
+
+        for repo, commits in pushed.items():
+            try:
+                save_commits([commit_store_row(record, repo) for record in self._commit_records(repo, commits)])
+            except Exception as e:
+                print(f"❌ Failed to store {len(commits)} pushed commits for {repo}: {e}")
+        if prs:
+            upsert_pull_requests(list(prs.values()))
+        for repo, repo_reviews in reviews.items():
+            try:
+                record_first_reviews(repo, repo_reviews)
+            except Exception as e:
+                print(f"❌ Failed to record {len(repo_reviews)} reviews for {repo}: {e}")
+        return {"ingested": len(batch) - failed, "failed": failed}
+
+    def _collect(self, event, payload, pushed, prs, reviews):
+        # Parses one delivery into the batch's pending writes; raises on a malformed payload
+        repo = payload["repository"]["full_name"]
+        if event == "push":
+            default_ref = f"refs/heads/{payload['repository'].get('default_branch')}"
+            if payload.get("ref") != default_ref:
+                return # reports follow the default branch, like the commits API
+            commits = {commit["id"]: commit for commit in payload.get("commits", [])}
+            pushed.setdefault(repo, {}).update(commits)
+        elif event == "pull_request":
+            pr = payload["pull_request"]
+            record = pull_request_record(pr, None)
+            record.pop("first_review_at") # maintained by review events; don't clobber it
+            record["repo"] = repo
+            prs[(repo, pr["number"])] = record
+        elif event == "pull_request_review":
+            submitted_at = payload.get("review", {}).get("submitted_at")
+            if submitted_at:
+                reviews.setdefault(repo, []).append((payload["pull_request"]["number"], submitted_at))
+
+    def _commit_records(self, repo, commits):
+        # Push payloads list touched files but not line counts, so look the commits up
+        # (immutable, so usually a cache hit) at background priority.
+        owner, name = repo.split("/", 1)
+        shas = list(commits)
+        try:
+            with request_priority(BACKGROUND):
+                details = get_commit_details_bulk(owner, name, shas)
+            return [commit_diff_record(sha, detail) for sha, detail in zip(shas, details)]
+        except Exception as e:
+            print(f"⚠️  Commit enrichment failed for {repo}, storing push data without line counts: {e}")
+            records = []
+            for sha, commit in commits.items():
+                paths = commit.get("added", []) + commit.get("removed", []) + commit.get("modified", [])
+                records.append({
+                    "sha": sha,
+                    "author": (commit.get("author") or {}).get("username", "unknown"),
+                    "date": _utc(commit.get("timestamp")),
+                    "additions": 0,
+                    "deletions": 0,
+                    "files": len(paths),
+                    "file_changes": [[path, 0, 0] for path in paths], # change counts only; no line counts in push payloads
+                })
+            return records
+
+
+def make_handler(ingestor, secret):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != WEBHOOK_PATH:
+                return self._reply(404)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not verify_signature(secret, body, self.headers.get("X-Hub-Signature-256")):
+                return self._reply(401)
+            event = self.headers.get("X-GitHub-Event")
+            if event not in HANDLED_EVENTS:
+                return self._reply(204) # ping and other events are acknowledged and ignored
+            self._reply(202 if ingestor.submit(event, body) else 503)
+
+        def _reply(self, status):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return WebhookHandler
+
+def start_webhook_server(port=GITHUB_WEBHOOK_PORT, secret=GITHUB_WEBHOOK_SECRET, ingestor=None):
+    """Serves the GitHub webhook endpoint on a daemon thread and returns the server."""
+    if not secret:
+        raise ValueError("❌ GITHUB_WEBHOOK_SECRET not set; refusing to accept unsigned webhooks.")
+    server = ThreadingHTTPServer(("0.0.0.0", port), make_handler(ingestor or WebhookIngestor(), secret))
+    threading.Thread(target=server.serve_forever, name="github-webhook-server", daemon=True).start()
+    print(f"📬 GitHub webhook receiver listening on port {server.server_port}{WEBHOOK_PATH}")
+    return server
+
+
+if __name__ == "__main__":
+    # Run as a sibling process: python -m bot.github_webhook
+    start_webhook_server()
+    threading.Event().wait()
@@ -0,0 +1,115 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from store.db import get_db_connection, log_event, flush_logs
+from store.jobs import (
+    enqueue_job, claim_job, get_job, finish_job, pending_waiters, mark_notified, requeue_running,
+    unnotified_finished_jobs, queue_stats,
+)
+
+load_dotenv()
+
+# Reports generated at the same time; further requests wait in the queue
+REPORT_QUEUE_WORKERS = int(os.getenv("REPORT_QUEUE_WORKERS", "2"))
+# Idle workers re-check the queue this often (new jobs also wake them immediately)
+REPORT_QUEUE_POLL_SECONDS = float(os.getenv("REPORT_QUEUE_POLL_SECONDS", "1"))
+
+
+class ReportQueue:
+    """
+    Bounded worker pool over the SQLite report_jobs queue (see store/jobs.py).
+
+    runner(job, waiters) produces a JSON-serializable result for one job; notifier(job, waiters)
+    delivers the finished (or failed) job to everyone who asked for it. Jobs and waiters are
+    persisted, so on start() jobs interrupted by a restart are queued again (or failed, once
+    they have used REPORT_JOB_MAX_ATTEMPTS) and finished jobs with waiters still to notify are delivered.
+    """
+
+    def __init__(self, runner, notifier, workers=REPORT_QUEUE_WORKERS, poll_seconds=REPORT_QUEUE_POLL_SECONDS):
+        self.runner = runner
+        self.notifier = notifier
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Starts the workers (idempotent)."""
+        with self._start_lock:
+            if self._threads:
+                return self
+            db = get_db_connection()
+            requeued = requeue_running(db)
+            if requeued:
+                print(f"⚠️  Re-queued {requeued} report job(s) interrupted by a restart.")
+            for job_id in unnotified_finished_jobs(db):
+                self._notify(job_id)
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._work, name=f"report-worker-{i}", daemon=True) for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, repo, window_days, waiter, options=None):
+        """Queues a report (or joins one in flight with the same options); returns (job_id, coalesced, queue depth)."""
+        db = get_db_connection()
+        job_id, coalesced = enqueue_job(db, repo, window_days, waiter, options)
+        self._wake.set()
+        return job_id, coalesced, self.stats()["queued"]
+
+    def stats(self, window_seconds=24 * 3600):
+        """Queue depth and wait/run times over the last window_seconds."""
+        return queue_stats(get_db_connection(), since=time.time() - window_seconds)
+
+    def _work(self):
+        db = get_db_connection()
+        while not self._stop.is_set():
+            job = claim_job(db)
+            if job is None:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            if job["status"] == "failed": # out of attempts: tell its waiters rather than run it again
+                print(f"❌ Report job {job['id']} failed: {job['error']}")
+                self._notify(job["id"])
+                continue
+            self._run(db, job)
+
+    def _run(self, db, job):
+        started_at = time.time()
+        wait_seconds = round(job["started_at"] - job["created_at"], 2)
+        print(f"🛠️  Report job {job['id']} ({job['repo']}, {job['window_days']}d) started after {wait_seconds}s in the queue.")
+        try:
+            result = self.runner(job, pending_waiters(db, job["id"]))
+            finish_job(db, job["id"], result=result)
+        except Exception as e:
+            print(f"❌ Report job {job['id']} failed: {e}")
+            finish_job(db, job["id"], error=f"{type(e).__name__}: {e}")
+        log_event("ReportQueue", "run_job", {"job_id": job["id"], "repo": job["repo"], "window_days": job["window_days"]},
+                  {"wait_seconds": wait_seconds, "status": get_job(db, job["id"])["status"]}, started_at=started_at)
+        self._notify(job["id"])
+        flush_logs()
+
+    def _notify(self, job_id):
+        db = get_db_connection()
+        job, waiters = get_job(db, job_id), pending_waiters(db, job_id)
+        if not waiters:
+            return
+        try:
+            self.notifier(job, waiters)
+        except Exception as e: # e.g. an expired response_url; the job itself is done either way
+            print(f"❌ Error notifying waiters of report job {job_id}: {e}")
+        for waiter in waiters:
+            mark_notified(db, waiter["id"])
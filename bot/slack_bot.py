@@ -1,6 +1,10 @@
 import os
 from slack_bolt import App
 from langgraph.graph_flow import build_graph
+from agents.insight_narrator import InsightNarrator
+from bot.slack_stream import StreamingMessage, SLACK_STREAM_NARRATION, format_metrics_header
+from bot.report_queue import ReportQueue
+from slack_sdk.webhook import WebhookClient
 from dotenv import load_dotenv
 from charts.visualizer import generate_churn_chart # Import the chart generation function
 
@@ -8,61 +12,151 @@ load_dotenv()
 # Ensure SLACK_SIGNING_SECRET is in your .env and used here
 app = App(token=os.getenv("SLACK_BOT_TOKEN"), signing_secret=os.getenv("SLACK_SIGNING_SECRET"))
 
-@app.command("/dev-report")
-def handle_report(ack, body, respond):
-    # ACKNOWLEDGE IMMEDIATELY to prevent timeout
-    ack("Generating your dev report... This may take a moment.") 
-    
-    # Run the heavy LangGraph logic in the background
+def parse_report_command(text):
+    """
+    "/dev-report [owner/repo] [<days>d] [fresh]" -> (owner, repo, window_days, options).
+
+    Defaults to GITHUB_OWNER/GITHUB_REPO over 7 days; "fresh" skips the narration cache.
+    """
+    owner = os.getenv("GITHUB_OWNER", "pupiltree")
+    repo = os.getenv("GITHUB_REPO", "fika-ai-engineering-insights-bot")
+    window_days = 7
+    options = {}
+    for token in (text or "").split():
+        if "/" in token:
+            owner, repo = token.split("/", 1)
+        elif token.rstrip("d").isdigit():
+            window_days = max(1, int(token.rstrip("d")))
+        elif token == "fresh":
+            options["bypass_narration_cache"] = True
+    return owner, repo, window_days, options
+
+
+def run_report_job(job, waiters):
+    """Queue runner: harvest, analysis, narration and chart for one job; returns what the notifier delivers."""
+    owner, repo = job["repo"].split("/", 1)
+    options = job["options"]
+    report_author_position = os.getenv("REPORT_AUTHOR_POSITION", "Engineering Analyst")
+    bypass_narration_cache = options.get("bypass_narration_cache", False)
+
+    graph = build_graph(owner, repo, report_author_name=owner, report_author_position=report_author_position,
+                        bypass_narration_cache=bypass_narration_cache, narrate=not SLACK_STREAM_NARRATION,
+                        window_days=job["window_days"])
+    runnable = graph.compile()
+
+    # Invoke the compiled graph with an empty dictionary as initial state
+    result_dict = runnable.invoke({})
+
+    streamed_channel = None
+    if SLACK_STREAM_NARRATION:
+        # Metrics go out as soon as the analysis is done; the narration is streamed into one message
+        # in the first requester's channel (everyone is notified when the job finishes)
+        message = None
+        if waiters and waiters[0].get("channel_id"):
+            try:
+                header = format_metrics_header(owner, repo, result_dict.get("analysis", {}))
+                message = StreamingMessage(app.client, waiters[0]["channel_id"], header).post()
+            except Exception as post_err: # e.g. the bot is not in the channel: the report goes out via response_url
+                print(f"⚠️  Couldn't post a streaming message, sending the report when done: {post_err}")
+        narrator = InsightNarrator(owner, report_author_position, bypass_cache=bypass_narration_cache)
+        result_dict = narrator.run(result_dict, on_token=message.update if message else None)
+        if message:
+            message.finish(result_dict.get("summary", "No summary generated."))
+            streamed_channel = waiters[0]["channel_id"]
+            print(f"✅ Streamed report to Slack ({message.updates} updates).")
+
+    # Generate the chart if data is available
+    chart_path = None
+    churn_data_for_chart = result_dict.get("pr_data_for_chart", [])
+    if churn_data_for_chart:
+        try:
+            # Ensure the 'charts' directory exists for saving images
+            if not os.path.exists("charts"):
+                os.makedirs("charts")
+            spikes = result_dict.get("analysis", {}).get("spikes")
+            # One file per job, so concurrent workers don't overwrite each other's chart
+            chart_path = generate_churn_chart(churn_data_for_chart, path=f"charts/churn_report_{job['id']}.png", spikes=spikes)
+            print(f"✅ Churn chart generated at: {chart_path}")
+        except Exception as chart_err:
+            print(f"❌ Error generating chart: {chart_err}")
+            chart_path = None # Reset chart_path if generation fails
+
+    return {
+        "summary": result_dict.get("summary", "No summary generated."),
+        "chart_path": chart_path,
+        "streamed_channel": streamed_channel,
+    }
+
+
+def notify_report_waiters(job, waiters):
+    """Queue notifier: sends the finished report (or the error) to every requester of the job, then deletes its chart."""
+    result = job["result"] or {}
+    charted = set()
     try:
-        # Get owner and repo from environment variables (or command arguments if you plan to extend)
-        owner = os.getenv("GITHUB_OWNER", "pupiltree")
-        repo = os.getenv("GITHUB_REPO", "fika-ai-engineering-insights-bot")
-        report_author_position = os.getenv("REPORT_AUTHOR_POSITION", "Engineering Analyst")
-
-        graph = build_graph(owner, repo, report_author_name=owner, report_author_position=report_author_position)
-        runnable = graph.compile()
-        
-        # Invoke the compiled graph with an empty dictionary as initial state
-        result_dict = runnable.invoke({}) 
-        
-        # Extract the final summary from the result
-        final_summary = result_dict.get("summary", "No summary generated.")
-        # Extract data for charting
-        churn_data_for_chart = result_dict.get("pr_data_for_chart", [])
-
-        # Generate the chart if data is available
-        chart_path = None
-        if churn_data_for_chart:
+        for waiter in waiters:
             try:
-                # Ensure the 'charts' directory exists for saving images
-                if not os.path.exists("charts"):
-                    os.makedirs("charts")
-                chart_path = generate_churn_chart(churn_data_for_chart, path="charts/churn_report.png")
-                print(f"✅ Churn chart generated at: {chart_path}")
-            except Exception as chart_err:
-                print(f"❌ Error generating chart: {chart_err}")
-                chart_path = None # Reset chart_path if generation fails
-        
-        # SEND THE FULL REPORT AFTER GENERATION
-        respond(final_summary)
-
-        # Upload the chart if it was generated
+                webhook = WebhookClient(waiter["response_url"])
+                if job["status"] == "failed":
+                    webhook.send(text=f"Sorry, I couldn't generate the report: {job['error']}")
+                    continue
+                if waiter.get("channel_id") and waiter["channel_id"] == result.get("streamed_channel"):
+                    webhook.send(text="✅ Your dev report is ready (posted above).")
+                    continue
+                webhook.send(text=result.get("summary", "No summary generated."))
+            except Exception as e: # response_urls expire after 30 minutes; one bad waiter shouldn't stop the rest
+                print(f"❌ Error sending the report to {waiter.get('user_id')}: {e}")
+                continue
+
+            # Upload the chart once per channel that got the report through response_url
+            chart_path = result.get("chart_path")
+            channel = waiter.get("channel_id")
+            if chart_path and os.path.exists(chart_path) and channel and channel not in charted:
+                charted.add(channel)
+                try:
+                    app.client.files_upload_v2(
+                        channel=channel, # Send to the channel where the command was issued
+                        file=chart_path,
+                        title="Code Churn Report",
+                        initial_comment="Here's a visual breakdown of the code churn:",
+                    )
+                    print("✅ Churn chart uploaded to Slack.")
+                except Exception as upload_err:
+                    print(f"❌ Error uploading chart to Slack: {upload_err}")
+    finally:
+        # Each job writes its own chart file; once it has gone out it is no longer needed
+        chart_path = result.get("chart_path")
         if chart_path and os.path.exists(chart_path):
             try:
-                app.client.files_upload_v2(
-                    channel=body["channel_id"], # Send to the channel where the command was issued
-                    file=chart_path,
-                    title="Code Churn Report",
-                    initial_comment="Here's a visual breakdown of the code churn:",
-                )
-                print("✅ Churn chart uploaded to Slack.")
-            except Exception as upload_err:
-                print(f"❌ Error uploading chart to Slack: {upload_err}")
-        
+                os.remove(chart_path)
+            except OSError as remove_err:
+                print(f"⚠️  Couldn't delete chart {chart_path}: {remove_err}")
+
+
+report_queue = ReportQueue(run_report_job, notify_report_waiters)
+
+
+@app.command("/dev-report")
+def handle_report(ack, body, respond):
+    # The pipeline runs on the report queue's workers; the handler only queues (or joins) a job and acknowledges
+    try:
+        owner, repo, window_days, options = parse_report_command(body.get("text"))
+        report_queue.start()
+        job_id, coalesced, queued = report_queue.submit(f"{owner}/{repo}", window_days, {
+            "response_url": body.get("response_url"),
+            "channel_id": body.get("channel_id"),
+            "user_id": body.get("user_id"),
+        }, options)
     except Exception as e:
-        print(f"❌ Error generating report: {e}")
-        respond(f"Sorry, I couldn't generate the report: {e}")
+        print(f"❌ Error queueing report: {e}")
+        ack(f"Sorry, I couldn't queue the report: {e}")
+        return
+
+    if coalesced:
+        ack(f"A {window_days}-day report for {owner}/{repo} is already being generated. You'll get it when it's done.")
+    else:
+        ahead = f" ({queued - 1} ahead of it in the queue)" if queued > 1 else ""
+        ack(f"Generating your dev report for {owner}/{repo}{ahead}... This may take a moment.")
 
 if __name__ == "__main__":
+    report_queue.start()
     app.start(port=3000)
@@ -0,0 +1,74 @@
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Stream the narration into the Slack message as tokens arrive (false = post the finished report once)
+SLACK_STREAM_NARRATION = os.getenv("SLACK_STREAM_NARRATION", "true").lower() not in ("0", "false", "no")
+# Minimum seconds between chat.update calls while streaming (Slack allows roughly one update per second per channel)
+SLACK_STREAM_UPDATE_SECONDS = float(os.getenv("SLACK_STREAM_UPDATE_SECONDS", "0.5"))
+
+
+def format_metrics_header(owner, repo, analysis):
+    """Short metrics block posted before the narration is ready."""
+    return "\n".join([
+        f"*Dev report for {owner}/{repo}*",
+        f"• Churn: +{analysis.get('total_additions', 0)} / -{analysis.get('total_deletions', 0)}"
+        f" (spikes: {len(analysis.get('spikes') or [])})",
+        f"• PRs merged: {analysis.get('pr_throughput_count', 0)}"
+        f" | cycle time p50 {analysis.get('cycle_time_hours_p50', 0)}h"
+        f" | review latency p50 {analysis.get('review_latency_hours_p50', 0)}h",
+        f"• Change failure rate: {analysis.get('change_failure_rate_percent', 0)}%"
+        f" | defect risk: {analysis.get('defect_risk_flag', 'Low')}",
+    ])
+
+
+class StreamingMessage:
+    """
+    One Slack message that is posted once and then edited in place as text streams in.
+
+    update() is throttled to one chat.update per interval; the newest text always wins, and
+    finish() flushes it regardless of the throttle.
+    """
+
+    def __init__(self, client, channel, header, interval=SLACK_STREAM_UPDATE_SECONDS, clock=time.monotonic):
+        self.client = client
+        self.channel = channel
+        self.header = header
+        self.interval = interval
+        self.clock = clock
+        self.ts = None
+        self.last_update = None
+        self.pending = None
+        self.updates = 0
+
+    def post(self, placeholder="_Writing the summary..._"):
+        response = self.client.chat_postMessage(channel=self.channel, text=self._text(placeholder))
+        self.channel = response["channel"] # chat.postMessage resolves user/DM ids to the conversation id
+        self.ts = response["ts"]
+        self.last_update = self.clock()
+        return self
+
+    def update(self, text):
+        self.pending = text
+        if self.clock() - self.last_update >= self.interval:
+            try:
+                self._flush()
+            except Exception as e: # a dropped intermediate edit (e.g. rate limited) must not stop the stream
+                print(f"⚠️  Slack chat.update failed, retrying on the next token: {e}")
+
+    def finish(self, text):
+        self.pending = text
+        self._flush()
+
+    def _flush(self):
+        if self.pending is None:
+            return
+        self.client.chat_update(channel=self.channel, ts=self.ts, text=self._text(self.pending))
+        self.pending = None
+        self.last_update = self.clock()
+        self.updates += 1
+
+    def _text(self, body):
+        return f"{self.header}\n\n{body}"
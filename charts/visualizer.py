@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
+from agents.timeseries import ChurnTimeSeries
 
-def generate_churn_chart(churn_data, path="churn.png"):
+def generate_churn_chart(churn_data, path="churn.png", spikes=None):
     """
     Generates an enhanced code churn chart with additions and deletions,
     gridlines, axis labels, legend, title, and spike annotations.
@@ -9,6 +10,9 @@ def generate_churn_chart(churn_data, path="churn.png"):
         churn_data (list of dict): A list of dictionaries, each containing
                                    'sha', 'additions', and 'deletions' for a commit.
         path (str): The file path to save the generated chart.
+        spikes (list of dict, optional): Commits to annotate, as flagged by DiffAnalyst
+                                         (analysis["spikes"]). Defaults to the outliers of
+                                         churn_data itself (ChurnTimeSeries, not persisted).
 
     Returns:
         str: The path to the saved chart image, or None if no data is provided.
@@ -49,13 +53,16 @@ def generate_churn_chart(churn_data, path="churn.png"):
     plt.legend(fontsize=10)
 
     # Annotate significant commits or spikes
-    # A "spike" is defined as a commit with a total (additions + deletions) greater than a threshold.
-    spike_threshold = 500 # This threshold aligns with DiffAnalyst's definition of a spike
+    # Spikes come from DiffAnalyst's adaptive detection; without them, score the charted commits on their own.
+    if spikes is None:
+        spikes = ChurnTimeSeries(persist=False).analyze(churn_data)["spikes"]
+    spike_shas = {spike["sha"] for spike in spikes}
 
-    for i, (sha, add, dele) in enumerate(zip(shas, additions, deletions)):
+    for i, (item, sha, add, dele) in enumerate(zip(churn_data, shas, additions, deletions)):
         total_churn_for_this_commit = add + dele # This represents sum of absolute lines changed
-        
-        if total_churn_for_this_commit > spike_threshold:
+        is_spike = item["sha"] in spike_shas
+
+        if is_spike:
             # Determine y-position for annotation. Place it above additions or below deletions,
             # depending on which absolute value is larger for clarity.
             if add >= dele: # If additions are greater or equal to deletions (magnitude)
@@ -1,39 +1,189 @@
 import requests
 import os
+import json
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from github.http_cache import get_response_cache
+from github.rate_limiter import (
+    GITHUB_RATE_LIMIT_DB_PATH, RequestScheduler, SharedBudgets, tokens_from_env, current_priority, request_priority,
+)
 
 load_dotenv()
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+# Overridable so the client can be pointed at GitHub Enterprise or a local fake API
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+# Upper bound on parallel GitHub calls made by the *_bulk helpers below
+GITHUB_MAX_WORKERS = int(os.getenv("GITHUB_MAX_WORKERS", "8"))
 
+# Authorization is added per request by the scheduler, which picks the credential
 headers = {
-    "Authorization": f"Bearer {GITHUB_TOKEN}",
     "Accept": "application/vnd.github+json"
 }
 
+# One keep-alive session shared by every call, so repeated requests reuse the
+# same TCP/TLS connection instead of paying a new handshake each time.
+session = requests.Session()
+session.headers.update(headers)
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(GITHUB_MAX_WORKERS, 10))
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
+# Every GitHub call goes through this scheduler: it tracks X-RateLimit-* budgets per token,
+# rotates across GITHUB_TOKENS and waits out limits instead of raising on the first 403.
+scheduler = RequestScheduler(tokens_from_env(), shared=SharedBudgets(GITHUB_RATE_LIMIT_DB_PATH) if GITHUB_RATE_LIMIT_DB_PATH else None)
+
+def share_rate_limits(path):
+    """Makes this process's GitHub calls draw from the budgets shared by every process using the SQLite file at path."""
+    global scheduler
+    scheduler = RequestScheduler(tokens_from_env(), shared=SharedBudgets(path))
+
+def _send(url, params=None, headers=None):
+    return scheduler.request(session, "GET", url, params=params, headers=headers)
+
+def get_rate_limit_metrics():
+    """Returns remaining GitHub budget per credential and time spent waiting on rate limits."""
+    return scheduler.metrics()
+
+def _get_json(url, params=None, immutable=False):
+    """GETs a GitHub API URL through the response cache and returns the decoded body."""
+    return _get(url, params=params, immutable=immutable)[0]
+
+def _next_link(link_header):
+    """Extracts the rel="next" URL from a Link header, or None on the last page."""
+    if not link_header:
+        return None
+    links = requests.utils.parse_header_links(link_header)
+    return next((link["url"] for link in links if link.get("rel") == "next"), None)
+
+def _get(url, params=None, immutable=False):
+    """
+    GETs a GitHub API URL through the response cache, returning (body, next_page_url).
+
+    Immutable resources (e.g. a commit by SHA) are served straight from the cache.
+    Everything else is revalidated with If-None-Match / If-Modified-Since, so an
+    unchanged resource costs a 304 (no body, no rate-limit hit) instead of a full download.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        res = _send(url, params=params)
+        res.raise_for_status() # Raise an exception for bad status codes
+        return res.json(), _next_link(res.headers.get("Link"))
+
+    # Scoped to the credentials in use: a response one token may see is never served to another
+    key = f"{scheduler.identity} {url}?{urlencode(sorted(params.items()))}" if params else f"{scheduler.identity} {url}"
+    entry = cache.get(key)
+    if entry and entry["immutable"]:
+        cache.record("hits")
+        return json.loads(entry["body"]), _next_link(entry["link"])
+
+    conditional_headers = {}
+    if entry:
+        if entry["etag"]:
+            conditional_headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            conditional_headers["If-Modified-Since"] = entry["last_modified"]
+
+    res = _send(url, params=params, headers=conditional_headers)
+    if res.status_code == 304 and entry:
+        cache.record("revalidated")
+        return json.loads(entry["body"]), _next_link(entry["link"])
+    res.raise_for_status()
+
+    cache.record("misses")
+    cache.put(key, res.text, etag=res.headers.get("ETag"), last_modified=res.headers.get("Last-Modified"),
+              immutable=immutable, link=res.headers.get("Link"))
+    return res.json(), _next_link(res.headers.get("Link"))
+
+def _paginate(url, params=None):
+    """Lazily yields items across pages by following Link: rel="next"; a page is only fetched once needed."""
+    while url:
+        items, url = _get(url, params=params)
+        params = None # the next-page URL already carries the query string
+        yield from items
+
+def _iso(value):
+    """Normalizes a datetime (or ISO string) to GitHub's YYYY-MM-DDTHH:MM:SSZ form."""
+    if value is None or isinstance(value, str):
+        return value
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def get_cache_stats():
+    """Returns hit / revalidated / miss / eviction counters of the response cache."""
+    cache = get_response_cache()
+    return dict(cache.stats) if cache else {}
+
 def get_commits(owner, repo):
-    url = f"https://api.github.com/repos/{owner}/{repo}/commits"
-    res = requests.get(url, headers=headers)
-    res.raise_for_status() # Raise an exception for bad status codes
-    return res.json()
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/commits"
+    return _get_json(url)
 
 def get_commit_details(owner, repo, commit_sha):
     """Fetches details for a single commit, including files changed."""
-    url = f"https://api.github.com/repos/{owner}/{repo}/commits/{commit_sha}"
-    res = requests.get(url, headers=headers)
-    res.raise_for_status()
-    return res.json()
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/commits/{commit_sha}"
+    # A commit addressed by SHA never changes, so it never needs revalidating
+    return _get_json(url, immutable=True)
 
 def get_pull_requests(owner, repo, state="closed", per_page=30):
     """Fetches a list of pull requests."""
-    url = f"https://api.github.com/repos/{owner}/{repo}/pulls"
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/pulls"
     params = {"state": state, "per_page": per_page}
-    res = requests.get(url, headers=headers, params=params)
-    res.raise_for_status()
-    return res.json()
+    return _get_json(url, params=params)
+
+def iter_commits(owner, repo, since=None, until=None, per_page=100):
+    """Streams commit summaries newest-first, with the since/until window applied by the API."""
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/commits"
+    params = {"per_page": per_page}
+    if since:
+        params["since"] = _iso(since)
+    if until:
+        params["until"] = _iso(until)
+    return _paginate(url, params)
+
+def iter_pull_requests(owner, repo, state="closed", since=None, per_page=100):
+    """
+    Streams pull requests most-recently-updated first.
+
+    With since set, iteration stops at the first PR last updated before it, so
+    pages older than the reporting window are never requested.
+    """
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/pulls"
+    params = {"state": state, "sort": "updated", "direction": "desc", "per_page": per_page}
+    since = _iso(since)
+    for pr in _paginate(url, params):
+        if since and (pr.get("updated_at") or "") < since:
+            return
+        yield pr
 
 def get_pull_request_reviews(owner, repo, pull_number):
     """Fetches reviews for a specific pull request."""
-    url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pull_number}/reviews"
-    res = requests.get(url, headers=headers)
-    res.raise_for_status()
-    return res.json()
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/pulls/{pull_number}/reviews"
+    return _get_json(url)
+
+def fetch_concurrently(fetch, items, max_workers=None):
+    """Calls fetch(item) for every item on a bounded thread pool, returning results in input order."""
+    items = list(items)
+    max_workers = max_workers or GITHUB_MAX_WORKERS
+    if max_workers <= 1 or len(items) <= 1:
+        return [fetch(item) for item in items]
+
+    # Worker threads don't inherit context variables, so carry the caller's request priority over
+    priority = current_priority()
+    def fetch_with_priority(item):
+        with request_priority(priority):
+            return fetch(item)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        # Executor.map yields in submission order, matching the sequential path
+        return list(pool.map(fetch_with_priority, items))
+
+def get_commit_details_bulk(owner, repo, commit_shas, max_workers=None):
+    """Fetches details for many commits in parallel, in the same order as commit_shas."""
+    return fetch_concurrently(lambda sha: get_commit_details(owner, repo, sha), commit_shas, max_workers)
+
+def get_pull_request_reviews_bulk(owner, repo, pull_numbers, max_workers=None):
+    """Fetches reviews for many pull requests in parallel, in the same order as pull_numbers."""
+    return fetch_concurrently(lambda number: get_pull_request_reviews(owner, repo, number), pull_numbers, max_workers)
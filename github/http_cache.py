@@ -0,0 +1,150 @@
+import os
+import time
+import atexit
+import sqlite3
+import threading
+import sqlite_utils
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# The cache lives in its own SQLite file next to the main store database so
+# cache churn never contends with report writes.
+_default_db_dir = os.path.dirname(os.getenv("SQLITE_DB_PATH", "fika_ai_db.sqlite"))
+GITHUB_CACHE_DB_PATH = os.getenv("GITHUB_CACHE_DB_PATH", os.path.join(_default_db_dir, "github_cache.sqlite"))
+GITHUB_CACHE_MAX_BYTES = int(os.getenv("GITHUB_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+GITHUB_CACHE_ENABLED = os.getenv("GITHUB_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+# Cache reads are recorded in memory and written back in one UPDATE per this many reads or seconds
+GITHUB_CACHE_ACCESS_FLUSH_SIZE = int(os.getenv("GITHUB_CACHE_ACCESS_FLUSH_SIZE", "256"))
+GITHUB_CACHE_ACCESS_FLUSH_SECONDS = float(os.getenv("GITHUB_CACHE_ACCESS_FLUSH_SECONDS", "5"))
+
+
+class ResponseCache:
+    """
+    Persistent, size-bounded LRU cache of GitHub API responses keyed by credential and request URL.
+
+    Reads never write: last-access times are buffered and flushed in batches, and always
+    before an eviction, so the LRU order stays exact where it matters.
+    """
+
+    def __init__(self, db_path=GITHUB_CACHE_DB_PATH, max_bytes=GITHUB_CACHE_MAX_BYTES,
+                 access_flush_size=GITHUB_CACHE_ACCESS_FLUSH_SIZE, access_flush_seconds=GITHUB_CACHE_ACCESS_FLUSH_SECONDS):
+        self.max_bytes = max_bytes
+        self.access_flush_size = access_flush_size
+        self.access_flush_seconds = access_flush_seconds
+        self._accessed = {} # key -> last access time not yet written
+        self._accessed_flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        # Shared across the client's worker threads, guarded by self._lock
+        self.db = sqlite_utils.Database(sqlite3.connect(db_path, check_same_thread=False))
+        self.db["responses"].create({
+            "key": str,
+            "body": str,
+            "etag": str,
+            "last_modified": str,
+            "immutable": int,
+            "link": str,
+            "size": int,
+            "last_access": float,
+        }, pk="key", ignore=True)
+        if "link" not in self.db["responses"].columns_dict: # caches created before pagination support
+            self.db["responses"].add_column("link", str)
+        self.db["responses"].create_index(["last_access"], if_not_exists=True)
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        """Returns the cached entry for key (and marks it recently used), or None."""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT body, etag, last_modified, immutable, link FROM responses WHERE key = ?", [key]
+            ).fetchone()
+            if row is None:
+                return None
+            self._accessed[key] = time.time()
+            if (len(self._accessed) >= self.access_flush_size
+                    or time.monotonic() - self._accessed_flushed_at >= self.access_flush_seconds):
+                self._flush_access()
+                self.db.conn.commit()
+        return {"body": row[0], "etag": row[1], "last_modified": row[2], "immutable": bool(row[3]), "link": row[4]}
+
+    def put(self, key, body, etag=None, last_modified=None, immutable=False, link=None):
+        """Stores a response body and its validators, evicting least recently used entries if over budget."""
+        size = len(body.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", [key]).fetchone()
+            self.db["responses"].insert({
+                "key": key,
+                "body": body,
+                "etag": etag,
+                "last_modified": last_modified,
+                "immutable": int(immutable),
+                "link": link,
+                "size": size,
+                "last_access": time.time(),
+            }, replace=True)
+            self.total_bytes += size - (old[0] if old else 0)
+            self._accessed.pop(key, None)
+            self._evict()
+            self.db.conn.commit()
+
+    def record(self, outcome):
+        """Bumps one of the hit / revalidated / miss counters."""
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def _flush_access(self):
+        # Caller holds self._lock; one executemany for every read since the last flush
+        if self._accessed:
+            self.db.conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                     [(accessed_at, key) for key, accessed_at in self._accessed.items()])
+            self._accessed = {}
+        self._accessed_flushed_at = time.monotonic()
+
+    def flush(self):
+        """Writes buffered last-access times."""
+        with self._lock:
+            self._flush_access()
+            self.db.conn.commit()
+
+    def _evict(self):
+        # Caller holds self._lock
+        if self.total_bytes > self.max_bytes:
+            self._flush_access() # evict by true recency
+        while self.total_bytes > self.max_bytes:
+            oldest = self.db.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                self.total_bytes = 0
+                return
+            for key, size in oldest:
+                self.db.execute("DELETE FROM responses WHERE key = ?", [key])
+                self.total_bytes -= size
+                self.stats["evictions"] += 1
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with self._lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.conn.commit()
+            self._accessed = {}
+            self.total_bytes = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Returns the process-wide ResponseCache, or None when caching is disabled."""
+    global _cache
+    if not GITHUB_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+            atexit.register(_cache.flush) # keep the recency of reads since the last flush
+    return _cache
@@ -0,0 +1,258 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Request priorities: interactive /dev-report work always goes ahead of background refreshes
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Share of each credential's hourly budget that background requests may not spend
+GITHUB_BACKGROUND_RESERVE = float(os.getenv("GITHUB_BACKGROUND_RESERVE", "0.2"))
+# Wait used for secondary rate limits that come without a Retry-After header (GitHub asks for >= 60s)
+SECONDARY_LIMIT_BACKOFF_SECONDS = 60
+# Budget assumed for a credential before its first response reports the real numbers
+DEFAULT_RATE_LIMIT = 5000
+# SQLite file holding budgets shared by every process that points here (unset: budgets are per process)
+GITHUB_RATE_LIMIT_DB_PATH = os.getenv("GITHUB_RATE_LIMIT_DB_PATH")
+
+_priority = contextvars.ContextVar("github_request_priority", default=INTERACTIVE)
+
+@contextmanager
+def request_priority(priority):
+    """Runs the enclosed GitHub calls at the given priority (INTERACTIVE or BACKGROUND)."""
+    reset_token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(reset_token)
+
+def current_priority():
+    return _priority.get()
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is still rate limited after the scheduler's retries are used up."""
+
+
+class TokenBudget:
+    """Token bucket for one credential, refilled from X-RateLimit-* response headers."""
+
+    def __init__(self, token, limit=DEFAULT_RATE_LIMIT):
+        self.token = token
+        self.limit = limit
+        self.remaining = limit
+        self.reset_at = 0.0 # epoch seconds when `remaining` refills to `limit`
+        self.blocked_until = 0.0 # set by secondary limits / Retry-After
+        self.requests = 0
+        self.throttled = 0
+
+    @property
+    def label(self):
+        return f"...{self.token[-4:]}" if self.token else "anonymous"
+
+    def refresh(self, now):
+        if self.reset_at and now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = 0.0
+
+    def ready_at(self, now, reserve=0):
+        """Earliest time this credential can serve a request keeping `reserve` calls untouched."""
+        self.refresh(now)
+        if self.blocked_until > now:
+            return self.blocked_until
+        if self.remaining > reserve:
+            return now
+        return self.reset_at or now + SECONDARY_LIMIT_BACKOFF_SECONDS
+
+    def update(self, headers, now):
+        if "X-RateLimit-Limit" in headers:
+            self.limit = int(headers["X-RateLimit-Limit"])
+        if "X-RateLimit-Remaining" in headers:
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+        if "X-RateLimit-Reset" in headers:
+            self.reset_at = float(headers["X-RateLimit-Reset"])
+
+
+class SharedBudgets:
+    """
+    TokenBudget state kept in SQLite, so processes sharing credentials (org report workers, the bot)
+    draw from one budget per token instead of each assuming it has the whole hourly limit.
+
+    Every scheduling decision runs inside one IMMEDIATE transaction: budgets are loaded, chosen
+    from and written back atomically. Tokens are stored only as a hash.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_budgets (credential TEXT PRIMARY KEY, rate_limit INTEGER, "
+            "remaining INTEGER, reset_at REAL, blocked_until REAL)"
+        )
+        # An interactive request waiting in any process holds background requests off until this time
+        self.conn.execute("CREATE TABLE IF NOT EXISTS rate_limit_waiting (id INTEGER PRIMARY KEY CHECK (id = 1), until REAL)")
+
+    @staticmethod
+    def _credential(budget):
+        return hashlib.sha256((budget.token or "").encode()).hexdigest()[:16]
+
+    @contextmanager
+    def transaction(self, budgets):
+        """Loads the shared state into budgets and yields {"interactive_until"}; both are written back on exit."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = {row[0]: row[1:] for row in self.conn.execute("SELECT * FROM rate_limit_budgets")}
+            for budget in budgets:
+                if self._credential(budget) in rows:
+                    budget.limit, budget.remaining, budget.reset_at, budget.blocked_until = rows[self._credential(budget)]
+            (until,) = self.conn.execute("SELECT COALESCE(MAX(until), 0) FROM rate_limit_waiting").fetchone()
+            shared = {"interactive_until": until}
+            yield shared
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rate_limit_budgets VALUES (?, ?, ?, ?, ?)",
+                [(self._credential(b), b.limit, b.remaining, b.reset_at, b.blocked_until) for b in budgets],
+            )
+            if shared["interactive_until"] != until:
+                self.conn.execute("INSERT OR REPLACE INTO rate_limit_waiting VALUES (1, ?)", [shared["interactive_until"]])
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+
+class RequestScheduler:
+    """
+    Sends GitHub requests through a pool of credentials without tripping rate limits.
+
+    Each request is routed to the credential with the most budget left. When every credential is
+    exhausted (or a secondary limit / Retry-After is hit) the caller waits for the reset and the
+    request is retried instead of failing. Background requests leave a reserve of each budget for
+    interactive ones and yield to any interactive request that is waiting. With shared (a
+    SharedBudgets), budgets and waiting interactive requests are seen across processes.
+    """
+
+    def __init__(self, tokens, background_reserve=GITHUB_BACKGROUND_RESERVE, max_retries=5,
+                 clock=time.time, sleep=time.sleep, shared=None):
+        self.budgets = [TokenBudget(token) for token in (tokens or [None])]
+        self.shared = shared
+        # Fingerprint of the credential pool, so responses cached for one set of tokens are never served to another
+        self.identity = hashlib.sha256("\n".join(sorted(t or "" for t in (tokens or [None]))).encode()).hexdigest()[:16]
+        self.background_reserve = background_reserve
+        self.max_retries = max_retries
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._interactive_waiting = 0
+        self.total_wait_seconds = 0.0
+
+    def _state(self):
+        return self.shared.transaction(self.budgets) if self.shared else nullcontext({"interactive_until": 0.0})
+
+    def _reserve_for(self, budget, priority):
+        return int(budget.limit * self.background_reserve) if priority == BACKGROUND else 0
+
+    def acquire(self, priority=INTERACTIVE):
+        """Blocks until a credential may send a request at this priority, then returns its budget."""
+        registered = False
+        try:
+            while True:
+                with self._lock, self._state() as state:
+                    now = self.clock()
+                    if priority == BACKGROUND and (self._interactive_waiting or state["interactive_until"] > now):
+                        wait_until = now + 0.05
+                    else:
+                        budget = max(self.budgets, key=lambda b: (b.ready_at(now, self._reserve_for(b, priority)) <= now, b.remaining))
+                        wait_until = min(b.ready_at(now, self._reserve_for(b, priority)) for b in self.budgets)
+                        if budget.ready_at(now, self._reserve_for(budget, priority)) <= now:
+                            budget.remaining -= 1 # optimistic; corrected from the response headers
+                            budget.requests += 1
+                            return budget
+                    if priority == INTERACTIVE:
+                        # Other processes' background requests hold off until just after this one may go
+                        state["interactive_until"] = max(state["interactive_until"], wait_until + 1)
+                        if not registered:
+                            self._interactive_waiting += 1
+                            registered = True
+                delay = max(wait_until - now, 0.01)
+                with self._lock:
+                    self.total_wait_seconds += delay
+                self.sleep(delay)
+        finally:
+            if registered:
+                with self._lock:
+                    self._interactive_waiting -= 1
+
+    def record(self, budget, response):
+        """
+        Feeds a response's rate-limit headers back into its credential's budget.
+
+        Returns True if the response was a rate-limit rejection that should be retried.
+        """
+        with self._lock, self._state():
+            now = self.clock()
+            budget.update(response.headers, now)
+            if response.status_code not in (403, 429):
+                return False
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is not None:
+                budget.blocked_until = now + float(retry_after)
+            elif budget.remaining == 0 and budget.reset_at:
+                budget.blocked_until = budget.reset_at
+            elif "rate limit" in (response.text or "").lower():
+                budget.blocked_until = now + SECONDARY_LIMIT_BACKOFF_SECONDS
+            else:
+                return False # a genuine permission error, not throttling
+            budget.throttled += 1
+            return True
+
+    def request(self, session, method, url, priority=None, headers=None, **kwargs):
+        """Sends one request via session, waiting out rate limits and rotating credentials as needed."""
+        priority = current_priority() if priority is None else priority
+        for _attempt in range(self.max_retries + 1):
+            budget = self.acquire(priority)
+            request_headers = dict(headers or {})
+            if budget.token:
+                request_headers["Authorization"] = f"Bearer {budget.token}"
+            res = session.request(method, url, headers=request_headers, **kwargs)
+            if not self.record(budget, res):
+                return res
+        raise RateLimitExceeded(f"GitHub rate limit still exceeded after {self.max_retries} retries: {url}")
+
+    def metrics(self):
+        """Remaining-budget snapshot per credential, plus total time spent waiting on limits."""
+        with self._lock, self._state():
+            now = self.clock()
+            for budget in self.budgets:
+                budget.refresh(now)
+            return {
+                "credentials": [
+                    {
+                        "token": budget.label,
+                        "remaining": budget.remaining,
+                        "limit": budget.limit,
+                        "reset_in_seconds": max(budget.reset_at - now, 0) if budget.reset_at else None,
+                        "blocked_for_seconds": max(budget.blocked_until - now, 0),
+                        "requests": budget.requests,
+                        "throttled": budget.throttled,
+                    }
+                    for budget in self.budgets
+                ],
+                "total_remaining": sum(budget.remaining for budget in self.budgets),
+                "interactive_waiting": self._interactive_waiting,
+                "total_wait_seconds": round(self.total_wait_seconds, 3),
+            }
+
+
+def tokens_from_env():
+    """GITHUB_TOKENS (comma-separated) enables rotation; otherwise the single GITHUB_TOKEN is used."""
+    tokens = [t.strip() for t in os.getenv("GITHUB_TOKENS", "").split(",") if t.strip()]
+    if not tokens and os.getenv("GITHUB_TOKEN"):
+        tokens = [os.getenv("GITHUB_TOKEN")]
+    return tokens
@@ -3,8 +3,9 @@
 # The DataHarvester node collects data, the DiffAnalyst node analyzes differences, and the InsightNarrator node generates insights.
 
 from langgraph.graph import StateGraph
-from agents.data_harvester import DataHarvester
+from agents.data_harvester import DataHarvester, HARVEST_MAX_STALENESS_SECONDS
 from agents.diff_analyst import DiffAnalyst
+from agents.prompt_compactor import PromptCompactor
 from agents.insight_narrator import InsightNarrator
 
 class StateSchema:
@@ -13,17 +14,29 @@ class StateSchema:
         self.diffs = diffs or []
         self.insights = insights or []
 
-def build_graph(owner, repo, report_author_name="Ranjith Surineni", report_author_position="Engineering Analyst"):
+def build_graph(owner, repo, report_author_name="Ranjith Surineni", report_author_position="Engineering Analyst",
+                max_staleness_seconds=HARVEST_MAX_STALENESS_SECONDS, bypass_narration_cache=False, narrate=True,
+                narrator=None, window_days=7):
+    # DB-first: within max_staleness_seconds of the last harvest the analysis input comes straight from SQLite
     graph = StateGraph(state_schema=dict)
     
-    graph.add_node("harvest", DataHarvester(owner, repo).run)
+    graph.add_node("harvest", DataHarvester(owner, repo, window_days=window_days, max_staleness_seconds=max_staleness_seconds).run)
     graph.add_node("analyze", DiffAnalyst().run)
-    graph.add_node("narrate", InsightNarrator(report_author_name, report_author_position).run)
+    graph.add_node("compact", PromptCompactor().run) # bounds the LLM input regardless of commit volume
 
     graph.set_entry_point("harvest")
     graph.add_edge("harvest", "analyze")
-    graph.add_edge("analyze", "narrate")
-    graph.set_finish_point("narrate")
+    graph.add_edge("analyze", "compact")
+
+    # narrate=False stops after analysis and compaction, e.g. so the Slack bot can post metrics first and stream the narration
+    if narrate:
+        # Narrators share one LLM client and prompt template, so building one per graph is cheap; callers may pass their own
+        narrator = narrator or InsightNarrator(report_author_name, report_author_position, bypass_cache=bypass_narration_cache)
+        graph.add_node("narrate", narrator.run)
+        graph.add_edge("compact", "narrate")
+        graph.set_finish_point("narrate")
+    else:
+        graph.set_finish_point("compact")
 
     return graph
 
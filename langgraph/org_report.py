@@ -0,0 +1,164 @@
+# Org-level batch report: harvest and analyze many repos in a process pool, then reduce to org / team summaries.
+
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Worker processes for the batch (each harvests + analyzes one repo at a time)
+ORG_MAX_WORKERS = int(os.getenv("ORG_MAX_WORKERS", str(os.cpu_count() or 4)))
+
+
+def _rate_limit_db_path():
+    """The SQLite file through which workers share GitHub budgets (GITHUB_RATE_LIMIT_DB_PATH, else next to the store)."""
+    default = os.path.join(os.path.dirname(os.getenv("SQLITE_DB_PATH", "fika_ai_db.sqlite")), "github_rate_limit.sqlite")
+    return os.getenv("GITHUB_RATE_LIMIT_DB_PATH") or default
+
+
+def _init_worker(rate_limit_db_path):
+    # One budget per token across all workers, instead of each process assuming it has the whole limit
+    from github import github_client
+    github_client.share_rate_limits(rate_limit_db_path)
+
+
+def analyze_repo(full_name, window_days=7, max_staleness_seconds=None):
+    """
+    Harvests and analyzes one "owner/repo" (runs inside a worker process).
+
+    Returns the DiffAnalyst result plus the repo's MetricsAccumulator state for the reduce step;
+    any failure is returned as {"repo", "error"} so one bad repo never sinks the batch. GitHub calls
+    run at background priority, leaving the interactive reserve to /dev-report requests.
+    """
+    # Imported here so spawned workers only pay for what they use
+    from agents.data_harvester import DataHarvester, HARVEST_MAX_STALENESS_SECONDS
+    from agents.diff_analyst import DiffAnalyst
+    from agents.metrics_accumulator import MetricsAccumulator
+    from github.rate_limiter import BACKGROUND, request_priority
+    from store.db import flush_logs
+
+    started_at = time.time()
+    try:
+        owner, repo = full_name.split("/", 1)
+        if max_staleness_seconds is None:
+            max_staleness_seconds = HARVEST_MAX_STALENESS_SECONDS
+        with request_priority(BACKGROUND):
+            state = DataHarvester(owner, repo, window_days=window_days, max_staleness_seconds=max_staleness_seconds).run({})
+        state = DiffAnalyst().run(state)
+        accumulator = MetricsAccumulator()
+        accumulator.add_commits(state["commit_diff_data"], full_name)
+        accumulator.add_pull_requests(state["pull_request_details"], full_name)
+        accumulator.add_churn_signals(state["analysis"], full_name)
+        return {
+            "repo": full_name,
+            "analysis": state["analysis"],
+            "accumulator": accumulator.to_dict(),
+            "seconds": round(time.time() - started_at, 2),
+        }
+    except Exception as e:
+        return {"repo": full_name, "error": f"{type(e).__name__}: {e}", "seconds": round(time.time() - started_at, 2)}
+    finally:
+        flush_logs()
+
+
+def print_progress(done, total, outcome):
+    status = "✅" if "error" not in outcome else f"❌ {outcome['error']}"
+    print(f"📦 [{done}/{total}] {outcome['repo']} {status} ({outcome.get('seconds', 0)}s)")
+
+
+def reduce_outcomes(outcomes, teams=None):
+    """Merges per-repo accumulators into an org summary and one summary per team ({team: [repos]})."""
+    from agents.diff_analyst import DiffAnalyst
+    from agents.metrics_accumulator import MetricsAccumulator
+
+    analyst = DiffAnalyst()
+    partials = {
+        outcome["repo"]: MetricsAccumulator.from_dict(outcome["accumulator"])
+        for outcome in outcomes if "error" not in outcome
+    }
+
+    def summarize(repos):
+        merged = MetricsAccumulator()
+        for repo in sorted(repos): # fixed order, so the org numbers don't depend on completion order
+            if repo in partials:
+                merged = merged.merge(partials[repo])
+        return analyst.summarize_accumulator(merged)
+
+    return {
+        "org": summarize(partials),
+        "teams": {team: summarize(repos) for team, repos in (teams or {}).items()},
+        "repos": {outcome["repo"]: outcome["analysis"] for outcome in outcomes if "error" not in outcome},
+        "failed": {outcome["repo"]: outcome["error"] for outcome in outcomes if "error" in outcome},
+    }
+
+
+def run_org_report(repos, teams=None, max_workers=ORG_MAX_WORKERS, window_days=7, max_staleness_seconds=None,
+                   progress=print_progress):
+    """
+    Harvests and analyzes every "owner/repo" in repos across a process pool and reduces the results.
+
+    progress(done, total, outcome) is called as each repo finishes (None to stay quiet). Workers
+    are spawned rather than forked, so no SQLite connection or thread is shared with the parent;
+    their GitHub budgets are shared through SQLite instead (see github.rate_limiter.SharedBudgets).
+    """
+    repos = list(dict.fromkeys(repos))
+    outcomes = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker,
+                             initargs=(_rate_limit_db_path(),)) as pool:
+        futures = {pool.submit(analyze_repo, repo, window_days, max_staleness_seconds): repo for repo in repos}
+        for future in as_completed(futures):
+            try:
+                outcome = future.result()
+            except Exception as e: # e.g. a worker process died
+                outcome = {"repo": futures[future], "error": f"{type(e).__name__}: {e}"}
+            outcomes.append(outcome)
+            if progress:
+                progress(len(outcomes), len(repos), outcome)
+    return reduce_outcomes(outcomes, teams)
+
+
+def narrate_report(report, report_author_name="FikaDevBot", report_author_position="Engineering Analyst", narrator=None):
+    """
+    Adds report["narratives"]: one LLM summary for the org and one per team, narrated as a concurrent batch,
+    and report["narration_stats"] (see get_narration_stats).
+    """
+    from agents.insight_narrator import InsightNarrator, get_narration_stats
+    from agents.prompt_compactor import PromptCompactor
+
+    narrator = narrator or InsightNarrator(report_author_name, report_author_position)
+    compactor = PromptCompactor()
+    names = ["org", *report["teams"]]
+    analyses = [report["org"], *report["teams"].values()]
+    states = [compactor.run({"analysis": analysis}) for analysis in analyses]
+    narrated = narrator.run_batch(states)
+    report["narratives"] = {
+        "org": narrated[0]["summary"],
+        "teams": {name: state["summary"] for name, state in zip(names[1:], narrated[1:])},
+    }
+    report["narration_stats"] = get_narration_stats() # how many narratives fell back to the template
+    return report
+
+
+if __name__ == "__main__":
+    # python -m langgraph.org_report owner/repo-a owner/repo-b --teams teams.json --workers 16 [--narrate]
+    parser = argparse.ArgumentParser(description="FikaDevBot org-wide batch report")
+    parser.add_argument("repos", nargs="+", help="owner/repo names")
+    parser.add_argument("--teams", help='JSON file mapping team name to repos, e.g. {"payments": ["acme/api"]}')
+    parser.add_argument("--workers", type=int, default=ORG_MAX_WORKERS)
+    parser.add_argument("--window-days", type=int, default=7)
+    parser.add_argument("--narrate", action="store_true", help="add an LLM narrative for the org and each team")
+    args = parser.parse_args()
+
+    teams = None
+    if args.teams:
+        with open(args.teams) as f:
+            teams = json.load(f)
+    report = run_org_report(args.repos, teams=teams, max_workers=args.workers, window_days=args.window_days)
+    if args.narrate:
+        narrate_report(report, os.getenv("REPORT_AUTHOR_NAME", "FikaDevBot"), os.getenv("REPORT_AUTHOR_POSITION", "Engineering Analyst"))
+    print(json.dumps(report, indent=2, default=str))
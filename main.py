@@ -2,7 +2,7 @@ import os
 from dotenv import load_dotenv
 from seed.seed_data import seed_fake_data
 from langgraph.graph_flow import build_graph
-from bot.slack_bot import app
+from bot.slack_bot import app, report_queue
 
 print("Script started")
 # Load environment variables
@@ -34,9 +34,18 @@ try:
 except Exception as e:
     print(f"⚠️  LangGraph error: {e}")
 
+# === Start GitHub webhook receiver (optional) ===
+if os.getenv("GITHUB_WEBHOOK_SECRET"):
+    try:
+        from bot.github_webhook import start_webhook_server
+        start_webhook_server()
+    except Exception as e:
+        print(f"⚠️  GitHub webhook receiver not started: {e}")
+
 # === Start Slack Bot ===
 try:
     print("💬 Starting Slack bot on port 3000...")
+    report_queue.start() # resumes jobs persisted before a restart
     app.start(port=3000)
 except Exception as e:
     print(f"❌ Slack bot failed to start: {e}")
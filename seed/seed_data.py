@@ -10,6 +10,9 @@ load_dotenv()
 # Moved DB connection setup to store/db.py for reusability
 from store.db import get_db_connection, save_commits, save_pull_requests
 
+# Demo rows get their own repo so they never mix with a harvested repo's data
+SEED_REPO = os.getenv("SEED_REPO", "demo/seed")
+
 def seed_fake_commits():
     # Using save_commits from store/db.py
     fake_data = []
@@ -29,7 +32,7 @@ def seed_fake_commits():
             "deletions": deletions,
             "files_changed": files_changed,
         })
-    save_commits(fake_data)
+    save_commits(fake_data, repo=SEED_REPO)
     print(f"✅ Seeded {len(fake_data)} fake commits.")
 
 def seed_fake_pull_requests(): # <-- NEW FUNCTION
@@ -75,7 +78,7 @@ def seed_fake_pull_requests(): # <-- NEW FUNCTION
             "changed_files": changed_files,
             "first_review_at": first_review_at.isoformat() if first_review_at else None,
         })
-    save_pull_requests(fake_data)
+    save_pull_requests(fake_data, repo=SEED_REPO)
     print(f"✅ Seeded {len(fake_data)} fake pull requests.")
 
 
@@ -1,26 +1,84 @@
 import os
+import json
+import time
+import zlib
+import queue
+import atexit
+import contextlib
+import hashlib
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import sqlite_utils
+from store.rollups import create_rollup_tables, apply_commit_changes, apply_pull_request_changes, rebuild_rollups, load_sketch
+from store.hotspots import create_hotspot_tables, apply_file_changes, hotspot_files, hotspot_directories, cochanged_files
+from store.jobs import create_job_tables
+
+try:
+    import zstandard # optional: better ratio/speed than zlib for large log payloads
+except ImportError:
+    zstandard = None
 
 load_dotenv()
 
-def get_db_connection():
-    """Create and return a new SQLite database connection using .env variables."""
-    db_path = os.getenv("SQLITE_DB_PATH", "fika_ai_db.sqlite")
-    db = sqlite_utils.Database(db_path)
-    
+# Log events are buffered and written in one transaction per batch
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("LOG_FLUSH_INTERVAL_SECONDS", "0.5"))
+# Payloads at least this large are stored compressed
+LOG_COMPRESS_MIN_BYTES = int(os.getenv("LOG_COMPRESS_MIN_BYTES", "1024"))
+
+# Repo that rows written before the multi-repo schema (or seeded without one) are attributed to
+DEFAULT_REPO = f"{os.getenv('GITHUB_OWNER', 'octocat')}/{os.getenv('GITHUB_REPO', 'Hello-World')}"
+
+_local = threading.local() # per-thread connections, keyed by database path
+_initialized_paths = set()
+_schema_lock = threading.Lock()
+
+def get_db_connection(db_path=None):
+    """
+    Return this thread's SQLite connection for db_path (default: SQLITE_DB_PATH).
+
+    Connections are opened once per thread and reused; the schema and WAL mode are set up
+    once per database file, so WAL readers never block on a concurrent writer.
+    """
+    db_path = db_path or os.getenv("SQLITE_DB_PATH", "fika_ai_db.sqlite")
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    db = connections.get(db_path)
+    if db is None:
+        # timeout: wait for another thread's write lock instead of failing with "database is locked"
+        db = sqlite_utils.Database(sqlite3.connect(db_path, timeout=30))
+        with _schema_lock:
+            if db_path not in _initialized_paths:
+                # Must precede the first write (switching to WAL included) to take effect without a full VACUUM;
+                # lets compact_logs() hand freed pages back with incremental_vacuum
+                db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                db.enable_wal()
+                _create_schema(db)
+                _initialized_paths.add(db_path)
+        db.execute("PRAGMA synchronous=NORMAL") # safe with WAL, avoids an fsync per commit
+        connections[db_path] = db
+    return db
+
+def _create_schema(db):
     # Ensure the 'commits' table exists (already handled by seed_data, but good practice)
+    # Keyed on (repo, sha) so one database can hold many repositories
     db["commits"].create({
+        "repo": str, # "owner/repo"
         "sha": str,
         "author": str,
         "date": str,
         "additions": int,
         "deletions": int,
         "files_changed": int,
-    }, pk="sha", ignore=True)
+    }, pk=("repo", "sha"), not_null={"repo"}, ignore=True)
 
     # Ensure the 'pull_requests' table exists <-- NEW TABLE
     db["pull_requests"].create({
+        "repo": str,
         "number": int,
         "title": str,
         "state": str,
@@ -32,9 +90,92 @@ def get_db_connection():
         "deletions": int,
         "changed_files": int,
         "first_review_at": str, # Store as string for simplicity
-    }, pk="number", ignore=True) # PR number as primary key
+        "updated_at": str,
+    }, pk=("repo", "number"), not_null={"repo"}, ignore=True) # PR numbers are only unique within a repo
+
+    # Columns added after the first release; older database files get them on open
+    for table, column in (("commits", "repo"), ("pull_requests", "repo"), ("pull_requests", "updated_at")):
+        if column not in db[table].columns_dict:
+            db[table].add_column(column, str)
+    _migrate_to_repo_scoped_keys(db)
+
+    # Per-repo store insertion order, kept when a row is replaced; MetricsAccumulator folds rows past a seq
+    # watermark, so late-harvested (older-dated) commits and PRs are counted exactly once
+    for table, order in (("commits", "date, sha"), ("pull_requests", "created_at, number")):
+        if "seq" not in db[table].columns_dict:
+            db[table].add_column("seq", int)
+            with db.conn:
+                db.execute(
+                    f"UPDATE {table} SET seq = numbered.n FROM (SELECT rowid AS id, "
+                    f"ROW_NUMBER() OVER (PARTITION BY repo ORDER BY {order}) AS n FROM {table}) AS numbered "
+                    f"WHERE {table}.rowid = numbered.id"
+                )
+        db[table].create_index(["repo", "seq"], if_not_exists=True)
+        db.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_seq AFTER INSERT ON {table} WHEN NEW.seq IS NULL BEGIN "
+            f"UPDATE {table} SET seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM {table} WHERE repo = NEW.repo) "
+            "WHERE rowid = NEW.rowid; END"
+        )
+
+    # Indexes backing the windowed iter_stored_commits / iter_stored_pull_requests queries
+    db["commits"].create_index(["repo", "date"], if_not_exists=True)
+    db["commits"].create_index(["author", "date"], if_not_exists=True)
+    db["pull_requests"].create_index(["merged_at"], if_not_exists=True)
+    db["pull_requests"].create_index(["created_at"], if_not_exists=True)
+    db["pull_requests"].create_index(["author"], if_not_exists=True)
+
+    # Daily churn / weekly PR rollups, maintained incrementally by the save/upsert helpers below
+    needs_backfill = not {"rollup_daily_churn", "rollup_sketches"} <= set(db.table_names())
+    create_rollup_tables(db)
+    if needs_backfill and (db["commits"].count or db["pull_requests"].count):
+        rebuild_rollups(db)
+
+    # File hotspot index (interned paths, weekly per-file churn, co-change pairs), fed by commits saved with file lists
+    create_hotspot_tables(db)
 
-    # Ensure the 'logs' table exists
+    # Per-repo high-water marks used by incremental harvesting
+    db["harvest_state"].create({
+        "repo": str,
+        "last_commit_date": str,
+        "last_commit_sha": str,
+        "last_pr_updated_at": str,
+        "last_harvested_at": str,
+        "covered_since": str, # the store holds every commit/PR from here on ("" = whole history, NULL = unknown)
+        "commits_fetched_at": str, # when the last harvest listed commits; the next one re-lists from shortly before
+    }, pk="repo", ignore=True)
+    for column in ("covered_since", "commits_fetched_at"):
+        if column not in db["harvest_state"].columns_dict:
+            db["harvest_state"].add_column(column, str)
+
+    # Commit author email -> GitHub login, learned from API commit payloads; lets the git backend report logins too
+    db["author_logins"].create({
+        "email": str,
+        "login": str, # NULL: the email belongs to no GitHub account
+        "updated_at": str,
+    }, pk="email", ignore=True)
+
+    # Persisted MetricsAccumulator states (JSON), keyed by e.g. "owner/repo"
+    db["metric_accumulators"].create({
+        "key": str,
+        "state": str,
+        "updated_at": str,
+    }, pk="key", ignore=True)
+
+    # Persistent /dev-report job queue and the Slack requesters waiting on each job
+    create_job_tables(db)
+
+    # InsightNarrator output cache, keyed on a hash of the canonical metrics, model, prompt version and author fields
+    db["narration_cache"].create({
+        "key": str,
+        "summary": str,
+        "model": str,
+        "size": int,
+        "created_at": float,
+        "last_access": float,
+    }, pk="key", ignore=True)
+    db["narration_cache"].create_index(["last_access"], if_not_exists=True)
+
+    # Legacy str(state) log table; kept readable for old databases, no longer written to
     db["logs"].create({
         "agent_name": str,
         "action": str,
@@ -42,34 +183,523 @@ def get_db_connection():
         "output_data": str,
     }, pk=None, not_null={"agent_name", "action"}, ignore=True)
 
-    return db
+    # Structured run log: one row per agent step, payloads stored once by content hash
+    db["log_events"].create({
+        "id": int,
+        "run_id": str,
+        "node": str,
+        "action": str,
+        "started_at": str,
+        "finished_at": str,
+        "duration_ms": float,
+        "input_hash": str,
+        "output_hash": str,
+    }, pk="id", not_null={"node", "action"}, ignore=True)
+    db["log_events"].create_index(["run_id"], if_not_exists=True)
+    db["log_events"].create_index(["finished_at"], if_not_exists=True)
+
+    db["log_payloads"].create({
+        "hash": str,
+        "encoding": str, # "json", "zlib" or "zstd"
+        "size": int, # uncompressed bytes
+        "body": bytes,
+    }, pk="hash", ignore=True)
+
+
+def _migrate_to_repo_scoped_keys(db, default_repo=DEFAULT_REPO):
+    """
+    Re-keys single-repo databases (commits on sha, pull_requests on number) to (repo, sha) / (repo, number).
+
+    Rows without a repo are attributed to default_repo, and the rollups are rebuilt to match.
+    """
+    migrated = False
+    for table, key in (("commits", "sha"), ("pull_requests", "number")):
+        if db[table].pks == ["repo", key]:
+            continue
+        with db.conn:
+            db.execute(f"UPDATE {table} SET repo = ? WHERE repo IS NULL OR repo = ''", [default_repo])
+        db[table].transform(pk=("repo", key), not_null={"repo"}, column_order=("repo", key))
+        migrated = True
+    if migrated:
+        print(f"✅ Migrated commits/pull_requests to repo-scoped keys (legacy rows -> {default_repo}).")
+        if "rollup_daily_churn" in db.table_names():
+            rebuild_rollups(db)
 
-def log_event(agent_name, action, input_data, output_data):
+def _iso_utc(epoch_seconds):
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).isoformat(timespec="milliseconds")
+
+def _encode_payload(data):
+    """Serializes a payload canonically and returns (content hash, encoding, raw size, stored bytes)."""
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()
+    if len(raw) < LOG_COMPRESS_MIN_BYTES:
+        return digest, "json", len(raw), raw
+    if zstandard is not None:
+        return digest, "zstd", len(raw), zstandard.ZstdCompressor().compress(raw)
+    return digest, "zlib", len(raw), zlib.compress(raw, 6)
+
+def _add_payload(payloads, data):
+    if data is None:
+        return None
+    digest, encoding, size, body = _encode_payload(data)
+    payloads.setdefault(digest, {"hash": digest, "encoding": encoding, "size": size, "body": body})
+    return digest
+
+def load_log_payload(payload_hash):
+    """Returns the decoded payload stored under payload_hash, or None."""
+    row = get_db_connection().execute(
+        "SELECT encoding, body FROM log_payloads WHERE hash = ?", [payload_hash]
+    ).fetchone()
+    if row is None:
+        return None
+    encoding, body = row
+    if encoding == "zlib":
+        body = zlib.decompress(body)
+    elif encoding == "zstd":
+        body = zstandard.ZstdDecompressor().decompress(body)
+    return json.loads(body)
+
+def _snapshot(data):
+    # Agents mutate their state dicts after logging, so copy the top level before handing it to the writer thread
+    if isinstance(data, dict):
+        return dict(data)
+    if isinstance(data, list):
+        return list(data)
+    return data
+
+class LogWriter:
+    """Background writer that batches log events and inserts each batch in a single transaction."""
+
+    _FLUSH = object() # queue marker: write what has been collected now
+
+    def __init__(self, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL_SECONDS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, db_path, event):
+        self._queue.put((db_path, event))
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            try:
+                # A flush marker ends the batch early so flush() never waits out the interval
+                while len(items) < self.batch_size and items[-1] is not self._FLUSH:
+                    items.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                pass
+            batch = [item for item in items if item is not self._FLUSH]
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception as e:
+                print(f"❌ Failed to log {len(batch)} events: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        by_path = {}
+        for db_path, event in batch:
+            events, payloads = by_path.setdefault(db_path, ([], {}))
+            agent_name, action, input_data, output_data, run_id, started_at, finished_at = event
+            input_hash = _add_payload(payloads, input_data)
+            output_hash = _add_payload(payloads, output_data)
+            events.append({
+                "run_id": run_id,
+                "node": agent_name,
+                "action": action,
+                "started_at": _iso_utc(started_at or finished_at),
+                "finished_at": _iso_utc(finished_at),
+                "duration_ms": round((finished_at - started_at) * 1000, 3) if started_at else None,
+                "input_hash": input_hash,
+                "output_hash": output_hash,
+            })
+        for db_path, (events, payloads) in by_path.items():
+            db = get_db_connection(db_path)
+            with db.conn:
+                # Identical payloads (e.g. the same commit list logged by several agents) are stored once
+                db["log_payloads"].insert_all(payloads.values(), pk="hash", ignore=True)
+                db["log_events"].insert_all(events)
+
+    def flush(self):
+        """Blocks until every event submitted so far has been written."""
+        self._queue.put(self._FLUSH)
+        self._queue.join()
+
+
+_log_writer = None
+_log_writer_lock = threading.Lock()
+
+def _get_log_writer():
+    global _log_writer
+    if _log_writer is None:
+        with _log_writer_lock:
+            if _log_writer is None:
+                _log_writer = LogWriter()
+                atexit.register(_log_writer.flush) # don't lose buffered events at shutdown
+    return _log_writer
+
+def log_event(agent_name, action, input_data, output_data, run_id=None, started_at=None):
+    """
+    Queues a structured log event for the background writer; the caller never waits on SQLite.
+
+    started_at (epoch seconds, e.g. time.time() when the step began) gives the event a duration.
+    """
+    db_path = os.getenv("SQLITE_DB_PATH", "fika_ai_db.sqlite")
+    event = (agent_name, action, _snapshot(input_data), _snapshot(output_data), run_id, started_at, time.time())
+    _get_log_writer().submit(db_path, event)
+
+def flush_logs():
+    """Writes out any buffered log events (used at shutdown and by tests)."""
+    if _log_writer is not None:
+        _log_writer.flush()
+
+def compact_logs(max_age_days=30, vacuum_pages=1000):
+    """
+    Prunes run-log events older than max_age_days, drops payloads no longer referenced,
+    and returns up to vacuum_pages freed pages to the filesystem via incremental vacuum.
+    """
+    flush_logs()
     db = get_db_connection()
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=max_age_days)).isoformat(timespec="milliseconds")
+    with db.conn:
+        events = db.execute("DELETE FROM log_events WHERE finished_at < ?", [cutoff]).rowcount
+        payloads = db.execute(
+            "DELETE FROM log_payloads WHERE hash NOT IN ("
+            "SELECT input_hash FROM log_events WHERE input_hash IS NOT NULL "
+            "UNION SELECT output_hash FROM log_events WHERE output_hash IS NOT NULL)"
+        ).rowcount
+
+    if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        # Databases created before incremental auto-vacuum need one full VACUUM to switch modes
+        db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        db.execute("VACUUM")
+    else:
+        db.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})")
+    print(f"✅ Pruned {events} log events and {payloads} payloads older than {max_age_days} days.")
+    return {"events_deleted": events, "payloads_deleted": payloads}
+
+
+@contextlib.contextmanager
+def _write_transaction(db):
+    """
+    One transaction around a read-modify-write upsert: the old-row read, the row writes and every rollup delta.
+
+    BEGIN IMMEDIATE takes the write lock before the first SELECT, so no other writer can change the rows
+    between reading them and backing out their contribution; any failure rolls back the rows with the rollups.
+    Inside an open transaction it nests as a savepoint.
+    """
+    if db.conn.in_transaction:
+        with db.atomic():
+            yield db
+        return
+    db.execute("BEGIN IMMEDIATE")
     try:
-        db["logs"].insert({
-            "agent_name": agent_name,
-            "action": action,
-            "input_data": str(input_data),
-            "output_data": str(output_data)
-        })
-    except Exception as e:
-        print(f"❌ Failed to log event: {e}")
+        yield db
+        db.execute("COMMIT")
+    except BaseException:
+        db.conn.rollback()
+        raise
+
+def _existing_rows(db, table, key, repo_keys, chunk_size=500):
+    """
+    Fetches the stored rows an upsert is about to replace, so rollups can back out their contribution.
+
+    repo_keys is an iterable of (repo, key value) pairs.
+    """
+    by_repo = {}
+    for repo, value in repo_keys:
+        by_repo.setdefault(repo, []).append(value)
+    rows = []
+    for repo, values in by_repo.items():
+        for i in range(0, len(values), chunk_size):
+            chunk = values[i:i + chunk_size]
+            sql = f"SELECT * FROM {table} WHERE repo = ? AND {key} IN ({', '.join('?' for _ in chunk)})"
+            rows.extend(db.query(sql, [repo, *chunk]))
+    return rows
+
+def _with_repo(rows, repo):
+    # Rows may name their repo themselves; otherwise they belong to `repo` (or DEFAULT_REPO)
+    return [row if row.get("repo") else dict(row, repo=repo or DEFAULT_REPO) for row in rows]
+
+def _keep_seq(rows, old_rows, key):
+    # seq is owned by the store: a replaced row keeps its original insertion order, a new one gets the next (trigger)
+    seqs = {(row["repo"], row[key]): row.get("seq") for row in old_rows}
+    return [dict(row, seq=seqs.get((row["repo"], row[key]))) for row in rows]
 
 # New function to save pull request data <-- NEW FUNCTION
-def save_pull_requests(prs_data):
+def save_pull_requests(prs_data, repo=None):
     db = get_db_connection()
     try:
-        db["pull_requests"].insert_all(prs_data, pk="number", replace=True)
+        prs_data = _with_repo(prs_data, repo)
+        with _write_transaction(db):
+            old_rows = _existing_rows(db, "pull_requests", "number", [(pr["repo"], pr["number"]) for pr in prs_data])
+            prs_data = _keep_seq(prs_data, old_rows, "number")
+            db["pull_requests"].insert_all(prs_data, pk=("repo", "number"), replace=True, alter=True)
+            apply_pull_request_changes(db, old_rows, prs_data)
         print(f"✅ Saved {len(prs_data)} pull requests to DB.")
+        return True
     except Exception as e:
         print(f"❌ Failed to save pull requests: {e}")
+        return False
 
 # New function to save commits data <-- NEW FUNCTION (can replace part of seed_fake_commits)
-def save_commits(commits_data):
+def save_commits(commits_data, repo=None):
     db = get_db_connection()
     try:
-        db["commits"].insert_all(commits_data, pk="sha", replace=True)
+        commits_data = _with_repo(commits_data, repo)
+        # Optional per-file [path, additions, deletions] lists go to the hotspot index, not the commits table
+        file_lists = [{"sha": c["sha"], "date": c.get("date"), "file_changes": c.get("file_changes")} for c in commits_data]
+        commits_data = [{k: v for k, v in c.items() if k != "file_changes"} for c in commits_data]
+        with _write_transaction(db):
+            old_rows = _existing_rows(db, "commits", "sha", [(c["repo"], c["sha"]) for c in commits_data])
+            commits_data = _keep_seq(commits_data, old_rows, "sha")
+            db["commits"].insert_all(commits_data, pk=("repo", "sha"), replace=True, alter=True)
+            apply_commit_changes(db, old_rows, commits_data)
+            for commit_repo in {c["repo"] for c in commits_data}:
+                apply_file_changes(db, commit_repo, [f for f, c in zip(file_lists, commits_data) if c["repo"] == commit_repo],
+                                   stored={row["sha"] for row in old_rows if row["repo"] == commit_repo})
         print(f"✅ Saved {len(commits_data)} commits to DB.")
+        return True
     except Exception as e:
         print(f"❌ Failed to save commits: {e}")
+        return False
+
+
+def list_repos():
+    """Every "owner/repo" with stored commits or pull requests, for org-wide reporting."""
+    sql = "SELECT repo FROM commits UNION SELECT repo FROM pull_requests ORDER BY repo"
+    return [row[0] for row in get_db_connection().execute(sql)]
+
+def get_harvest_state(repo):
+    """Returns the high-water marks recorded for an "owner/repo", or None if it was never harvested."""
+    db = get_db_connection()
+    try:
+        return db["harvest_state"].get(repo)
+    except sqlite_utils.db.NotFoundError:
+        return None
+
+def save_harvest_state(repo, state):
+    db = get_db_connection()
+    db["harvest_state"].upsert(dict(state, repo=repo), pk="repo")
+
+def save_author_logins(logins):
+    """Records {email: GitHub login or None} pairs seen in commit payloads."""
+    if not logins:
+        return
+    db = get_db_connection()
+    updated_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    with db.conn:
+        db["author_logins"].upsert_all(
+            [{"email": email.lower(), "login": login, "updated_at": updated_at} for email, login in logins.items()], pk="email"
+        )
+
+def get_author_logins(emails):
+    """Returns {email: login or None} for the emails whose GitHub login is known (lower-cased emails)."""
+    emails = list({email.lower() for email in emails if email})
+    found = {}
+    for i in range(0, len(emails), 500):
+        chunk = emails[i:i + 500]
+        sql = f"SELECT email, login FROM author_logins WHERE email IN ({', '.join('?' for _ in chunk)})"
+        found.update(get_db_connection().execute(sql, chunk).fetchall())
+    return found
+
+def get_known_commit_shas(repo, shas):
+    """Returns the subset of shas already stored for repo (looked up 500 at a time, under SQLite's bound-parameter limit)."""
+    shas = list(shas)
+    db = get_db_connection()
+    known = set()
+    for i in range(0, len(shas), 500):
+        chunk = shas[i:i + 500]
+        sql = f"SELECT sha FROM commits WHERE repo = ? AND sha IN ({', '.join('?' for _ in chunk)})"
+        known.update(row[0] for row in db.execute(sql, [repo, *chunk]))
+    return known
+
+def load_commits(repo, since=None):
+    """Loads stored commits for repo (dated at or after since), shaped like DataHarvester's commit_diff_data."""
+    db = get_db_connection()
+    sql = "SELECT sha, author, date, additions, deletions, files_changed AS files FROM commits WHERE repo = ?"
+    params = [repo]
+    if since:
+        sql += " AND date >= ?"
+        params.append(since)
+    return [dict(row) for row in db.query(sql + " ORDER BY date DESC, sha", params)]
+
+def load_pull_requests(repo, updated_since=None, state="closed"):
+    """Loads stored pull requests for repo updated at or after updated_since, newest update first."""
+    db = get_db_connection()
+    sql = "SELECT * FROM pull_requests WHERE repo = ? AND state = ?"
+    params = [repo, state]
+    if updated_since:
+        sql += " AND updated_at >= ?"
+        params.append(updated_since)
+    rows = []
+    for row in db.query(sql + " ORDER BY updated_at DESC, number", params):
+        row.pop("repo", None)
+        row.pop("seq", None)
+        rows.append(row)
+    return rows
+
+def _window_clause(column, since, until, authors):
+    sql, params = "", []
+    if since:
+        sql += f" AND {column} >= ?"
+        params.append(since)
+    if until:
+        sql += f" AND {column} < ?"
+        params.append(until)
+    if authors:
+        sql += f" AND author IN ({', '.join('?' for _ in authors)})"
+        params.extend(authors)
+    return sql, params
+
+def _iter_rows(sql, params):
+    # Rows are pulled from the SQLite cursor one at a time rather than materialized with fetchall()
+    cursor = get_db_connection().execute(sql, params)
+    columns = [d[0] for d in cursor.description]
+    for row in cursor:
+        yield dict(zip(columns, row))
+
+def iter_stored_commits(repo, since=None, until=None, authors=None):
+    """
+    Streams a repo's commits with since <= date < until (optionally only for some authors), oldest first.
+
+    Rows are shaped like commit_diff_data and served from the (repo, date) / (author, date) indexes.
+    """
+    where, params = _window_clause("date", since, until, authors)
+    sql = ("SELECT sha, author, date, additions, deletions, files_changed AS files, seq FROM commits "
+           f"WHERE repo = ?{where} ORDER BY date, sha")
+    return _iter_rows(sql, [repo, *params])
+
+PR_WINDOW_FIELDS = ("created_at", "merged_at", "closed_at", "updated_at")
+
+def iter_stored_pull_requests(repo, since=None, until=None, authors=None, window_field="created_at"):
+    """Streams a repo's pull requests whose window_field falls in [since, until), oldest first."""
+    if window_field not in PR_WINDOW_FIELDS:
+        raise ValueError(f"window_field must be one of {PR_WINDOW_FIELDS}")
+    where, params = _window_clause(window_field, since, until, authors)
+    sql = f"SELECT * FROM pull_requests WHERE repo = ?{where} ORDER BY {window_field}, number"
+    return _iter_rows(sql, [repo, *params])
+
+def iter_new_commits(repo, after_seq=None):
+    """Streams a repo's commits stored after after_seq (store insertion order), whatever their commit dates."""
+    sql = ("SELECT sha, author, date, additions, deletions, files_changed AS files, seq FROM commits "
+           "WHERE repo = ? AND seq > ? ORDER BY seq")
+    return _iter_rows(sql, [repo, after_seq or 0])
+
+def iter_changed_pull_requests(repo, after_seq=None, updated_since=None):
+    """Streams a repo's pull requests first stored after after_seq or updated at or after updated_since."""
+    sql = "SELECT * FROM pull_requests WHERE repo = ? AND (seq > ? OR updated_at >= ?) ORDER BY seq"
+    return _iter_rows(sql, [repo, after_seq or 0, updated_since])
+
+def upsert_pull_requests(prs_data):
+    """Inserts or updates pull requests, leaving columns absent from a row (e.g. first_review_at) untouched."""
+    db = get_db_connection()
+    try:
+        prs_data = [{k: v for k, v in pr.items() if k != "seq"} for pr in _with_repo(prs_data, None)]
+        with _write_transaction(db):
+            old_rows = _existing_rows(db, "pull_requests", "number", [(pr["repo"], pr["number"]) for pr in prs_data])
+            old_by_key = {(row["repo"], row["number"]): row for row in old_rows}
+            db["pull_requests"].upsert_all(prs_data, pk=("repo", "number"), alter=True)
+            merged_rows = [{**old_by_key.get((pr["repo"], pr["number"]), {}), **pr} for pr in prs_data]
+            apply_pull_request_changes(db, old_rows, merged_rows)
+    except Exception as e:
+        print(f"❌ Failed to upsert pull requests: {e}")
+
+def record_first_reviews(repo, reviews):
+    """Keeps the earliest review time per PR from (number, submitted_at) pairs, creating stub rows if needed."""
+    db = get_db_connection()
+    keys = {(repo, number) for number, _ in reviews}
+    with _write_transaction(db):
+        old_rows = _existing_rows(db, "pull_requests", "number", keys)
+        for number, submitted_at in reviews:
+            db.execute("INSERT OR IGNORE INTO pull_requests (repo, number) VALUES (?, ?)", [repo, number])
+            db.execute(
+                "UPDATE pull_requests SET first_review_at = ? WHERE repo = ? AND number = ? "
+                "AND (first_review_at IS NULL OR first_review_at > ?)",
+                [submitted_at, repo, number, submitted_at],
+            )
+        apply_pull_request_changes(db, old_rows, _existing_rows(db, "pull_requests", "number", keys))
+
+def load_accumulator_state(key):
+    """Returns a stored MetricsAccumulator state dict, or None."""
+    try:
+        return json.loads(get_db_connection()["metric_accumulators"].get(key)["state"])
+    except sqlite_utils.db.NotFoundError:
+        return None
+
+def save_accumulator_state(key, state):
+    db = get_db_connection()
+    with db.conn:
+        db["metric_accumulators"].upsert({
+            "key": key,
+            "state": json.dumps(state, separators=(",", ":")),
+            "updated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }, pk="key")
+
+def get_author_churn(repo, since_day=None, until_day=None):
+    """Per-author churn for [since_day, until_day) summed from rollup_daily_churn, in first-active order."""
+    where, params = _window_clause("day", since_day, until_day, None)
+    sql = (
+        "SELECT author, SUM(additions) AS additions, SUM(deletions) AS deletions, "
+        "SUM(files_changed) AS files_changed, SUM(commits) AS commits "
+        f"FROM rollup_daily_churn WHERE repo = ?{where} GROUP BY author HAVING SUM(commits) > 0 ORDER BY MIN(day), author"
+    )
+    return list(get_db_connection().query(sql, [repo or DEFAULT_REPO, *params]))
+
+def get_weekly_pr_metrics(repo, since_week=None, until_week=None):
+    """Weekly PR throughput, cycle time and review latency sums/counts from rollup_weekly_prs."""
+    where, params = _window_clause("week", since_week, until_week, None)
+    sql = f"SELECT * FROM rollup_weekly_prs WHERE repo = ?{where} ORDER BY week"
+    return list(get_db_connection().query(sql, [repo or DEFAULT_REPO, *params]))
+
+def get_metric_sketch(repo, metric, since_week=None, until_week=None, authors=None):
+    """QuantileSketch for commit_churn / cycle_time_hours / review_latency_hours merged across weeks (and authors)."""
+    return load_sketch(get_db_connection(), repo or DEFAULT_REPO, metric, since_week, until_week, authors)
+
+def _week_start(day):
+    if not day:
+        return None
+    parsed = datetime.fromisoformat(day[:10]).date()
+    return (parsed - timedelta(days=parsed.weekday())).isoformat()
+
+def get_hotspot_files(repo, since_day=None, until_day=None, limit=10):
+    """Top-N files by churn for the ISO weeks overlapping [since_day, until_day), from rollup_file_churn."""
+    return hotspot_files(get_db_connection(), repo or DEFAULT_REPO, _week_start(since_day), until_day and until_day[:10], limit)
+
+def get_hotspot_directories(repo, since_day=None, until_day=None, limit=10, depth=None):
+    return hotspot_directories(get_db_connection(), repo or DEFAULT_REPO, _week_start(since_day), until_day and until_day[:10], limit, depth)
+
+def get_cochanged_files(repo, path, since_day=None, until_day=None, limit=10):
+    """Files most often changed together with path in the ISO weeks overlapping [since_day, until_day)."""
+    return cochanged_files(get_db_connection(), repo or DEFAULT_REPO, path, _week_start(since_day), until_day and until_day[:10], limit)
+
+def iter_daily_churn(repo, since_day=None, until_day=None):
+    """Streams rollup_daily_churn rows (day, author, commits, additions, ...) for [since_day, until_day), by day."""
+    where, params = _window_clause("day", since_day, until_day, None)
+    sql = f"SELECT * FROM rollup_daily_churn WHERE repo = ?{where} AND commits > 0 ORDER BY day, author"
+    return _iter_rows(sql, [repo or DEFAULT_REPO, *params])
+
+def iter_spike_commits(repo, since, until, threshold):
+    """Streams commits in the window whose additions + deletions exceed threshold (see ChurnScan.spike_threshold)."""
+    where, params = _window_clause("date", since, until, None)
+    sql = ("SELECT sha, author, date, additions, deletions, files_changed AS files FROM commits "
+           f"WHERE repo = ?{where} AND additions + deletions > ? ORDER BY date, sha")
+    return _iter_rows(sql, [repo, *params, threshold])
+
+
+if __name__ == "__main__":
+    # Retention / compaction command: python -m store.db compact --max-age-days 30
+    parser = argparse.ArgumentParser(description="FikaDevBot store maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    compact = subcommands.add_parser("compact", help="prune old run logs and vacuum incrementally")
+    compact.add_argument("--max-age-days", type=int, default=30)
+    compact.add_argument("--vacuum-pages", type=int, default=1000)
+    args = parser.parse_args()
+    if args.command == "compact":
+        compact_logs(args.max_age_days, args.vacuum_pages)
@@ -0,0 +1,267 @@
+"""
+File-level hotspot index: interned paths, weekly per-file churn and a bounded weekly co-change matrix.
+
+Maintained like the rollups: every commit save passes the file rows it replaces (old) and writes
+(new), and their contributions are subtracted and added as one signed delta. Co-change pairs and
+the raw per-commit file rows are pruned together, oldest weeks first; weekly per-file churn (one
+row per file and week) is kept for all history.
+"""
+import os
+from datetime import datetime, timedelta
+from itertools import combinations
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Commits touching more files than this (mass renames, reformatting) add churn but no co-change pairs
+COCHANGE_MAX_FILES_PER_COMMIT = int(os.getenv("COCHANGE_MAX_FILES_PER_COMMIT", "50"))
+# Upper bound on stored (week, pair) co-change rows per repo; the oldest weeks are pruned past it
+COCHANGE_MAX_PAIRS = int(os.getenv("COCHANGE_MAX_PAIRS", "200000"))
+# Share of the cap the matrix may overshoot; the size is only checked after this many new pair counts
+COCHANGE_PRUNE_TOLERANCE = float(os.getenv("COCHANGE_PRUNE_TOLERANCE", "0.1"))
+
+# Pair counts added per repo since its matrix size was last checked (per process)
+_added_since_check = {}
+
+
+def create_hotspot_tables(db):
+    # Interned paths; every other table refers to files by id
+    db["file_paths"].create({
+        "id": int,
+        "repo": str,
+        "path": str,
+        "directory": str,
+    }, pk="id", ignore=True)
+    db["file_paths"].create_index(["repo", "path"], unique=True, if_not_exists=True)
+
+    # Raw per-commit file changes, so a re-saved commit can back out its old contribution (pruned with the co-change weeks)
+    db["commit_files"].create({
+        "repo": str,
+        "sha": str,
+        "path_id": int,
+        "week": str,
+        "additions": int,
+        "deletions": int,
+    }, pk=("repo", "sha", "path_id"), ignore=True)
+
+    db["rollup_file_churn"].create({
+        "repo": str,
+        "week": str, # Monday (YYYY-MM-DD) of the commit's ISO week
+        "path_id": int,
+        "changes": int, # commits touching the file
+        "additions": int,
+        "deletions": int,
+    }, pk=("repo", "week", "path_id"), ignore=True)
+
+    # Sparse upper triangle (path_a < path_b) of "changed in the same commit" counts per ISO week;
+    # matrices from before the week column are rebuilt from commit_files
+    rebuild = "rollup_cochange" in db.table_names() and "week" not in db["rollup_cochange"].columns_dict
+    if rebuild:
+        db["rollup_cochange"].drop()
+    db["rollup_cochange"].create({
+        "repo": str,
+        "week": str, # Monday (YYYY-MM-DD) of the commits' ISO week
+        "path_a": int,
+        "path_b": int,
+        "count": int,
+    }, pk=("repo", "week", "path_a", "path_b"), ignore=True)
+    # Newest week pruned per repo: commits up to it have no file rows or pairs left, only their churn
+    db["hotspot_horizon"].create({
+        "repo": str,
+        "week": str,
+    }, pk="repo", ignore=True)
+    db["rollup_cochange"].create_index(["repo", "path_a"], if_not_exists=True)
+    db["rollup_cochange"].create_index(["repo", "path_b"], if_not_exists=True)
+    if rebuild:
+        with db.conn:
+            db.execute(
+                "INSERT INTO rollup_cochange (repo, week, path_a, path_b, count) "
+                "SELECT a.repo, a.week, a.path_id, b.path_id, COUNT(*) FROM commit_files a "
+                "JOIN commit_files b ON b.repo = a.repo AND b.sha = a.sha AND b.path_id > a.path_id "
+                "WHERE (SELECT COUNT(*) FROM commit_files c WHERE c.repo = a.repo AND c.sha = a.sha) <= ? "
+                "GROUP BY a.repo, a.week, a.path_id, b.path_id",
+                [COCHANGE_MAX_FILES_PER_COMMIT],
+            )
+
+
+def _week(date):
+    day = datetime.fromisoformat(date[:10]).date()
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+def intern_paths(db, repo, paths):
+    """Returns {path: id} for paths in repo, assigning ids to new ones."""
+    paths = list(dict.fromkeys(paths))
+    ids = {}
+    for i in range(0, len(paths), 500):
+        chunk = paths[i:i + 500]
+        sql = f"SELECT path, id FROM file_paths WHERE repo = ? AND path IN ({', '.join('?' for _ in chunk)})"
+        ids.update(db.execute(sql, [repo, *chunk]).fetchall())
+    missing = [path for path in paths if path not in ids]
+    if missing:
+        db.conn.executemany(
+            "INSERT INTO file_paths (repo, path, directory) VALUES (?, ?, ?)",
+            [(repo, path, os.path.dirname(path)) for path in missing],
+        )
+        ids.update(intern_paths(db, repo, missing))
+    return ids
+
+def _contributions(file_rows):
+    """Churn and co-change deltas for a list of commit_files rows (grouped by sha)."""
+    churn, by_commit = {}, {}
+    for row in file_rows:
+        key = (row["repo"], row["week"], row["path_id"])
+        current = churn.setdefault(key, [0, 0, 0])
+        current[0] += 1
+        current[1] += row["additions"] or 0
+        current[2] += row["deletions"] or 0
+        by_commit.setdefault((row["repo"], row["sha"], row["week"]), []).append(row["path_id"])
+    pairs = {}
+    for (repo, _sha, week), path_ids in by_commit.items():
+        if len(path_ids) > COCHANGE_MAX_FILES_PER_COMMIT:
+            continue
+        for a, b in combinations(sorted(set(path_ids)), 2):
+            pairs[(repo, week, a, b)] = pairs.get((repo, week, a, b), 0) + 1
+    return churn, pairs
+
+def apply_file_changes(db, repo, commits, stored=()):
+    """
+    Replaces the file rows of the given commits and moves the hotspot aggregates accordingly.
+
+    commits are dicts with "sha", "date" and "file_changes" ([path, additions, deletions] lists);
+    stored holds the shas that were saved before. Commits in weeks already pruned (see
+    _prune_cochange) have no rows to replace: a first save only adds their churn, a re-save is ignored.
+    """
+    commits = [c for c in commits if c.get("file_changes") is not None and c.get("date")]
+    if not commits:
+        return
+    ids = intern_paths(db, repo, [change[0] for c in commits for change in c["file_changes"]])
+    shas = [c["sha"] for c in commits]
+    old_rows = []
+    for i in range(0, len(shas), 500):
+        chunk = shas[i:i + 500]
+        sql = f"SELECT * FROM commit_files WHERE repo = ? AND sha IN ({', '.join('?' for _ in chunk)})"
+        old_rows.extend(dict(zip(("repo", "sha", "path_id", "week", "additions", "deletions"), row))
+                        for row in db.execute(sql, [repo, *chunk]))
+    new_rows = {}
+    for commit in commits:
+        week = _week(commit["date"])
+        for path, additions, deletions in commit["file_changes"]:
+            key = (commit["sha"], ids[path])
+            row = new_rows.setdefault(key, {"repo": repo, "sha": commit["sha"], "path_id": ids[path], "week": week,
+                                            "additions": 0, "deletions": 0})
+            row["additions"] += additions
+            row["deletions"] += deletions
+
+    horizon = db.execute("SELECT week FROM hotspot_horizon WHERE repo = ?", [repo]).fetchone()
+    settled = {row["sha"] for row in new_rows.values() if horizon and row["week"] <= horizon[0]}
+    first_saves = [row for row in new_rows.values() if row["sha"] in settled and row["sha"] not in stored]
+    new_rows = {key: row for key, row in new_rows.items() if key[0] not in settled}
+
+    old_churn, old_pairs = _contributions(old_rows)
+    new_churn, new_pairs = _contributions(list(new_rows.values()))
+    for key, values in _contributions(first_saves)[0].items():
+        new_churn[key] = [n + v for n, v in zip(new_churn.get(key, (0, 0, 0)), values)]
+    for i in range(0, len(shas), 500):
+        chunk = shas[i:i + 500]
+        db.execute(f"DELETE FROM commit_files WHERE repo = ? AND sha IN ({', '.join('?' for _ in chunk)})", [repo, *chunk])
+    db.conn.executemany(
+        "INSERT INTO commit_files (repo, sha, path_id, week, additions, deletions) VALUES (?, ?, ?, ?, ?, ?)",
+        [(r["repo"], r["sha"], r["path_id"], r["week"], r["additions"], r["deletions"]) for r in new_rows.values()],
+    )
+
+    churn = {key: [n - o for n, o in zip(new_churn.get(key, (0, 0, 0)), old_churn.get(key, (0, 0, 0)))]
+             for key in {*old_churn, *new_churn}}
+    db.conn.executemany(
+        "INSERT INTO rollup_file_churn (repo, week, path_id, changes, additions, deletions) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(repo, week, path_id) DO UPDATE SET changes = changes + excluded.changes, "
+        "additions = additions + excluded.additions, deletions = deletions + excluded.deletions",
+        [(*key, *values) for key, values in churn.items() if any(values)],
+    )
+    # Only buckets a replacement shrank can have emptied out
+    db.conn.executemany("DELETE FROM rollup_file_churn WHERE repo = ? AND week = ? AND path_id = ? AND changes <= 0",
+                        [key for key, values in churn.items() if values[0] < 0])
+
+    pairs = {key: new_pairs.get(key, 0) - old_pairs.get(key, 0) for key in {*old_pairs, *new_pairs}}
+    db.conn.executemany(
+        "INSERT INTO rollup_cochange (repo, week, path_a, path_b, count) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(repo, week, path_a, path_b) DO UPDATE SET count = count + excluded.count",
+        [(*key, count) for key, count in pairs.items() if count],
+    )
+    db.conn.executemany("DELETE FROM rollup_cochange WHERE repo = ? AND week = ? AND path_a = ? AND path_b = ? AND count <= 0",
+                        [key for key, count in pairs.items() if count < 0])
+    added = _added_since_check.get(repo, 0) + sum(count for count in pairs.values() if count > 0)
+    if added >= COCHANGE_MAX_PAIRS * COCHANGE_PRUNE_TOLERANCE:
+        _prune_cochange(db, repo)
+        added = 0
+    _added_since_check[repo] = added
+
+def _prune_cochange(db, repo, max_pairs=None, tolerance=None):
+    """
+    Keeps the matrix bounded by age: once it is more than tolerance over the cap, whole weeks are
+    dropped oldest first until it fits again. The newest week is always kept, so fresh pairs are
+    never the ones pruned and the matrix keeps following the codebase. The commit_files rows of the
+    dropped weeks go with them, and the repo's horizon moves up to the newest dropped week.
+    """
+    max_pairs = max_pairs or COCHANGE_MAX_PAIRS
+    tolerance = COCHANGE_PRUNE_TOLERANCE if tolerance is None else tolerance
+    weeks = db.execute("SELECT week, COUNT(*) FROM rollup_cochange WHERE repo = ? GROUP BY week ORDER BY week DESC",
+                       [repo]).fetchall()
+    if sum(rows for _, rows in weeks) <= max_pairs * (1 + tolerance):
+        return
+    kept = 0
+    for i, (week, rows) in enumerate(weeks):
+        kept += rows
+        if kept > max_pairs and i:
+            db.execute("DELETE FROM rollup_cochange WHERE repo = ? AND week <= ?", [repo, week])
+            db.execute("DELETE FROM commit_files WHERE repo = ? AND week <= ?", [repo, week])
+            db.execute("INSERT INTO hotspot_horizon (repo, week) VALUES (?, ?) "
+                       "ON CONFLICT(repo) DO UPDATE SET week = MAX(week, excluded.week)", [repo, week])
+            return
+
+
+def _window(since_week, until_week, column="c.week"):
+    sql, params = "", []
+    if since_week:
+        sql += f" AND {column} >= ?"
+        params.append(since_week)
+    if until_week:
+        sql += f" AND {column} < ?"
+        params.append(until_week)
+    return sql, params
+
+def hotspot_files(db, repo, since_week=None, until_week=None, limit=10):
+    """Top files by churn over the weeks in [since_week, until_week)."""
+    where, params = _window(since_week, until_week)
+    sql = (
+        "SELECT p.path, SUM(c.changes) AS changes, SUM(c.additions) AS additions, SUM(c.deletions) AS deletions, "
+        "SUM(c.additions + c.deletions) AS churn FROM rollup_file_churn c JOIN file_paths p ON p.id = c.path_id "
+        f"WHERE c.repo = ?{where} GROUP BY c.path_id ORDER BY churn DESC, changes DESC, p.path LIMIT ?"
+    )
+    return [dict(row) for row in db.query(sql, [repo, *params, limit])]
+
+def hotspot_directories(db, repo, since_week=None, until_week=None, limit=10, depth=None):
+    """Top directories by churn; depth truncates paths to their first `depth` components."""
+    where, params = _window(since_week, until_week)
+    sql = (
+        "SELECT p.directory, SUM(c.changes) AS changes, SUM(c.additions + c.deletions) AS churn "
+        f"FROM rollup_file_churn c JOIN file_paths p ON p.id = c.path_id WHERE c.repo = ?{where} GROUP BY p.directory"
+    )
+    totals = {}
+    for directory, changes, churn in db.execute(sql, [repo, *params]):
+        if depth is not None:
+            directory = "/".join(directory.split("/")[:depth])
+        current = totals.setdefault(directory or ".", {"directory": directory or ".", "changes": 0, "churn": 0})
+        current["changes"] += changes
+        current["churn"] += churn
+    return sorted(totals.values(), key=lambda d: (-d["churn"], -d["changes"], d["directory"]))[:limit]
+
+def cochanged_files(db, repo, path, since_week=None, until_week=None, limit=10):
+    """Files most often changed in the same commit as path over the weeks in [since_week, until_week)."""
+    where, params = _window(since_week, until_week, "pair.week")
+    sql = (
+        "SELECT other.path, SUM(pair.count) AS count FROM file_paths me "
+        "JOIN rollup_cochange pair ON pair.repo = me.repo AND (pair.path_a = me.id OR pair.path_b = me.id) "
+        "JOIN file_paths other ON other.id = CASE WHEN pair.path_a = me.id THEN pair.path_b ELSE pair.path_a END "
+        f"WHERE me.repo = ? AND me.path = ?{where} GROUP BY other.id ORDER BY count DESC, other.path LIMIT ?"
+    )
+    return [dict(row) for row in db.query(sql, [repo, path, *params, limit])]
@@ -0,0 +1,183 @@
+"""
+Persistent /dev-report job queue: one row per distinct (repo, window_days, options) job, plus the
+Slack requesters (waiters) to notify when it finishes.
+
+Requests for a job that is already queued or running are coalesced onto it by adding a waiter,
+so a burst of identical /dev-report commands runs the pipeline once. A job is tried at most
+REPORT_JOB_MAX_ATTEMPTS times; after that it fails and its waiters are told so.
+"""
+import os
+import json
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ACTIVE = ("queued", "running")
+# Runs a job may start (a restart mid-run counts as one) before it is failed instead of retried
+REPORT_JOB_MAX_ATTEMPTS = int(os.getenv("REPORT_JOB_MAX_ATTEMPTS", "3"))
+
+
+def create_job_tables(db):
+    db["report_jobs"].create({
+        "id": int,
+        "repo": str,
+        "window_days": int,
+        "options": str, # JSON, e.g. {"bypass_narration_cache": true}
+        "status": str, # queued | running | done | failed
+        "attempts": int,
+        "result": str, # JSON
+        "error": str,
+        "created_at": float,
+        "started_at": float,
+        "finished_at": float,
+    }, pk="id", ignore=True)
+    db["report_jobs"].create_index(["status", "created_at"], if_not_exists=True)
+    db["report_jobs"].create_index(["repo", "window_days", "status"], if_not_exists=True)
+
+    db["report_waiters"].create({
+        "id": int,
+        "job_id": int,
+        "response_url": str,
+        "channel_id": str,
+        "user_id": str,
+        "created_at": float,
+        "notified_at": float,
+    }, pk="id", ignore=True)
+    db["report_waiters"].create_index(["job_id"], if_not_exists=True)
+
+
+def _satisfies(job_options, options):
+    return all(job_options.get(key) == value for key, value in options.items())
+
+def enqueue_job(db, repo, window_days, waiter, options=None, now=None):
+    """
+    Adds waiter ({"response_url", "channel_id", "user_id"}) to an active job for (repo, window_days)
+    that runs with the requested options, creating a queued job if there is none. Returns (job_id, coalesced).
+
+    A job that is still queued is upgraded with the requested options instead (e.g. "fresh" skips the
+    narration cache for everyone waiting); a running one is never joined with options it doesn't have.
+    """
+    now = now or time.time()
+    options = options or {}
+    with db.conn:
+        db.execute("BEGIN IMMEDIATE") # take the write lock before the lookup, so two requests can't both create a job
+        active = db.execute(
+            f"SELECT id, status, options FROM report_jobs WHERE repo = ? AND window_days = ? AND status IN ({', '.join('?' for _ in ACTIVE)}) "
+            "ORDER BY id",
+            [repo, window_days, *ACTIVE],
+        ).fetchall()
+        job_id = next((active_id for active_id, _, job_options in active if _satisfies(json.loads(job_options or "{}"), options)), None)
+        if job_id is None:
+            queued = next(((active_id, json.loads(job_options or "{}")) for active_id, status, job_options in active
+                           if status == "queued"), None)
+            if queued is not None:
+                job_id = queued[0]
+                db.execute("UPDATE report_jobs SET options = ? WHERE id = ?", [json.dumps({**queued[1], **options}, sort_keys=True), job_id])
+        coalesced = job_id is not None
+        if not coalesced:
+            job_id = db.execute(
+                "INSERT INTO report_jobs (repo, window_days, options, status, attempts, created_at) VALUES (?, ?, ?, 'queued', 0, ?)",
+                [repo, window_days, json.dumps(options, sort_keys=True), now],
+            ).lastrowid
+        db.execute(
+            "INSERT INTO report_waiters (job_id, response_url, channel_id, user_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            [job_id, waiter.get("response_url"), waiter.get("channel_id"), waiter.get("user_id"), now],
+        )
+    return job_id, coalesced
+
+def _attempts_error(attempts):
+    return f"Gave up after {attempts} attempt(s); the report job was interrupted each time."
+
+def claim_job(db, now=None, max_attempts=None):
+    """
+    Marks the oldest queued job running and returns it as a dict, or None if the queue is empty.
+
+    A job that has already used max_attempts is marked failed instead and returned that way, so the
+    caller can notify its waiters.
+    """
+    now = now or time.time()
+    max_attempts = max_attempts or REPORT_JOB_MAX_ATTEMPTS
+    with db.conn:
+        db.execute("BEGIN IMMEDIATE") # one worker claims at a time
+        row = db.execute("SELECT id, attempts FROM report_jobs WHERE status = 'queued' ORDER BY created_at, id LIMIT 1").fetchone()
+        if row is None:
+            return None
+        if row[1] >= max_attempts:
+            db.execute("UPDATE report_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                       [_attempts_error(row[1]), now, row[0]])
+        else:
+            db.execute("UPDATE report_jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?", [now, row[0]])
+    return get_job(db, row[0])
+
+def get_job(db, job_id):
+    row = db.execute("SELECT * FROM report_jobs WHERE id = ?", [job_id]).fetchone()
+    if row is None:
+        return None
+    job = dict(zip([column[0] for column in db.execute("SELECT * FROM report_jobs LIMIT 0").description], row))
+    job["options"] = json.loads(job["options"] or "{}")
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+def finish_job(db, job_id, result=None, error=None, now=None):
+    """Stores the outcome; waiters that join after this start a new job instead of reading a stale one."""
+    with db.conn:
+        db.execute(
+            "UPDATE report_jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            ["failed" if error else "done", json.dumps(result, default=str) if result is not None else None, error,
+             now or time.time(), job_id],
+        )
+
+def pending_waiters(db, job_id):
+    sql = "SELECT id, response_url, channel_id, user_id, created_at FROM report_waiters WHERE job_id = ? AND notified_at IS NULL ORDER BY id"
+    return [dict(zip(("id", "response_url", "channel_id", "user_id", "created_at"), row)) for row in db.execute(sql, [job_id])]
+
+def mark_notified(db, waiter_id, now=None):
+    with db.conn:
+        db.execute("UPDATE report_waiters SET notified_at = ? WHERE id = ?", [now or time.time(), waiter_id])
+
+def requeue_running(db, max_attempts=None, now=None):
+    """
+    Puts jobs left running by a stopped process back in the queue; returns how many.
+
+    Jobs that have used max_attempts are failed instead (see unnotified_finished_jobs for their waiters).
+    """
+    max_attempts = max_attempts or REPORT_JOB_MAX_ATTEMPTS
+    with db.conn:
+        exhausted = db.execute("SELECT id, attempts FROM report_jobs WHERE status = 'running' AND attempts >= ?", [max_attempts]).fetchall()
+        db.conn.executemany("UPDATE report_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                            [(_attempts_error(attempts), now or time.time(), job_id) for job_id, attempts in exhausted])
+        return db.execute("UPDATE report_jobs SET status = 'queued', started_at = NULL WHERE status = 'running'").rowcount
+
+def unnotified_finished_jobs(db):
+    """Ids of finished jobs that still have waiters to notify (e.g. the process stopped mid-notification)."""
+    sql = ("SELECT DISTINCT j.id FROM report_jobs j JOIN report_waiters w ON w.job_id = j.id "
+           "WHERE j.status IN ('done', 'failed') AND w.notified_at IS NULL ORDER BY j.id")
+    return [row[0] for row in db.execute(sql)]
+
+def queue_stats(db, since=None, now=None):
+    """Queue depth by status plus wait (queued -> started) and run times for jobs started since `since`."""
+    now = now or time.time()
+    depth = dict(db.execute("SELECT status, COUNT(*) FROM report_jobs GROUP BY status").fetchall())
+    (oldest,) = db.execute("SELECT MIN(created_at) FROM report_jobs WHERE status = 'queued'").fetchone()
+    waits, runs = [], []
+    for created_at, started_at, finished_at in db.execute(
+            "SELECT created_at, started_at, finished_at FROM report_jobs WHERE started_at IS NOT NULL AND started_at >= ?",
+            [since or 0]):
+        waits.append(started_at - created_at)
+        if finished_at:
+            runs.append(finished_at - started_at)
+    (coalesced,) = db.execute(
+        "SELECT COUNT(*) - COUNT(DISTINCT job_id) FROM report_waiters WHERE created_at >= ?", [since or 0]
+    ).fetchone()
+    return {
+        "queued": depth.get("queued", 0),
+        "running": depth.get("running", 0),
+        "done": depth.get("done", 0),
+        "failed": depth.get("failed", 0),
+        "oldest_queued_seconds": round(now - oldest, 2) if oldest else 0,
+        "avg_wait_seconds": round(sum(waits) / len(waits), 2) if waits else 0,
+        "max_wait_seconds": round(max(waits), 2) if waits else 0,
+        "avg_run_seconds": round(sum(runs) / len(runs), 2) if runs else 0,
+        "coalesced_requests": coalesced,
+    }
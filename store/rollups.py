@@ -0,0 +1,181 @@
+"""
+Materialized rollups kept in step with the raw commits / pull_requests tables.
+
+Every upsert passes the rows it replaces (old) and the rows it writes (new); their contributions
+are subtracted and added as one signed delta, so replacing a row never double counts it.
+"""
+import json
+from datetime import datetime, timedelta
+from agents.quantile_sketch import QuantileSketch
+
+COMMIT_ROLLUP_COLUMNS = ("commits", "additions", "deletions", "files_changed")
+PR_ROLLUP_COLUMNS = (
+    "opened_count", "merged_count",
+    "cycle_time_seconds_sum", "cycle_time_count",
+    "review_latency_seconds_sum", "review_latency_count",
+)
+
+
+def create_rollup_tables(db):
+    db["rollup_daily_churn"].create({
+        "repo": str,
+        "day": str, # YYYY-MM-DD of the commit date
+        "author": str,
+        "commits": int,
+        "additions": int,
+        "deletions": int,
+        "files_changed": int,
+    }, pk=("repo", "day", "author"), ignore=True)
+
+    db["rollup_weekly_prs"].create({
+        "repo": str,
+        "week": str, # Monday (YYYY-MM-DD) of the ISO week
+        "opened_count": int,
+        "merged_count": int,
+        "cycle_time_seconds_sum": float,
+        "cycle_time_count": int,
+        "review_latency_seconds_sum": float,
+        "review_latency_count": int,
+    }, pk=("repo", "week"), ignore=True)
+
+    # Serialized QuantileSketch per repo / ISO week / author / metric (commit_churn, cycle_time_hours, review_latency_hours)
+    db["rollup_sketches"].create({
+        "repo": str,
+        "week": str,
+        "author": str,
+        "metric": str,
+        "sketch": str,
+    }, pk=("repo", "week", "author", "metric"), ignore=True)
+
+
+def _parse(timestamp):
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+def _week(timestamp):
+    day = _parse(timestamp).date()
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+def _add(deltas, key, values, sign):
+    current = deltas.setdefault(key, dict.fromkeys(values, 0))
+    for column, value in values.items():
+        current[column] = current.get(column, 0) + sign * value
+
+def _sketch(sketches, key, value, sign):
+    sketches.setdefault(key, QuantileSketch()).add(value, sign)
+
+def _commit_deltas(deltas, row, sign, sketches):
+    if not row.get("date"):
+        return
+    repo, author = row.get("repo") or "", row.get("author") or "unknown"
+    _add(deltas, (repo, row["date"][:10], author), {
+        "commits": 1,
+        "additions": row.get("additions") or 0,
+        "deletions": row.get("deletions") or 0,
+        "files_changed": row.get("files_changed") or 0,
+    }, sign)
+    try:
+        churn = (row.get("additions") or 0) + (row.get("deletions") or 0)
+        _sketch(sketches, (repo, _week(row["date"]), author, "commit_churn"), churn, sign)
+    except (ValueError, TypeError):
+        pass
+
+def _pr_deltas(deltas, row, sign, sketches):
+    # Same rules as DiffAnalyst: cycle time for merged PRs, review latency only when non-negative
+    repo, author = row.get("repo") or "", row.get("author") or "unknown"
+    created_at, merged_at, first_review_at = row.get("created_at"), row.get("merged_at"), row.get("first_review_at")
+    try:
+        if created_at:
+            _add(deltas, (repo, _week(created_at)), {"opened_count": 1}, sign)
+        if merged_at:
+            values = {"merged_count": 1}
+            if created_at:
+                cycle = (_parse(merged_at) - _parse(created_at)).total_seconds()
+                values.update(cycle_time_seconds_sum=cycle, cycle_time_count=1)
+                _sketch(sketches, (repo, _week(merged_at), author, "cycle_time_hours"), cycle / 3600, sign)
+            _add(deltas, (repo, _week(merged_at)), values, sign)
+        if created_at and first_review_at:
+            latency = (_parse(first_review_at) - _parse(created_at)).total_seconds()
+            if latency >= 0:
+                _add(deltas, (repo, _week(created_at)), {"review_latency_seconds_sum": latency, "review_latency_count": 1}, sign)
+                _sketch(sketches, (repo, _week(created_at), author, "review_latency_hours"), latency / 3600, sign)
+    except (ValueError, TypeError):
+        pass # malformed or mixed naive/aware timestamps are skipped, as in DiffAnalyst
+
+def _apply(db, table, key_columns, value_columns, deltas, empty_when):
+    columns = (*key_columns, *value_columns)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+        f"ON CONFLICT({', '.join(key_columns)}) DO UPDATE SET "
+        + ", ".join(f"{c} = {c} + excluded.{c}" for c in value_columns)
+    )
+    params = [
+        (*key, *(values.get(c, 0) for c in value_columns))
+        for key, values in deltas.items()
+        if any(values.values())
+    ]
+    if params:
+        db.conn.executemany(sql, params)
+    # Drop buckets a replacement emptied out (e.g. a commit re-attributed to another author)
+    emptied = [key for key, values in deltas.items() if any(v < 0 for v in values.values())]
+    if emptied:
+        where = " AND ".join(f"{c} = ?" for c in key_columns)
+        db.conn.executemany(f"DELETE FROM {table} WHERE {where} AND {empty_when}", emptied)
+
+def _apply_sketches(db, sketches):
+    # Read-modify-write of the touched sketch rows; bucket counts are exact, so negative deltas back values out
+    for (repo, week, author, metric), delta in sketches.items():
+        key = [repo, week, author, metric]
+        row = db.execute("SELECT sketch FROM rollup_sketches WHERE repo = ? AND week = ? AND author = ? AND metric = ?", key).fetchone()
+        merged = QuantileSketch.from_dict(json.loads(row[0])).merge(delta) if row else delta
+        if merged.count > 0:
+            db.execute("INSERT OR REPLACE INTO rollup_sketches (repo, week, author, metric, sketch) VALUES (?, ?, ?, ?, ?)",
+                       [*key, json.dumps(merged.to_dict(), separators=(",", ":"))])
+        elif row:
+            db.execute("DELETE FROM rollup_sketches WHERE repo = ? AND week = ? AND author = ? AND metric = ?", key)
+
+def apply_commit_changes(db, old_rows, new_rows):
+    """Moves rollup_daily_churn and the churn sketches from old_rows' contribution to new_rows'."""
+    deltas, sketches = {}, {}
+    for row in old_rows:
+        _commit_deltas(deltas, row, -1, sketches)
+    for row in new_rows:
+        _commit_deltas(deltas, row, +1, sketches)
+    _apply(db, "rollup_daily_churn", ("repo", "day", "author"), COMMIT_ROLLUP_COLUMNS, deltas, "commits = 0")
+    _apply_sketches(db, sketches)
+
+def apply_pull_request_changes(db, old_rows, new_rows):
+    """Moves rollup_weekly_prs and the latency sketches from old_rows' contribution to new_rows'."""
+    deltas, sketches = {}, {}
+    for row in old_rows:
+        _pr_deltas(deltas, row, -1, sketches)
+    for row in new_rows:
+        _pr_deltas(deltas, row, +1, sketches)
+    _apply(db, "rollup_weekly_prs", ("repo", "week"), PR_ROLLUP_COLUMNS, deltas,
+           "opened_count = 0 AND merged_count = 0 AND review_latency_count = 0")
+    _apply_sketches(db, sketches)
+
+def load_sketch(db, repo, metric, since_week=None, until_week=None, authors=None):
+    """Merges the stored sketches for a metric over [since_week, until_week) (optionally only some authors)."""
+    sql, params = "SELECT sketch FROM rollup_sketches WHERE repo = ? AND metric = ?", [repo, metric]
+    if since_week:
+        sql += " AND week >= ?"
+        params.append(since_week)
+    if until_week:
+        sql += " AND week < ?"
+        params.append(until_week)
+    if authors:
+        sql += f" AND author IN ({', '.join('?' for _ in authors)})"
+        params.extend(authors)
+    sketch = QuantileSketch()
+    for (stored,) in db.execute(sql, params):
+        sketch = sketch.merge(QuantileSketch.from_dict(json.loads(stored)))
+    return sketch
+
+def rebuild_rollups(db):
+    """Recomputes both rollup tables from the raw tables (for existing databases or after manual edits)."""
+    with db.conn:
+        db.execute("DELETE FROM rollup_daily_churn")
+        db.execute("DELETE FROM rollup_weekly_prs")
+        db.execute("DELETE FROM rollup_sketches")
+        apply_commit_changes(db, [], db.query("SELECT * FROM commits"))
+        apply_pull_request_changes(db, [], db.query("SELECT * FROM pull_requests"))
@@ -0,0 +1,82 @@
+"""Offline checks for GitMirrorHarvester against a throwaway local git repository."""
+import os
+import subprocess
+
+import agents.git_mirror_harvester as git_mirror_harvester
+from agents.git_mirror_harvester import GitMirrorHarvester
+from store.db import save_author_logins
+
+
+def _git(repo_path, *args, date=None, email="alice@example.com"):
+    env = dict(os.environ, GIT_AUTHOR_NAME="Alice", GIT_AUTHOR_EMAIL=email,
+               GIT_COMMITTER_NAME="Alice", GIT_COMMITTER_EMAIL=email)
+    if date:
+        env.update(GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+    return subprocess.run(["git", "-C", str(repo_path), *args], check=True, env=env,
+                          capture_output=True, text=True).stdout.strip()
+
+
+def test_numstat_harvest_matches_commit_diff_shape(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "db.sqlite"))
+    repo_path = tmp_path / "repo"
+    repo_path.mkdir()
+    _git(repo_path, "init", "--quiet")
+
+    (repo_path / "a.txt").write_text("one\ntwo\nthree\n")
+    (repo_path / "logo.bin").write_bytes(b"\x00\x01\x02")
+    _git(repo_path, "add", ".")
+    _git(repo_path, "commit", "--quiet", "-m", "first", date="2024-03-01T10:00:00+02:00")
+
+    (repo_path / "a.txt").write_text("one\n2\n")
+    _git(repo_path, "commit", "--quiet", "-am", "second", date="2024-03-02T09:30:00+00:00",
+         email="12345+bob@users.noreply.github.com")
+    second_sha = _git(repo_path, "rev-parse", "HEAD")
+
+    harvester = GitMirrorHarvester("acme", "widgets", repo_path=str(repo_path),
+                                   fetch_pull_requests=False, window_days=None)
+    result = harvester.run({})
+
+    assert result["pull_request_details"] == []
+    newest, oldest = result["commit_diff_data"]
+    assert newest == {
+        "sha": second_sha,
+        "author": "bob",
+        "date": "2024-03-02T09:30:00Z",
+        "additions": 1,
+        "deletions": 2,
+        "files": 1,
+    }
+    assert oldest["author"] == "Alice"
+    assert oldest["date"] == "2024-03-01T08:00:00Z"
+    assert (oldest["additions"], oldest["deletions"], oldest["files"]) == (3, 0, 2)
+
+
+def test_authors_are_keyed_on_github_logins(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "logins.sqlite"))
+    repo_path = tmp_path / "repo"
+    repo_path.mkdir()
+    _git(repo_path, "init", "--quiet")
+    for i, email in enumerate(["alice@example.com", "carol@corp.example", "Alice@Example.com", "bot@ci.example"]):
+        (repo_path / f"f{i}.txt").write_text("x\n")
+        _git(repo_path, "add", ".")
+        _git(repo_path, "commit", "--quiet", "-m", f"c{i}", date=f"2024-03-0{i + 1}T10:00:00+00:00", email=email)
+
+    # alice was seen by an API harvest; carol and the bot are looked up once on the API
+    save_author_logins({"alice@example.com": "alice-gh"})
+    lookups = []
+    def fake_details(owner, repo, shas, max_workers=None):
+        lookups.extend(shas)
+        return [{"commit": {"author": {"email": "carol@corp.example"}}, "author": {"login": "carol-gh"}},
+                {"commit": {"author": {"email": "bot@ci.example"}}, "author": None}][:len(shas)]
+    monkeypatch.setattr(git_mirror_harvester, "get_commit_details_bulk", fake_details)
+
+    harvester = GitMirrorHarvester("acme", "widgets", repo_path=str(repo_path), fetch_pull_requests=False,
+                                   resolve_logins=True, window_days=None)
+    authors = [c["author"] for c in harvester.run({})["commit_diff_data"]]
+    assert authors == ["Alice", "alice-gh", "carol-gh", "alice-gh"] # newest first; the bot keeps its git name
+    assert len(lookups) == 2
+
+    lookups.clear()
+    GitMirrorHarvester("acme", "widgets", repo_path=str(repo_path), fetch_pull_requests=False,
+                       resolve_logins=True, window_days=None, full_resync=True).run({})
+    assert lookups == [] # every email is known now, including the one without an account
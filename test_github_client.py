@@ -0,0 +1,134 @@
+"""Checks the GitHub client's concurrent bulk fetches and Link-header pagination."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import github.github_client as github_client
+from github.github_client import fetch_concurrently, get_commit_details_bulk, get_pull_request_reviews_bulk
+from github.rate_limiter import BACKGROUND, INTERACTIVE, RequestScheduler, current_priority, request_priority
+
+
+def test_results_keep_input_order():
+    # Later items finish first, so completion order is the reverse of input order
+    def fetch(item):
+        time.sleep(0.01 * (5 - item))
+        return item * 10
+
+    assert fetch_concurrently(fetch, range(5), max_workers=5) == [0, 10, 20, 30, 40]
+    assert fetch_concurrently(fetch, range(5), max_workers=1) == [0, 10, 20, 30, 40]
+    assert fetch_concurrently(fetch, [], max_workers=4) == []
+
+
+def test_work_is_bounded_and_carries_priority():
+    lock = threading.Lock()
+    running = {"now": 0, "max": 0}
+    priorities = []
+
+    def fetch(item):
+        with lock:
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            priorities.append(current_priority())
+        time.sleep(0.02)
+        with lock:
+            running["now"] -= 1
+        return item
+
+    with request_priority(BACKGROUND):
+        fetch_concurrently(fetch, range(12), max_workers=3)
+    assert running["max"] == 3
+    assert set(priorities) == {BACKGROUND}
+    assert current_priority() == INTERACTIVE
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_item_failure_reaches_the_caller(max_workers):
+    attempted = []
+
+    def fetch(item):
+        attempted.append(item)
+        if item == 2:
+            raise ValueError("commit 2 is gone")
+        return item
+
+    with pytest.raises(ValueError, match="commit 2 is gone"):
+        fetch_concurrently(fetch, range(6), max_workers=max_workers)
+    assert 2 in attempted
+
+
+def test_bulk_helpers_pair_results_with_inputs(monkeypatch):
+    monkeypatch.setattr(github_client, "get_commit_details",
+                        lambda owner, repo, sha: (time.sleep(0.01 if sha == "a" else 0), {"sha": sha, "repo": f"{owner}/{repo}"})[1])
+    monkeypatch.setattr(github_client, "get_pull_request_reviews", lambda owner, repo, number: [{"pr": number}])
+
+    details = get_commit_details_bulk("acme", "api", ["a", "b", "c"], max_workers=3)
+    assert [d["sha"] for d in details] == ["a", "b", "c"] and details[0]["repo"] == "acme/api"
+    assert get_pull_request_reviews_bulk("acme", "api", [7, 3], max_workers=2) == [[{"pr": 7}], [{"pr": 3}]]
+
+
+@pytest.fixture
+def paged_api(monkeypatch):
+    """Serves a list per path in pages of `per_page`, linking each page to the next like GitHub does."""
+    state = {"items": {}, "requests": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            state["requests"].append((parts.path, query))
+            page, per_page = int(query.get("page", 1)), int(query.get("per_page", 30))
+            items = state["items"][parts.path]
+            body = json.dumps(items[(page - 1) * per_page:page * per_page]).encode()
+            self.send_response(200)
+            if page * per_page < len(items):
+                next_query = "&".join(f"{k}={v}" for k, v in dict(query, page=page + 1).items())
+                self.send_header("Link", f'<{state["base"]}{parts.path}?{next_query}>; rel="next", '
+                                         f'<{state["base"]}{parts.path}?page=1>; rel="first"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    state["base"] = f"http://127.0.0.1:{server.server_port}"
+    monkeypatch.setattr(github_client, "GITHUB_API_URL", state["base"])
+    monkeypatch.setattr(github_client, "get_response_cache", lambda: None)
+    monkeypatch.setattr(github_client, "scheduler", RequestScheduler(["token-a"]))
+    yield state
+    server.shutdown()
+
+
+def test_commits_follow_next_links_lazily(paged_api):
+    paged_api["items"]["/repos/acme/api/commits"] = [{"sha": f"c{i}"} for i in range(5)]
+
+    commits = github_client.iter_commits("acme", "api", since="2024-05-01T00:00:00Z", per_page=2)
+    assert [c["sha"] for c in islice(commits, 3)] == ["c0", "c1", "c2"]
+    assert len(paged_api["requests"]) == 2 # the third page is not requested until it is needed
+    assert [c["sha"] for c in commits] == ["c3", "c4"]
+
+    (_, first), (_, second), (_, third) = paged_api["requests"]
+    assert first == {"per_page": "2", "since": "2024-05-01T00:00:00Z"} # the window is pushed down to the API
+    assert second["page"] == "2" and third["page"] == "3" and third["since"] == "2024-05-01T00:00:00Z"
+
+
+def test_updated_pull_requests_stop_at_the_window(paged_api):
+    updated = ["2024-05-09", "2024-05-08", "2024-05-07", "2024-04-30", "2024-04-29", "2024-04-28"]
+    paged_api["items"]["/repos/acme/api/pulls"] = [
+        {"number": i, "updated_at": f"{day}T12:00:00Z"} for i, day in enumerate(updated)
+    ]
+
+    prs = list(github_client.iter_pull_requests("acme", "api", since="2024-05-01T00:00:00Z", per_page=2))
+    assert [pr["number"] for pr in prs] == [0, 1, 2]
+    assert len(paged_api["requests"]) == 2 # page 3 is entirely older than the window and never fetched
+    assert paged_api["requests"][0][1]["sort"] == "updated" and paged_api["requests"][0][1]["direction"] == "desc"
+
+    everything = list(github_client.iter_pull_requests("acme", "api", per_page=4))
+    assert len(everything) == 6
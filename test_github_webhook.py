@@ -0,0 +1,116 @@
+"""Checks the GitHub webhook receiver: HMAC verification, ingest of push/PR/review events and store-only reports."""
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import requests
+
+import agents.data_harvester as data_harvester
+import bot.github_webhook as github_webhook
+from agents.data_harvester import DataHarvester
+from bot.github_webhook import WEBHOOK_PATH, WebhookIngestor, start_webhook_server, verify_signature
+from store.db import get_db_connection
+
+SECRET = "s3cret"
+REPO = {"full_name": "acme/api", "default_branch": "main"}
+
+
+def _ts(days_ago, hours=0):
+    return (datetime.now(timezone.utc) - timedelta(days=days_ago, hours=hours)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _sign(body, secret=SECRET):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def _pr(number, merged=True):
+    return {"number": number, "title": f"PR {number}", "state": "closed", "created_at": _ts(3),
+            "closed_at": _ts(1), "merged_at": _ts(1) if merged else None, "updated_at": _ts(1), "user": {"login": "alice"}}
+
+
+def _details(sha):
+    return {"author": {"login": "alice"}, "commit": {"author": {"date": _ts(2)}},
+            "files": [{"filename": f"src/{sha}.py", "additions": 10, "deletions": 2}]}
+
+
+class RecordingIngestor:
+    def __init__(self):
+        self.deliveries = []
+
+    def submit(self, event, body):
+        self.deliveries.append((event, json.loads(body)))
+        return True
+
+
+def test_verify_signature():
+    body = b'{"zen": "hi"}'
+    assert verify_signature(SECRET, body, _sign(body))
+    assert not verify_signature(SECRET, body, _sign(body, "other-secret"))
+    assert not verify_signature(SECRET, body + b" ", _sign(body)) # body altered after signing
+    assert not verify_signature(SECRET, body, None)
+    assert not verify_signature(SECRET, body, _sign(body).replace("sha256=", "sha1="))
+    assert not verify_signature(None, body, _sign(body)) # no secret configured: nothing verifies
+
+
+def test_endpoint_only_accepts_signed_deliveries():
+    ingestor = RecordingIngestor()
+    server = start_webhook_server(port=0, secret=SECRET, ingestor=ingestor)
+    url = f"http://127.0.0.1:{server.server_port}{WEBHOOK_PATH}"
+    body = json.dumps({"repository": REPO, "pull_request": _pr(1)}).encode()
+    try:
+        def post(event, signature, path=url):
+            return requests.post(path, data=body, headers={"X-GitHub-Event": event, "X-Hub-Signature-256": signature}).status_code
+
+        assert post("pull_request", _sign(body)) == 202
+        assert post("pull_request", _sign(body, "wrong")) == 401
+        assert post("pull_request", "") == 401
+        assert post("ping", _sign(body)) == 204 # acknowledged, not ingested
+        assert post("pull_request", _sign(body), path=url.replace(WEBHOOK_PATH, "/other")) == 404
+        assert [event for event, _ in ingestor.deliveries] == ["pull_request"]
+    finally:
+        server.shutdown()
+    with pytest.raises(ValueError):
+        start_webhook_server(port=0, secret=None, ingestor=ingestor)
+
+
+def test_ingest_then_report_from_the_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "hooks.sqlite"))
+    monkeypatch.setattr(github_webhook, "get_commit_details_bulk", lambda owner, repo, shas: [_details(sha) for sha in shas])
+    push = {"ref": "refs/heads/main", "repository": REPO, "commits": [{"id": "aaa"}, {"id": "bbb"}]}
+    branch_push = {"ref": "refs/heads/feature", "repository": REPO, "commits": [{"id": "ccc"}]}
+    review = {"repository": REPO, "pull_request": {"number": 1}, "review": {"submitted_at": _ts(2)}}
+    later_review = {"repository": REPO, "pull_request": {"number": 1}, "review": {"submitted_at": _ts(1, hours=1)}}
+    batch = [
+        ("push", json.dumps(push)),
+        ("push", json.dumps(branch_push)),
+        ("pull_request", "{not json"), # a broken delivery...
+        ("pull_request", json.dumps({"pull_request": _pr(9)})), # ...and one without a repository...
+        ("pull_request", json.dumps({"repository": REPO, "pull_request": _pr(1)})), # ...don't sink the others
+        ("pull_request", json.dumps({"repository": REPO, "pull_request": _pr(2, merged=False)})),
+        ("pull_request_review", json.dumps(review)),
+        ("pull_request_review", json.dumps(later_review)),
+    ]
+    ingestor = WebhookIngestor(batch_size=len(batch), flush_interval=0.05)
+    assert ingestor.ingest(batch) == {"ingested": 6, "failed": 2}
+
+    db = get_db_connection()
+    assert [row[0] for row in db.execute("SELECT sha FROM commits ORDER BY sha")] == ["aaa", "bbb"] # default branch only
+    first_review = db.execute("SELECT first_review_at FROM pull_requests WHERE number = 1").fetchone()[0]
+    assert first_review == review["review"]["submitted_at"] # the earliest review wins
+
+    # The same deliveries through the background writer: queued, then flushed
+    assert ingestor.submit("pull_request", json.dumps({"repository": REPO, "pull_request": dict(_pr(3), title="queued")}))
+    ingestor.flush()
+    assert db.execute("SELECT title FROM pull_requests WHERE number = 3").fetchone()[0] == "queued"
+
+    # store_only reads the window straight from SQLite: no GitHub call at all
+    def no_api(*args, **kwargs):
+        raise AssertionError("store_only must not call GitHub")
+    for name in ("iter_commits", "get_commit_details_bulk", "iter_pull_requests", "get_pull_request_reviews_bulk"):
+        monkeypatch.setattr(data_harvester, name, no_api)
+    state = DataHarvester("acme", "api", store_only=True).run({})
+    assert sorted(c["sha"] for c in state["commit_diff_data"]) == ["aaa", "bbb"]
+    assert state["commit_diff_data"][0]["additions"] == 10
+    assert sorted(pr["number"] for pr in state["pull_request_details"]) == [1, 2, 3]
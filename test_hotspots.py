@@ -0,0 +1,85 @@
+"""Checks the file hotspot index: windowed top files/directories, co-change pairs and re-saves."""
+from agents.data_harvester import commit_diff_record, commit_store_row
+from agents.diff_analyst import DiffAnalyst
+from store.db import get_cochanged_files, get_db_connection, save_commits
+from store.hotspots import _prune_cochange, create_hotspot_tables
+
+
+def _details(date, files):
+    return {"author": {"login": "alice"}, "commit": {"author": {"date": date}},
+            "files": [{"filename": path, "additions": adds, "deletions": dels} for path, adds, dels in files]}
+
+
+def _save(sha, date, files):
+    save_commits([commit_store_row(commit_diff_record(sha, _details(date, files)), "acme/mono")])
+
+
+def test_hotspots_from_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "hot.sqlite"))
+    _save("a", "2024-05-06T10:00:00Z", [("api/app.py", 100, 20), ("api/models.py", 10, 0)])
+    _save("b", "2024-05-07T10:00:00Z", [("api/app.py", 50, 50), ("api/models.py", 5, 5), ("web/ui.js", 1, 1)])
+    _save("c", "2024-04-01T10:00:00Z", [("web/ui.js", 900, 0)]) # outside the window
+
+    report = DiffAnalyst().run_hotspots("acme/mono", "2024-05-06", "2024-05-13")
+    assert [f["path"] for f in report["hotspot_files"]] == ["api/app.py", "api/models.py", "web/ui.js"]
+    assert report["hotspot_files"][0]["churn"] == 220 and report["hotspot_files"][0]["changes"] == 2
+    assert report["hotspot_files"][0]["cochanged_with"][0] == {"path": "api/models.py", "count": 2}
+    assert report["hotspot_directories"][0]["directory"] == "api"
+
+    # Re-saving a commit with a different file list replaces its contribution
+    _save("b", "2024-05-07T10:00:00Z", [("web/ui.js", 1, 1)])
+    report = DiffAnalyst().run_hotspots("acme/mono", "2024-05-06", "2024-05-13")
+    assert report["hotspot_files"][0] == {"path": "api/app.py", "changes": 1, "additions": 100, "deletions": 20,
+                                         "churn": 120, "cochanged_with": [{"path": "api/models.py", "count": 1}]}
+    assert get_db_connection().execute("SELECT COUNT(*) FROM rollup_cochange").fetchone()[0] == 1
+
+
+def test_cochange_matrix_is_bounded_by_age(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "bound.sqlite"))
+    _save("wide", "2024-04-29T10:00:00Z", [(f"src/f{i}.py", 1, 0) for i in range(8)]) # 28 pairs, an old week
+    _save("pair", "2024-05-07T10:00:00Z", [("src/f0.py", 1, 0), ("src/f1.py", 1, 0)])
+    _save("new", "2024-05-08T10:00:00Z", [("src/f6.py", 1, 0), ("src/f7.py", 1, 0)]) # a brand new pair
+    db = get_db_connection()
+    with db.conn:
+        _prune_cochange(db, "acme/mono", max_pairs=28) # within the 10% tolerance: left alone
+    assert db.execute("SELECT COUNT(*) FROM rollup_cochange").fetchone()[0] == 30
+    with db.conn:
+        _prune_cochange(db, "acme/mono", max_pairs=5)
+    # The old week goes as a whole; the newest pairs survive, however rare
+    assert [tuple(row) for row in db.execute("SELECT week, count FROM rollup_cochange ORDER BY count")] == [
+        ("2024-05-06", 1), ("2024-05-06", 1)]
+    # ...and so do its raw file rows, while its file churn stays counted
+    assert [row[0] for row in db.execute("SELECT DISTINCT week FROM commit_files")] == ["2024-05-06"]
+    churn = DiffAnalyst().run_hotspots("acme/mono", "2024-04-29", "2024-05-06")["hotspot_files"]
+    assert len(churn) == 8 and all(f["changes"] == 1 for f in churn)
+
+    # Past the horizon a re-save is ignored, and a commit seen for the first time only adds churn
+    _save("wide", "2024-04-29T10:00:00Z", [("src/f0.py", 500, 0)])
+    _save("late", "2024-04-30T10:00:00Z", [("src/f0.py", 7, 0), ("src/f1.py", 7, 0)])
+    after = DiffAnalyst().run_hotspots("acme/mono", "2024-04-29", "2024-05-06")["hotspot_files"]
+    assert after[:2] == [{"path": "src/f0.py", "changes": 2, "additions": 8, "deletions": 0, "churn": 8, "cochanged_with": []},
+                         {"path": "src/f1.py", "changes": 2, "additions": 8, "deletions": 0, "churn": 8, "cochanged_with": []}]
+    assert db.execute("SELECT COUNT(*) FROM rollup_cochange").fetchone()[0] == 2
+    assert db.execute("SELECT COUNT(*) FROM commit_files WHERE week < '2024-05-06'").fetchone()[0] == 0
+
+
+def test_cochanged_files_follow_the_window(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "window.sqlite"))
+    _save("old", "2024-04-01T10:00:00Z", [("api/app.py", 1, 0), ("web/ui.js", 1, 0)])
+    _save("older", "2024-04-02T10:00:00Z", [("api/app.py", 1, 0), ("web/ui.js", 1, 0)])
+    _save("new", "2024-05-07T10:00:00Z", [("api/app.py", 1, 0), ("api/models.py", 1, 0)])
+    report = DiffAnalyst().run_hotspots("acme/mono", "2024-05-06", "2024-05-13")
+    assert report["hotspot_files"][0]["cochanged_with"] == [{"path": "api/models.py", "count": 1}]
+    assert get_cochanged_files("acme/mono", "api/app.py")[0] == {"path": "web/ui.js", "count": 2} # all history
+
+
+def test_matrix_without_weeks_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "legacy.sqlite"))
+    _save("a", "2024-05-07T10:00:00Z", [("api/app.py", 1, 0), ("api/models.py", 1, 0), ("web/ui.js", 1, 0)])
+    db = get_db_connection()
+    with db.conn:
+        db.execute("DROP TABLE rollup_cochange")
+        db.execute("CREATE TABLE rollup_cochange (repo TEXT, path_a INTEGER, path_b INTEGER, count INTEGER, "
+                   "PRIMARY KEY (repo, path_a, path_b))")
+    create_hotspot_tables(db)
+    assert db.execute("SELECT week, COUNT(*), SUM(count) FROM rollup_cochange").fetchone() == ("2024-05-06", 3, 3)
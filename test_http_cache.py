@@ -0,0 +1,110 @@
+"""Checks the GitHub response cache: conditional revalidation, immutable hits, credential scoping and LRU eviction."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import github.github_client as github_client
+from github.http_cache import ResponseCache
+from github.rate_limiter import RequestScheduler
+
+
+@pytest.fixture
+def fake_api():
+    """Serves JSON bodies by path with an ETag, answering 304 when If-None-Match still matches."""
+    state = {"bodies": {}, "calls": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(state["bodies"][self.path]).encode()
+            etag = f'"{hash(body) & 0xffffffff:x}"'
+            state["calls"].append((self.path, self.headers.get("If-None-Match"), self.headers.get("Authorization")))
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    state["base"] = f"http://127.0.0.1:{server.server_port}"
+    yield state
+    server.shutdown()
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(github_client, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(github_client, "scheduler", RequestScheduler(["token-a"]))
+    return cache
+
+
+def test_unchanged_resource_is_revalidated_with_a_304(fake_api, cache):
+    fake_api["bodies"]["/repos/acme/api/pulls"] = [{"number": 1}]
+    url = fake_api["base"] + "/repos/acme/api/pulls"
+
+    assert github_client._get_json(url) == [{"number": 1}]
+    assert github_client._get_json(url) == [{"number": 1}]
+    (_, first_validator, _), (_, second_validator, _) = fake_api["calls"]
+    assert first_validator is None and second_validator is not None
+    assert cache.stats["misses"] == 1 and cache.stats["revalidated"] == 1
+
+    # A changed resource comes back with a 200 and replaces the cached body
+    fake_api["bodies"]["/repos/acme/api/pulls"] = [{"number": 1}, {"number": 2}]
+    assert github_client._get_json(url) == [{"number": 1}, {"number": 2}]
+    assert github_client._get_json(url) == [{"number": 1}, {"number": 2}]
+    assert cache.stats == {"hits": 0, "revalidated": 2, "misses": 2, "evictions": 0}
+
+
+def test_immutable_hits_are_scoped_to_the_credentials(fake_api, cache, monkeypatch):
+    fake_api["bodies"]["/repos/acme/api/commits/abc"] = {"sha": "abc"}
+    url = fake_api["base"] + "/repos/acme/api/commits/abc"
+
+    github_client._get_json(url, immutable=True)
+    github_client._get_json(url, immutable=True)
+    assert len(fake_api["calls"]) == 1 and cache.stats["hits"] == 1
+
+    # Another token may not have access to what token-a saw, so it goes to GitHub itself
+    monkeypatch.setattr(github_client, "scheduler", RequestScheduler(["token-b"]))
+    github_client._get_json(url, immutable=True)
+    assert len(fake_api["calls"]) == 2 and fake_api["calls"][1][2] == "Bearer token-b"
+
+
+def test_reads_are_flushed_in_batches(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "batch.sqlite"), access_flush_size=3, access_flush_seconds=3600)
+    for key in ("a", "b", "c"):
+        cache.put(key, "{}")
+    stored = dict(cache.db.execute("SELECT key, last_access FROM responses").fetchall())
+
+    cache.get("a")
+    cache.get("b")
+    assert dict(cache.db.execute("SELECT key, last_access FROM responses").fetchall()) == stored # no write per read
+    cache.get("c")
+    updated = dict(cache.db.execute("SELECT key, last_access FROM responses").fetchall())
+    assert all(updated[key] > stored[key] for key in "abc")
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "lru.sqlite"), max_bytes=30, access_flush_seconds=3600)
+    cache.put("old", "x" * 10)
+    cache.put("older", "x" * 10)
+    cache.put("newest", "x" * 10)
+    cache.get("old") # buffered read; must still count when choosing what to evict
+
+    cache.put("extra", "x" * 10)
+    assert cache.get("older") is None
+    assert {"old", "newest", "extra"} == {row[0] for row in cache.db.execute("SELECT key FROM responses")}
+    assert cache.total_bytes == 30 and cache.stats["evictions"] == 1
+
+    cache.put("huge", "x" * 31) # larger than the whole budget: never stored
+    assert cache.get("huge") is None and cache.total_bytes == 30
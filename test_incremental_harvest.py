@@ -0,0 +1,174 @@
+"""Checks that incremental harvesting and a forced full resync leave identical commits/pull_requests tables."""
+from datetime import datetime, timedelta, timezone
+
+import agents.data_harvester as data_harvester
+from agents.data_harvester import DataHarvester, pull_request_record
+from store.db import get_db_connection
+
+
+def _ts(days_ago):
+    return (datetime.now(timezone.utc) - timedelta(days=days_ago)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeGitHub:
+    """In-memory stand-in for the github_client functions DataHarvester uses."""
+
+    def __init__(self):
+        self.commits = {} # sha -> commit details
+        self.prs = {} # number -> PR
+        self.detail_calls = 0
+
+    def add_commit(self, sha, author, days_ago, additions, deletions):
+        self.commits[sha] = {
+            "sha": sha,
+            "author": {"login": author},
+            "commit": {"author": {"date": _ts(days_ago)}, "committer": {"date": _ts(days_ago)}},
+            "files": [{"additions": additions, "deletions": deletions}],
+        }
+
+    def add_pr(self, number, author, days_ago, merged=True):
+        self.prs[number] = {
+            "number": number,
+            "title": f"PR {number}",
+            "state": "closed",
+            "created_at": _ts(days_ago + 1),
+            "closed_at": _ts(days_ago),
+            "merged_at": _ts(days_ago) if merged else None,
+            "updated_at": _ts(days_ago),
+            "user": {"login": author},
+        }
+
+    def iter_commits(self, owner, repo, since=None, until=None):
+        # Like the API, the window applies to the commit (committer) date
+        ordered = sorted(self.commits.values(), key=lambda c: c["commit"]["committer"]["date"], reverse=True)
+        return iter([{"sha": c["sha"]} for c in ordered
+                     if (not since or c["commit"]["committer"]["date"] >= since) and (not until or c["commit"]["committer"]["date"] <= until)])
+
+    def get_commit_details_bulk(self, owner, repo, shas, max_workers=None):
+        self.detail_calls += len(shas)
+        return [self.commits[sha] for sha in shas]
+
+    def iter_pull_requests(self, owner, repo, state="closed", since=None):
+        for pr in sorted(self.prs.values(), key=lambda p: p["updated_at"], reverse=True):
+            if since and pr["updated_at"] < since:
+                return
+            yield pr
+
+    def get_pull_request_reviews_bulk(self, owner, repo, numbers, max_workers=None):
+        return [[{"submitted_at": self.prs[n]["created_at"]}] for n in numbers]
+
+
+def _use_fake(monkeypatch, fake, db_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(db_path))
+    for name in ("iter_commits", "get_commit_details_bulk", "iter_pull_requests", "get_pull_request_reviews_bulk"):
+        monkeypatch.setattr(data_harvester, name, getattr(fake, name))
+
+
+def _tables(db_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(db_path))
+    db = get_db_connection()
+    # seq records the order rows reached this store, which legitimately differs between the two runs
+    return (
+        [dict(row, seq=None) for row in db.query("SELECT * FROM commits ORDER BY sha")],
+        [dict(row, seq=None) for row in db.query("SELECT * FROM pull_requests ORDER BY number")],
+    )
+
+
+def test_incremental_matches_full_resync(tmp_path, monkeypatch):
+    fake = FakeGitHub()
+    fake.add_commit("a1", "alice", 5, 10, 2)
+    fake.add_commit("b1", "bob", 4, 700, 50)
+    fake.add_pr(1, "alice", 4)
+    fake.add_pr(2, "bob", 3, merged=False)
+
+    incremental_db = tmp_path / "incremental.sqlite"
+    _use_fake(monkeypatch, fake, incremental_db)
+    DataHarvester("acme", "widgets").run({})
+
+    # New activity lands, and an already-harvested PR gets updated
+    fake.add_commit("c1", "carol", 1, 30, 30)
+    fake.add_pr(3, "carol", 1)
+    fake.prs[2]["updated_at"] = _ts(0)
+    fake.detail_calls = 0
+    result = DataHarvester("acme", "widgets").run({})
+    assert fake.detail_calls == 1 # only the new commit's details were fetched
+
+    full_db = tmp_path / "full.sqlite"
+    _use_fake(monkeypatch, fake, full_db)
+    full_result = DataHarvester("acme", "widgets", full_resync=True).run({})
+
+    result.pop("run_id"), full_result.pop("run_id")
+    assert result == full_result
+    assert _tables(incremental_db, monkeypatch) == _tables(full_db, monkeypatch)
+    assert {c["sha"] for c in result["commit_diff_data"]} == {"a1", "b1", "c1"}
+
+
+def test_commits_pushed_late_with_older_dates_are_fetched(tmp_path, monkeypatch):
+    fake = FakeGitHub()
+    fake.add_commit("a1", "alice", 0.1, 10, 2)
+    _use_fake(monkeypatch, fake, tmp_path / "late.sqlite")
+    DataHarvester("acme", "widgets").run({})
+
+    # Written and committed on a branch before a1, but only merged (fast-forward) after the first run
+    fake.add_commit("r1", "bob", 0.5, 40, 4)
+    fake.detail_calls = 0
+    result = DataHarvester("acme", "widgets").run({})
+    assert {c["sha"] for c in result["commit_diff_data"]} == {"a1", "r1"}
+    assert fake.detail_calls == 1 # the overlap re-lists a1, but only r1 is fetched
+
+
+def test_pull_request_records_fit_the_declared_schema(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "schema.sqlite"))
+    declared = set(get_db_connection()["pull_requests"].columns_dict) # before any write could alter the table
+    fake = FakeGitHub()
+    fake.add_pr(1, "alice", 1)
+    record = pull_request_record(dict(fake.prs[1], commits_url="https://api.github.com/repos/acme/widgets/pulls/1/commits"), None)
+    assert set(record) <= declared
+
+
+def test_fresh_store_skips_github(tmp_path, monkeypatch):
+    fake = FakeGitHub()
+    fake.add_commit("a1", "alice", 2, 10, 2)
+    fake.add_pr(1, "alice", 1)
+    _use_fake(monkeypatch, fake, tmp_path / "ttl.sqlite")
+    first = DataHarvester("acme", "widgets", max_staleness_seconds=600).run({})
+
+    fake.add_commit("b1", "bob", 1, 5, 5) # not visible until the TTL lapses
+    fake.detail_calls = 0
+    second = DataHarvester("acme", "widgets", max_staleness_seconds=600).run({})
+    assert fake.detail_calls == 0
+    assert second["commit_diff_data"] == first["commit_diff_data"]
+
+    third = DataHarvester("acme", "widgets", max_staleness_seconds=0).run({})
+    assert {c["sha"] for c in third["commit_diff_data"]} == {"a1", "b1"}
+
+    # Fresh, but only for the last 7 days: a wider window still fetches the range the store lacks
+    fake.add_commit("z1", "carol", 20, 50, 0)
+    wide = DataHarvester("acme", "widgets", window_days=30, max_staleness_seconds=600).run({})
+    assert {c["sha"] for c in wide["commit_diff_data"]} == {"a1", "b1", "z1"}
+
+
+def test_wider_window_fetches_the_missing_range(tmp_path, monkeypatch):
+    fake = FakeGitHub()
+    fake.add_commit("new", "alice", 2, 10, 2)
+    fake.add_commit("old", "bob", 20, 40, 4)
+    fake.add_pr(1, "alice", 2)
+    fake.add_pr(2, "bob", 20)
+    _use_fake(monkeypatch, fake, tmp_path / "coverage.sqlite")
+    DataHarvester("acme", "widgets", window_days=7).run({})
+
+    fake.detail_calls = 0
+    wide = DataHarvester("acme", "widgets", window_days=30).run({})
+    assert [c["sha"] for c in wide["commit_diff_data"]] == ["new", "old"]
+    assert [pr["number"] for pr in wide["pull_request_details"]] == [1, 2]
+    assert fake.detail_calls == 1 # only the older commit was missing
+
+    # Now that 30 days are covered, a 7-day run goes back to fetching past the marks only
+    fake.detail_calls = 0
+    DataHarvester("acme", "widgets", window_days=7).run({})
+    assert fake.detail_calls == 0
+
+    _use_fake(monkeypatch, fake, tmp_path / "coverage-full.sqlite")
+    full = DataHarvester("acme", "widgets", window_days=30, full_resync=True).run({})
+    wide.pop("run_id"), full.pop("run_id")
+    assert wide == full
@@ -0,0 +1,93 @@
+"""Checks per-thread SQLite connections and the batching background log writer."""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from store.db import LogWriter, get_db_connection
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _event(i):
+    now = time.time()
+    return ("agent", f"step-{i}", {"i": i}, None, "run-1", now, now)
+
+
+def _logged(db_path):
+    return get_db_connection(db_path).execute("SELECT COUNT(*) FROM log_events").fetchone()[0]
+
+
+def _wait_for(db_path, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while _logged(db_path) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return _logged(db_path)
+
+
+def test_full_batch_is_written_without_waiting_for_the_interval(tmp_path):
+    db_path = str(tmp_path / "batch.sqlite")
+    get_db_connection(db_path)
+    writer = LogWriter(batch_size=3, flush_interval=30)
+    for i in range(3):
+        writer.submit(db_path, _event(i))
+    assert _wait_for(db_path, 3) == 3
+
+    writer.submit(db_path, _event(3))
+    time.sleep(0.2)
+    assert _logged(db_path) == 3 # a partial batch waits for more events...
+    writer.submit(db_path, _event(4))
+    writer.submit(db_path, _event(5))
+    assert _wait_for(db_path, 6) == 6 # ...until the batch fills up
+
+    writer.submit(db_path, _event(6))
+    started = time.monotonic()
+    writer.flush() # writes the partial batch now rather than after the 30s interval
+    assert _logged(db_path) == 7 and time.monotonic() - started < 5
+
+
+def test_partial_batch_is_written_after_the_interval(tmp_path):
+    db_path = str(tmp_path / "interval.sqlite")
+    get_db_connection(db_path)
+    writer = LogWriter(batch_size=1000, flush_interval=0.1)
+    writer.submit(db_path, _event(0))
+    writer.submit(db_path, _event(1))
+    assert _wait_for(db_path, 2) == 2
+    writer.flush()
+
+
+def test_buffered_events_are_written_at_exit(tmp_path):
+    db_path = str(tmp_path / "exit.sqlite")
+    script = "from store.db import log_event\nfor i in range(5):\n    log_event('agent', f'step-{i}', {'i': i}, None)\n"
+    # Neither the batch size nor the interval is reached before the interpreter exits
+    env = dict(os.environ, SQLITE_DB_PATH=db_path, LOG_BATCH_SIZE="1000", LOG_FLUSH_INTERVAL_SECONDS="60")
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, check=True, timeout=30)
+    assert _logged(db_path) == 5
+
+
+def test_connections_are_per_thread_and_per_path(tmp_path):
+    first, second = str(tmp_path / "a.sqlite"), str(tmp_path / "b.sqlite")
+    assert get_db_connection(first) is get_db_connection(first)
+    assert get_db_connection(first) is not get_db_connection(second)
+
+    seen, errors = [], []
+
+    def worker(i):
+        try:
+            db = get_db_connection(first)
+            seen.append(db)
+            assert db is get_db_connection(first)
+            with db.conn:
+                db.execute("INSERT INTO commits (repo, sha, date) VALUES (?, ?, ?)", ["acme/api", f"sha-{i}", "2024-05-01"])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len({id(db) for db in seen}) == 4 and get_db_connection(first) not in seen
+    assert get_db_connection(first).execute("SELECT COUNT(*) FROM commits").fetchone()[0] == 4
@@ -0,0 +1,120 @@
+"""Checks MetricsAccumulator folding, merging and persistence against DiffAnalyst's reference pass."""
+from agents.diff_analyst import DiffAnalyst
+from agents.metrics_accumulator import MetricsAccumulator
+from agents.timeseries import ChurnTimeSeries
+from store.db import load_accumulator_state, save_accumulator_state, save_commits, save_pull_requests
+
+
+def _commit(sha, author, day, additions, deletions):
+    return {"sha": sha, "author": author, "date": f"2024-05-{day:02d}T10:00:00Z",
+            "additions": additions, "deletions": deletions, "files": 2}
+
+def _pr(number, created_day, merged_day=None, review_day=None, updated_day=None):
+    return {"number": number, "state": "closed", "created_at": f"2024-05-{created_day:02d}T09:00:00Z",
+            "merged_at": f"2024-05-{merged_day:02d}T09:00:00Z" if merged_day else None,
+            "first_review_at": f"2024-05-{review_day:02d}T15:00:00Z" if review_day else None,
+            "updated_at": f"2024-05-{updated_day or merged_day or created_day:02d}T09:00:00Z"}
+
+COMMITS = [_commit("a", "alice", 1, 400, 200), _commit("b", "bob", 2, 10, 5),
+           _commit("c", "alice", 3, 30, 1), _commit("d", "carol", 4, 900, 0)]
+PRS = [_pr(1, 1, 2, 1), _pr(2, 2, 5, 3), _pr(3, 3), _pr(4, 4, 6)]
+
+
+def _result(accumulator):
+    return DiffAnalyst().summarize_accumulator(accumulator)
+
+
+def test_merged_shards_match_single_pass():
+    expected = DiffAnalyst(engine="python").analyze(COMMITS, PRS)
+    day_one = MetricsAccumulator().add_commits(COMMITS[:2], "r").add_pull_requests(PRS[:2], "r")
+    day_two = MetricsAccumulator().add_commits(COMMITS[2:], "r").add_pull_requests(PRS[2:], "r")
+    assert _result(day_one.merge(day_two)) == expected
+    assert _result(day_two.merge(day_one)) == expected
+    empty = MetricsAccumulator()
+    assert _result(empty.merge(day_one).merge(day_two)) == _result(empty.merge(day_one.merge(day_two)))
+
+
+def test_refolding_a_pr_replaces_its_contribution():
+    accumulator = MetricsAccumulator().add_pull_requests([_pr(9, 1)], "r")
+    accumulator.add_pull_requests([_pr(9, 1, merged_day=3, review_day=2)], "r") # merged later
+    stored = [dict(c, seq=i + 1) for i, c in enumerate(COMMITS)]
+    accumulator.add_commits(stored, "r").add_commits(stored, "r") # at or below the seq watermark: skipped
+    restored = MetricsAccumulator.from_dict(accumulator.to_dict())
+    assert restored.pr_throughput_count == 1 and restored.cycle_time_count == 1
+    assert restored.total_commits == len(COMMITS)
+
+
+def test_pruned_prs_survive_a_merge_in_either_order():
+    old, new = _pr(1, 1, 2, 1), _pr(2, 2, 5, 3, updated_day=28)
+    pruned = MetricsAccumulator().add_pull_requests([old, new], "r").prune(retention_days=7)
+    assert list(pruned.prs) == ["r#2"] # #1 is frozen in the totals
+    expected = _result(MetricsAccumulator().add_pull_requests([old, new], "r"))
+    empty = MetricsAccumulator()
+    assert _result(empty.merge(pruned)) == _result(pruned.merge(empty)) == expected
+    assert empty.merge(pruned).pr_throughput_count == pruned.merge(empty).pr_throughput_count == 2
+    # A merged state keeps the frozen part apart, so it survives being merged again or saved
+    again = MetricsAccumulator.from_dict(empty.merge(pruned).to_dict())
+    assert _result(empty.merge(again)) == expected
+
+
+def test_run_incremental_matches_full_window(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "acc.sqlite"))
+    rows = [dict(c, files_changed=c.pop("files")) for c in (dict(c) for c in COMMITS)]
+    save_commits(rows[:2], repo="acme/api")
+    save_pull_requests(PRS[:2], repo="acme/api")
+    analyst = DiffAnalyst()
+    analyst.run_incremental("acme/api")
+
+    save_commits(rows[2:], repo="acme/api")
+    save_pull_requests([_pr(2, 2, 5, 3, updated_day=7), *PRS[2:]], repo="acme/api")
+    assert analyst.run_incremental("acme/api") == analyst.run_window("acme/api")
+
+
+def test_late_older_commits_are_folded_once(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "late.sqlite"))
+    rows = [dict(c, files_changed=c.pop("files")) for c in (dict(c) for c in COMMITS)]
+    save_commits(rows[2:], repo="acme/api") # the newest days arrive first...
+    analyst = DiffAnalyst()
+    analyst.run_incremental("acme/api")
+
+    save_commits(rows[:2], repo="acme/api") # ...then a wider window backfills older ones
+    save_commits(rows[2:], repo="acme/api") # re-saving known commits changes nothing
+    assert analyst.run_incremental("acme/api") == analyst.run_window("acme/api")
+    assert analyst.run_incremental("acme/api")["churn_score"] == sum(c["additions"] + c["deletions"] for c in rows)
+
+
+def test_state_stays_bounded_as_history_grows(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "bounded.sqlite"))
+    old_pr = {"number": 100, "state": "closed", "created_at": "2024-01-02T09:00:00Z", "merged_at": "2024-01-03T09:00:00Z",
+              "updated_at": "2024-01-03T09:00:00Z"}
+    quiet = [{"sha": f"q{i}", "author": "alice", "date": f"2024-01-01T1{i}:00:00Z", "additions": 10, "deletions": 0,
+              "files_changed": 1} for i in range(3)]
+    old_spike = {"sha": "s", "author": "alice", "date": "2024-01-02T10:00:00Z", "additions": 900, "deletions": 0, "files_changed": 1}
+    save_pull_requests([old_pr], repo="acme/api")
+    save_commits([*quiet, old_spike], repo="acme/api")
+    analyst = DiffAnalyst(timeseries=ChurnTimeSeries(warmup=2))
+    analyst.run_incremental("acme/api")
+    state = load_accumulator_state("acme/api")
+    assert list(state["prs"]) == ["acme/api#100"] and [c["sha"] for c in state["spikes"]] == ["s"]
+
+    save_pull_requests(PRS, repo="acme/api") # four months later
+    save_commits([dict(c, files_changed=c.pop("files")) for c in (dict(c) for c in COMMITS)], repo="acme/api")
+    result = analyst.run_incremental("acme/api")
+    state = load_accumulator_state("acme/api")
+    assert "acme/api#100" not in state["prs"] and len(state["prs"]) == len(PRS) # settled PR pruned...
+    assert result["pr_throughput_count"] == 4 # ...but still counted (3 merged in May + January's)
+    assert "s" not in [c["sha"] for c in state["spikes"]] # January's spike aged out
+    assert all(a["bucket"] >= "2024-02" for a in state["churn_anomalies"])
+
+    # A late update to the pruned PR is ignored rather than counted twice
+    save_pull_requests([dict(old_pr, updated_at="2024-05-20T09:00:00Z")], repo="acme/api")
+    assert analyst.run_incremental("acme/api")["pr_throughput_count"] == 4
+
+
+def test_states_from_an_older_layout_are_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "legacy.sqlite"))
+    save_commits([dict(c, files_changed=c.pop("files")) for c in (dict(c) for c in COMMITS)], repo="acme/api")
+    # (date, sha) watermark past every stored commit, as written before store insertion order existed
+    save_accumulator_state("acme/api", {"total_commits": 1, "commit_watermark": {"acme/api": ["2024-06-01T00:00:00Z", "z"]}})
+    analyst = DiffAnalyst()
+    assert analyst.run_incremental("acme/api") == analyst.run_window("acme/api")
@@ -0,0 +1,54 @@
+"""Checks repo-scoped keys: same PR number / sha in two repos, and migration of a single-repo database."""
+import sqlite3
+
+import sqlite_utils
+
+from store.db import DEFAULT_REPO, get_db_connection, get_known_commit_shas, save_commits, save_pull_requests, load_pull_requests, get_author_churn, list_repos
+
+
+def _pr(number, title):
+    return {"number": number, "title": title, "state": "closed", "created_at": "2024-01-01T00:00:00Z",
+            "merged_at": "2024-01-02T00:00:00Z", "updated_at": "2024-01-02T00:00:00Z", "author": "alice"}
+
+
+def test_same_pr_number_in_two_repos(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "org.sqlite"))
+    save_pull_requests([_pr(101, "api fix")], repo="acme/api")
+    save_pull_requests([_pr(101, "web fix")], repo="acme/web")
+    commit = {"sha": "abc", "author": "alice", "date": "2024-01-01T00:00:00Z", "additions": 5, "deletions": 1, "files_changed": 1}
+    save_commits([commit], repo="acme/api")
+    save_commits([commit], repo="acme/web")
+
+    assert [pr["title"] for pr in load_pull_requests("acme/api")] == ["api fix"]
+    assert [pr["title"] for pr in load_pull_requests("acme/web")] == ["web fix"]
+    assert get_author_churn("acme/web")[0]["commits"] == 1
+    assert list_repos() == ["acme/api", "acme/web"]
+
+
+def test_known_shas_lookup_spans_many_queries(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "known.sqlite"))
+    save_commits([{"sha": f"{i:040x}", "author": "alice", "date": "2024-01-01T00:00:00Z", "additions": 1, "deletions": 0,
+                   "files_changed": 1} for i in range(0, 1500, 3)], repo="acme/api")
+    # More shas than an older SQLite build binds in one statement (newer ones allow 32766 or more)
+    get_db_connection().conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    shas = [f"{i:040x}" for i in range(3000)]
+    assert get_known_commit_shas("acme/api", shas) == set(shas[0:1500:3])
+    assert get_known_commit_shas("acme/web", shas) == set() and get_known_commit_shas("acme/api", []) == set()
+
+
+def test_migrates_single_repo_database(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.sqlite"
+    legacy = sqlite_utils.Database(str(path))
+    legacy["commits"].insert({"sha": "abc", "author": "bob", "date": "2024-01-01T00:00:00Z",
+                              "additions": 3, "deletions": 2, "files_changed": 1}, pk="sha")
+    legacy["pull_requests"].insert(_pr(7, "old"), pk="number")
+    legacy.conn.close()
+
+    monkeypatch.setenv("SQLITE_DB_PATH", str(path))
+    db = get_db_connection()
+    assert db["commits"].pks == ["repo", "sha"]
+    assert db["pull_requests"].pks == ["repo", "number"]
+    assert db["commits"].get((DEFAULT_REPO, "abc"))["author"] == "bob" # legacy rows belong to the default repo
+    assert db["commits"].get((DEFAULT_REPO, "abc"))["seq"] == 1 # and get a store insertion order
+    assert [pr["title"] for pr in load_pull_requests(DEFAULT_REPO)] == ["old"]
+    assert get_author_churn(DEFAULT_REPO)[0]["additions"] == 3
@@ -0,0 +1,86 @@
+"""Checks InsightNarrator's async batch: bounded concurrency, per-item retries and error isolation."""
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from agents.insight_narrator import InsightNarrator, _llm_client, get_narration_stats
+
+
+class FakeModel:
+    """Async LLM stand-in: 0.1s per call, tracks concurrency, fails on demand."""
+
+    def __init__(self, flaky=(), broken=()):
+        self.flaky, self.broken = set(flaky), set(broken)
+        self.in_flight = self.max_in_flight = self.calls = 0
+
+    async def __call__(self, prompt):
+        team = prompt.to_messages()[0].content.split('"team":"')[1].split('"')[0]
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.1)
+            if team in self.broken or team in self.flaky:
+                self.flaky.discard(team)
+                raise RuntimeError(f"upstream error for {team}")
+            return AIMessage(content=f"summary for {team}")
+        finally:
+            self.in_flight -= 1
+
+
+def _outcomes():
+    stats = get_narration_stats()
+    return {outcome: stats[outcome] for outcome in ("primary", "hedge", "fallback")}
+
+
+def _narrator(monkeypatch, tmp_path, model):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "batch.sqlite"))
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setenv("OPENROUTER_MODEL_NAME", "test-model")
+    monkeypatch.setattr("agents.insight_narrator.NARRATION_BATCH_BACKOFF_SECONDS", 0.01)
+    monkeypatch.setattr("agents.insight_narrator._STATS", {"primary": 0, "hedge": 0, "fallback": 0})
+    narrator = InsightNarrator("Ada", "Lead", use_cache=False)
+    narrator.llm = RunnableLambda(lambda prompt: None, afunc=model)
+    return narrator
+
+
+def _states(n):
+    return [{"narration_metrics": {"team": f"t{i}"}, "analysis": {"total_additions": i}} for i in range(n)]
+
+
+def test_concurrent_batch_with_cap(monkeypatch, tmp_path):
+    model = FakeModel()
+    narrator = _narrator(monkeypatch, tmp_path, model)
+    started_at = time.monotonic()
+    results = narrator.run_batch(_states(6), concurrency=3, rps=0)
+    assert [r["summary"] for r in results] == [f"summary for t{i}" for i in range(6)]
+    assert model.max_in_flight == 3
+    assert time.monotonic() - started_at < 0.5 # two rounds of 0.1s, not six
+
+
+def test_retries_and_error_isolation(monkeypatch, tmp_path):
+    model = FakeModel(flaky={"t1"}, broken={"t2"})
+    narrator = _narrator(monkeypatch, tmp_path, model)
+    results = narrator.run_batch(_states(4), concurrency=4, rps=0, retries=1)
+    assert results[1]["summary"] == "summary for t1" # succeeded on retry
+    assert "upstream error for t2" in results[2]["narration_error"]
+    assert results[2]["summary"].startswith("*Weekly Engineering Productivity Report*")
+    assert results[0]["summary"] == "summary for t0" and results[3]["summary"] == "summary for t3"
+    assert _outcomes() == {"primary": 3, "hedge": 0, "fallback": 1}
+
+
+def test_rps_cap_spaces_request_starts(monkeypatch, tmp_path):
+    narrator = _narrator(monkeypatch, tmp_path, FakeModel())
+    started_at = time.monotonic()
+    narrator.run_batch(_states(3), concurrency=3, rps=10)
+    assert time.monotonic() - started_at >= 0.2
+
+
+def test_narrators_share_one_client(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setenv("OPENROUTER_MODEL_NAME", "shared-model")
+    first, second = InsightNarrator("Ada", "Lead", use_cache=False), InsightNarrator("Bob", "CTO", use_cache=False)
+    assert first.llm is second.llm is _llm_client("shared-model", "test-key", None, first.latency_budget_seconds)
+    assert first.prompt_template is second.prompt_template
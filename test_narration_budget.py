@@ -0,0 +1,163 @@
+"""Checks hedged narration and the template fallback against a local stand-in for /chat/completions."""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import agents.insight_narrator as insight_narrator
+from agents.insight_narrator import InsightNarrator, get_narration_stats
+from agents.report_template import closing_remarks, render_template_report
+
+ANALYSIS = {"total_additions": 1200, "total_deletions": 300, "churn_score": 1500, "pr_throughput_count": 4,
+            "dora_deployment_frequency": 4, "defect_risk_flag": "Medium",
+            "per_author_diffs": {"ada": {"additions": 1000, "deletions": 200}, "bob": {"additions": 200, "deletions": 100}},
+            "spikes": [{"sha": "abcdef1234", "author": "ada", "additions": 900, "deletions": 50}]}
+
+
+def _outcomes():
+    stats = get_narration_stats()
+    return {outcome: stats[outcome] for outcome in ("primary", "hedge", "fallback")}
+
+
+class FakeCompletions(BaseHTTPRequestHandler):
+    """OpenAI-style /chat/completions whose latency and failure are set per model name."""
+    latency = {}
+    failing = set()
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        model = request["model"]
+        time.sleep(self.latency.get(model, 0))
+        if model in self.failing:
+            self.send_response(500)
+            self.end_headers()
+            return
+        text = f"report from {model}"
+        self.send_response(200)
+        if request.get("stream"):
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for word in text.split(" "):
+                chunk = {"id": "1", "object": "chat.completion.chunk", "created": 0, "model": model,
+                         "choices": [{"index": 0, "delta": {"role": "assistant", "content": word + " "}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        body = json.dumps({"id": "1", "object": "chat.completion", "created": 0, "model": model,
+                           "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                           "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}).encode()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint(monkeypatch, tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeCompletions)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    FakeCompletions.latency, FakeCompletions.failing = {}, set()
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "budget.sqlite"))
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setenv("OPENROUTER_API_BASE", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("OPENROUTER_MODEL_NAME", "primary-model")
+    monkeypatch.setenv("OPENROUTER_FALLBACK_MODEL_NAME", "fallback-model")
+    monkeypatch.setattr("agents.insight_narrator.NARRATION_HEDGE_DELAY_SECONDS", 0.2)
+    monkeypatch.setattr("agents.insight_narrator._LATENCIES", {})
+    monkeypatch.setattr("agents.insight_narrator._STATS", {"primary": 0, "hedge": 0, "fallback": 0})
+    yield FakeCompletions
+    server.shutdown()
+
+
+def test_fast_primary(endpoint):
+    narrator = InsightNarrator("Ada", "Lead", use_cache=False, latency_budget_seconds=2)
+    assert narrator.run({"analysis": ANALYSIS})["summary"] == "report from primary-model"
+    assert _outcomes() == {"primary": 1, "hedge": 0, "fallback": 0}
+    InsightNarrator("Ada", "Lead", use_cache=False, latency_budget_seconds=2).run({"analysis": ANALYSIS}) # another narrator...
+    assert get_narration_stats()["primary"] == 2 and get_narration_stats()["primary_rate"] == 1.0 # ...same counters
+
+
+def test_slow_primary_is_hedged(endpoint):
+    endpoint.latency = {"primary-model": 1.5}
+    narrator = InsightNarrator("Ada", "Lead", use_cache=False, latency_budget_seconds=3)
+    started_at = time.monotonic()
+    assert narrator.run({"analysis": ANALYSIS})["summary"] == "report from fallback-model"
+    assert time.monotonic() - started_at < 1.0
+    assert _outcomes() == {"primary": 0, "hedge": 1, "fallback": 0}
+
+    partials = []
+    state = narrator.run({"analysis": ANALYSIS}, on_token=partials.append)
+    assert state["summary"].strip() == "report from fallback-model" and partials[-1] == state["summary"]
+
+
+def _running_attempts(timeout=1):
+    async def count():
+        return len(asyncio.all_tasks()) - 1 # not counting this one
+    deadline = time.monotonic() + timeout # cancellation lands on the narration loop asynchronously
+    while (running := asyncio.run_coroutine_threadsafe(count(), insight_narrator._narration_loop()).result()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return running
+
+
+def test_latencies_are_kept_per_model_and_mode_and_losers_cancelled(endpoint):
+    endpoint.latency = {"primary-model": 1.5}
+    narrator = InsightNarrator("Ada", "Lead", use_cache=False, latency_budget_seconds=3)
+    narrator.run({"analysis": ANALYSIS})
+    assert _running_attempts() == 0 # the slow primary was cancelled, not left holding a worker
+    narrator.run({"analysis": ANALYSIS}, on_token=lambda text: None)
+    assert _running_attempts() == 0
+    counts = {key: sketch.count for key, sketch in insight_narrator._LATENCIES.items()}
+    # The hedge's latency is the fallback model's, not the primary's, and first tokens aren't full completions
+    assert counts == {("fallback-model", "invoke"): 1, ("fallback-model", "stream"): 1}
+
+    endpoint.latency = {}
+    narrator.run({"analysis": ANALYSIS})
+    assert insight_narrator._LATENCIES[("primary-model", "invoke")].count == 1
+    assert narrator.hedge_delay() == 0.2 and narrator.hedge_delay(streaming=True) == 0.2 # still too few samples
+
+
+def test_unbudgeted_requests_still_time_out():
+    client = insight_narrator._llm_client("any-model", "test-key", None, 0)
+    assert client.request_timeout == insight_narrator.NARRATION_CLIENT_TIMEOUT_SECONDS
+
+
+def test_failing_primary_hedges_immediately(endpoint):
+    endpoint.failing = {"primary-model"}
+    narrator = InsightNarrator("Ada", "Lead", use_cache=False, latency_budget_seconds=3)
+    assert narrator.run({"analysis": ANALYSIS})["summary"] == "report from fallback-model"
+    assert _outcomes()["hedge"] == 1
+
+
+def test_budget_exhausted_renders_template(endpoint):
+    endpoint.latency = {"primary-model": 2, "fallback-model": 2}
+    narrator = InsightNarrator("Ada", "Lead", use_cache=False, latency_budget_seconds=0.5)
+    started_at = time.monotonic()
+    summary = narrator.run({"analysis": ANALYSIS})["summary"]
+    assert time.monotonic() - started_at < 1.0
+    assert summary == render_template_report(ANALYSIS, "ada", "Ada", "Lead")
+    assert _outcomes() == {"primary": 0, "hedge": 0, "fallback": 1}
+
+
+def test_template_is_fast_and_deterministic():
+    started_at = time.perf_counter()
+    report = render_template_report(ANALYSIS, "ada", "Ada", "Lead")
+    assert time.perf_counter() - started_at < 0.01
+    assert report == render_template_report(dict(ANALYSIS), "ada", "Ada", "Lead")
+    assert "abcdef1" in report and "Medium" in report and report.endswith("Ada\nLead")
+
+
+def test_closing_remarks_follow_the_metrics():
+    remarks = closing_remarks(ANALYSIS, "ada")
+    assert "Defect risk is Medium, driven by 1 churn spike(s)" in remarks
+    assert "ada accounted for 80% of changed lines." in remarks and "merged" not in remarks
+    quiet = {"defect_risk_flag": "Low", "pr_throughput_count": 0, "per_author_diffs": {"bob": {"additions": 5, "deletions": 0}}}
+    assert closing_remarks(quiet, "bob") == ("Churn stayed within this repo's usual range, so defect risk is Low. "
+                                             "No pull requests were merged in this window.")
+    assert closing_remarks(ANALYSIS, "ada") in render_template_report(ANALYSIS, "ada", "Ada", "Lead")
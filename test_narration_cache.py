@@ -0,0 +1,73 @@
+"""Checks that InsightNarrator reuses cached narrations for unchanged metrics and honours TTL, size bound and bypass."""
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from agents.insight_narrator import InsightNarrator
+from agents.narration_cache import NarrationCache, narration_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _narrator(monkeypatch, tmp_path, cache, **kwargs):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "narration.sqlite"))
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setenv("OPENROUTER_MODEL_NAME", "test-model")
+    narrator = InsightNarrator("Ada", "Lead", cache=cache, **kwargs)
+    narrator.calls = 0
+
+    def fake_llm(prompt):
+        narrator.calls += 1
+        return AIMessage(content=f"report #{narrator.calls}")
+
+    narrator.llm = RunnableLambda(fake_llm)
+    return narrator
+
+
+def test_unchanged_metrics_hit_the_cache(monkeypatch, tmp_path):
+    cache = NarrationCache()
+    narrator = _narrator(monkeypatch, tmp_path, cache)
+    analysis = {"total_commits": 3, "per_author_diffs": {"ada": {"additions": 5, "deletions": 1}}}
+
+    assert narrator.run({"analysis": analysis})["summary"] == "report #1"
+    # Same metrics in a different key order: served from the cache without an LLM call
+    reordered = {"per_author_diffs": {"ada": {"deletions": 1, "additions": 5}}, "total_commits": 3}
+    assert narrator.run({"analysis": reordered})["summary"] == "report #1"
+    assert narrator.calls == 1 and cache.stats["hits"] == 1
+
+    assert narrator.run({"analysis": dict(analysis, total_commits=4)})["summary"] == "report #2"
+
+    narrator.bypass_cache = True
+    assert narrator.run({"analysis": analysis})["summary"] == "report #3"
+    narrator.bypass_cache = False
+    assert narrator.run({"analysis": analysis})["summary"] == "report #3" # the bypassed run refreshed the entry
+
+
+def test_key_covers_model_prompt_and_author():
+    base = narration_key({"a": 1}, "model-a", "1", "Ada", "Lead")
+    assert base == narration_key({"a": 1}, "model-a", "1", "Ada", "Lead")
+    assert base != narration_key({"a": 1}, "model-b", "1", "Ada", "Lead")
+    assert base != narration_key({"a": 1}, "model-a", "2", "Ada", "Lead")
+    assert base != narration_key({"a": 1}, "model-a", "1", "Bob", "Lead")
+
+
+def test_ttl_and_size_bound(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "bounded.sqlite"))
+    clock = Clock()
+    cache = NarrationCache(ttl_seconds=60, max_bytes=10, clock=clock)
+    cache.put("a", "aaaa")
+    clock.now += 1
+    cache.put("b", "bbbb")
+    clock.now += 1
+    assert cache.get("a") == "aaaa" # a is now more recently used than b
+    cache.put("c", "cccc")
+    assert cache.get("b") is None and cache.get("a") == "aaaa" and cache.get("c") == "cccc"
+    assert cache.stats["evictions"] == 1
+
+    clock.now += 61
+    assert cache.get("a") is None and cache.stats["expired"] == 1
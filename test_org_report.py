@@ -0,0 +1,36 @@
+"""Runs the org batch report over a process pool against a store that is already fresh."""
+from datetime import datetime, timezone
+
+from langgraph.org_report import run_org_report, reduce_outcomes
+from store.db import save_commits, save_pull_requests, save_harvest_state, flush_logs
+
+
+def _seed(repo, sha, author, additions):
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    save_commits([{"sha": sha, "author": author, "date": now, "additions": additions, "deletions": 0, "files_changed": 1}], repo=repo)
+    save_pull_requests([{"number": 1, "state": "closed", "created_at": "2024-01-01T00:00:00Z", "merged_at": now,
+                         "updated_at": now, "author": author}], repo=repo)
+    # fresh and covering all history, so workers read the store without GitHub calls
+    save_harvest_state(repo, {"last_harvested_at": now, "covered_since": ""})
+
+
+def test_org_report_isolates_failures(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "org.sqlite"))
+    _seed("acme/api", "a1", "alice", 10)
+    _seed("acme/web", "w1", "bob", 30)
+    flush_logs()
+
+    seen = []
+    report = run_org_report(["acme/api", "acme/web", "not-a-repo"], teams={"frontend": ["acme/web"]},
+                            max_workers=2, max_staleness_seconds=3600, progress=lambda done, total, o: seen.append(done))
+
+    assert sorted(seen) == [1, 2, 3]
+    assert list(report["failed"]) == ["not-a-repo"]
+    assert report["org"]["total_additions"] == 40 and report["org"]["pr_throughput_count"] == 2
+    assert report["teams"]["frontend"]["per_author_diffs"] == {"bob": {"additions": 30, "deletions": 0, "files_changed": 1, "commits": 1}}
+    assert report["repos"]["acme/api"]["total_additions"] == 10
+
+
+def test_reduce_with_only_failures():
+    outcomes = [{"repo": "x", "error": "boom"}]
+    assert reduce_outcomes(outcomes)["org"]["total_additions"] == 0
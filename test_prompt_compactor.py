@@ -0,0 +1,33 @@
+"""Checks that PromptCompactor keeps the LLM input bounded however many authors and spikes a week has."""
+from agents.prompt_compactor import PromptCompactor, compact_json
+
+
+def _analysis(n):
+    authors = {f"dev{i}": {"additions": i * 10, "deletions": i, "files_changed": 1, "commits": 1} for i in range(n)}
+    spikes = [{"sha": f"{i:07x}" + "0" * 33, "author": f"dev{i}", "date": "2024-05-06T10:00:00Z", "additions": 600 + i,
+               "deletions": 0, "files": 3, "churn_z": 3.14159} for i in range(n)]
+    return {"total_additions": sum(a["additions"] for a in authors.values()), "avg_cycle_time_hours": 12.3456,
+            "defect_risk_flag": "High", "per_author_diffs": authors, "spikes": spikes,
+            "churn_anomalies": [{"scope": "repo", "period": "day", "bucket": "2024-05-06", "churn": 900, "z_score": 4.2}],
+            "risk_flags": {"repo": "High", "authors": {f"dev{i}": "Medium" for i in range(n)}}}
+
+
+def test_top_k_with_remainder_and_rounding():
+    compact, _ = PromptCompactor(top_authors=2, top_spikes=2, max_tokens=10_000).compact(_analysis(10))
+    assert list(compact["top_authors"]) == ["dev9", "dev8"]
+    assert compact["other_authors"] == {"count": 8, "additions": 280, "deletions": 28, "commits": 8}
+    assert [s["sha"] for s in compact["top_spikes"]] == ["0000009", "0000008"] and compact["spike_count"] == 10
+    assert compact["avg_cycle_time_hours"] == 12.3 and compact["top_spikes"][0]["z"] == 3.1
+    assert compact["risk_flags"]["flagged_author_count"] == 10
+
+
+def test_prompt_size_is_bounded():
+    compactor = PromptCompactor(max_tokens=300)
+    sizes = [len(compact_json(compactor.compact(_analysis(n))[0])) for n in (10, 100, 2000)]
+    assert sizes[2] < sizes[1] * 1.1 # 20x the activity, only wider numbers
+    assert all(compactor.compact(_analysis(n))[1] <= 300 for n in (10, 2000))
+
+    tiny = PromptCompactor(max_tokens=60)
+    compact, tokens = tiny.compact(_analysis(50))
+    assert tokens <= 60 or set(compact) <= {"total_additions", "avg_cycle_time_hours", "defect_risk_flag", "spike_count",
+                                            "churn_anomaly_count"}
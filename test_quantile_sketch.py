@@ -0,0 +1,52 @@
+"""Checks QuantileSketch accuracy, merging and the per-week sketches kept in the store."""
+import json
+import random
+
+import numpy as np
+
+from agents.diff_analyst import DiffAnalyst
+from agents.quantile_sketch import QuantileSketch
+from store.db import get_db_connection, save_pull_requests, get_metric_sketch
+from store.rollups import rebuild_rollups
+
+
+def test_percentiles_within_relative_error():
+    rng = random.Random(3)
+    values = [rng.lognormvariate(3, 1.5) for _ in range(20000)]
+    sketch = QuantileSketch().add_many(values)
+    for q in (0.5, 0.9, 0.99):
+        exact = sorted(values)[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) / exact < 0.01
+    assert len(sketch.bins) < 1000 # memory is bounded by the value range, not the count
+
+
+def test_merge_is_associative_and_serializable():
+    rng = random.Random(5)
+    a, b, c = (QuantileSketch().add_many([rng.expovariate(0.1) for _ in range(500)]) for _ in range(3))
+    left, right = a.merge(b).merge(c), a.merge(b.merge(c))
+    assert left.to_dict() == right.to_dict()
+    restored = QuantileSketch.from_dict(json.loads(json.dumps(left.to_dict())))
+    assert restored.quantile(0.9) == left.quantile(0.9)
+    # Scalar and vectorized adds bucket identically
+    scalar = QuantileSketch()
+    for value in np.linspace(0, 50, 101):
+        scalar.add(float(value))
+    assert scalar.to_dict() == QuantileSketch().add_many(np.linspace(0, 50, 101)).to_dict()
+
+
+def test_store_sketches_follow_upserts(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "sketch.sqlite"))
+    pr = {"number": 1, "state": "closed", "author": "alice", "created_at": "2024-05-06T00:00:00Z",
+          "merged_at": "2024-05-07T00:00:00Z", "updated_at": "2024-05-07T00:00:00Z"}
+    save_pull_requests([pr], repo="acme/api")
+    save_pull_requests([dict(pr, merged_at="2024-05-08T00:00:00Z")], repo="acme/api") # replaced, not added
+    sketch = get_metric_sketch("acme/api", "cycle_time_hours")
+    assert sketch.count == 1 and abs(sketch.quantile(0.5) - 48) < 0.5
+
+    db = get_db_connection()
+    before = list(db.query("SELECT * FROM rollup_sketches ORDER BY metric"))
+    rebuild_rollups(db)
+    assert list(db.query("SELECT * FROM rollup_sketches ORDER BY metric")) == before
+
+    result = DiffAnalyst().run_rollups("acme/api", "2024-05-01", "2024-06-01")
+    assert result["cycle_time_hours_p50"] == round(sketch.quantile(0.5), 2)
@@ -0,0 +1,149 @@
+"""Exercises RequestScheduler against a local fake GitHub API that returns rate-limit headers."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from github.rate_limiter import RequestScheduler, SharedBudgets, INTERACTIVE, BACKGROUND
+
+
+class FakeClock:
+    """Clock/sleep pair so backoff waits advance virtual time instead of real time."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_api():
+    state = {"calls": [], "responses": {}}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            token = self.headers.get("Authorization", "").replace("Bearer ", "")
+            state["calls"].append((self.path, token))
+            status, headers = state["responses"][self.path].pop(0)
+            body = json.dumps({"path": self.path, "token": token}).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, str(value))
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    state["base"] = f"http://127.0.0.1:{server.server_port}"
+    yield state
+    server.shutdown()
+
+
+def _limits(remaining, reset, limit=5000):
+    return {"X-RateLimit-Limit": limit, "X-RateLimit-Remaining": remaining, "X-RateLimit-Reset": reset}
+
+
+def test_rotates_to_token_with_budget_left(fake_api):
+    clock = FakeClock()
+    scheduler = RequestScheduler(["token-a", "token-b"], clock=clock.time, sleep=clock.sleep)
+    fake_api["responses"]["/one"] = [(200, _limits(0, clock.now + 600))]
+    fake_api["responses"]["/two"] = [(200, _limits(4000, clock.now + 600))]
+
+    with requests.Session() as session:
+        first = scheduler.request(session, "GET", fake_api["base"] + "/one").json()
+        second = scheduler.request(session, "GET", fake_api["base"] + "/two").json()
+
+    assert first["token"] != second["token"] # the exhausted credential is skipped
+    assert clock.slept == []
+    metrics = scheduler.metrics()
+    assert {c["remaining"] for c in metrics["credentials"]} == {0, 4000}
+
+
+def test_waits_out_retry_after_and_resumes(fake_api):
+    clock = FakeClock()
+    scheduler = RequestScheduler(["token-a"], clock=clock.time, sleep=clock.sleep)
+    fake_api["responses"]["/busy"] = [
+        (403, {"Retry-After": 30}),
+        (200, _limits(4999, clock.now + 3600)),
+    ]
+
+    with requests.Session() as session:
+        res = scheduler.request(session, "GET", fake_api["base"] + "/busy")
+
+    assert res.status_code == 200
+    assert sum(clock.slept) == pytest.approx(30)
+    assert scheduler.metrics()["credentials"][0]["throttled"] == 1
+
+
+def test_background_requests_keep_reserve_for_interactive(fake_api):
+    clock = FakeClock()
+    scheduler = RequestScheduler(["token-a"], background_reserve=0.2, clock=clock.time, sleep=clock.sleep)
+    reset = clock.now + 120
+    fake_api["responses"]["/warmup"] = [(200, _limits(100, reset, limit=1000))]
+    fake_api["responses"]["/interactive"] = [(200, _limits(99, reset, limit=1000))]
+    fake_api["responses"]["/background"] = [(200, _limits(1000, reset + 3600, limit=1000))]
+
+    with requests.Session() as session:
+        scheduler.request(session, "GET", fake_api["base"] + "/warmup")
+        scheduler.request(session, "GET", fake_api["base"] + "/interactive", priority=INTERACTIVE)
+        assert clock.slept == [] # 100 left is below the 200 reserve, but interactive may spend it
+        scheduler.request(session, "GET", fake_api["base"] + "/background", priority=BACKGROUND)
+
+    assert sum(clock.slept) == pytest.approx(120) # background waited for the budget to reset
+
+
+def test_permission_errors_are_not_retried(fake_api):
+    clock = FakeClock()
+    scheduler = RequestScheduler(["token-a"], clock=clock.time, sleep=clock.sleep)
+    fake_api["responses"]["/private"] = [(403, _limits(4000, clock.now + 600))]
+
+    with requests.Session() as session:
+        res = scheduler.request(session, "GET", fake_api["base"] + "/private")
+
+    assert res.status_code == 403
+    assert len(fake_api["calls"]) == 1
+
+
+def test_shared_budgets_span_schedulers(fake_api, tmp_path):
+    # Two schedulers on one SQLite file stand in for two worker processes with the same token
+    clock = FakeClock()
+    path = str(tmp_path / "budgets.sqlite")
+    first, second = (RequestScheduler(["token-a"], background_reserve=0.2, clock=clock.time, sleep=clock.sleep,
+                                      shared=SharedBudgets(path)) for _ in range(2))
+    reset = clock.now + 120
+    fake_api["responses"]["/first"] = [(200, _limits(150, reset, limit=1000))]
+    fake_api["responses"]["/second"] = [(200, _limits(1000, reset + 3600, limit=1000))]
+
+    with requests.Session() as session:
+        first.request(session, "GET", fake_api["base"] + "/first", priority=BACKGROUND)
+        assert second.metrics()["credentials"][0]["remaining"] == 150 # seen without a request of its own
+        second.request(session, "GET", fake_api["base"] + "/second", priority=BACKGROUND)
+    assert sum(clock.slept) == pytest.approx(120) # the other process's spending counts against the reserve
+
+
+def test_waiting_interactive_request_holds_off_other_processes(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "budgets.sqlite")
+    interactive, background = (RequestScheduler(["token-a"], clock=clock.time, sleep=clock.sleep, shared=SharedBudgets(path))
+                               for _ in range(2))
+    with interactive._state():
+        interactive.budgets[0].remaining, interactive.budgets[0].reset_at = 0, clock.now + 30
+    waits = []
+    interactive.sleep = lambda seconds: (waits.append(seconds), clock.sleep(seconds))
+    interactive.acquire(INTERACTIVE) # waits out the reset and marks itself as waiting meanwhile
+    assert waits == [pytest.approx(30)]
+
+    background.acquire(BACKGROUND)
+    assert clock.now >= 1_000_000.0 + 31 # yielded until just after the interactive request could go
@@ -0,0 +1,150 @@
+"""Checks the persisted /dev-report queue: coalescing, bounded workers, restart recovery and metrics."""
+import threading
+import time
+
+from bot.report_queue import ReportQueue
+from store.db import get_db_connection
+from store.jobs import enqueue_job, claim_job, get_job, requeue_running
+
+
+class Pipeline:
+    """Fake runner/notifier; runs block until released so tests can pile up requests."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.runs, self.notified = [], {}
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def runner(self, job, waiters):
+        with self.lock:
+            self.runs.append(job["repo"])
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.started.set()
+        self.release.wait(5)
+        with self.lock:
+            self.in_flight -= 1
+        if job["repo"] == "acme/broken":
+            raise RuntimeError("harvest failed")
+        return {"summary": f"report for {job['repo']}"}
+
+    def notifier(self, job, waiters):
+        for waiter in waiters:
+            self.notified[waiter["user_id"]] = (job["result"] or {}).get("summary") or job["error"]
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_identical_requests_share_one_job(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "queue.sqlite"))
+    pipeline = Pipeline()
+    queue = ReportQueue(pipeline.runner, pipeline.notifier, workers=1, poll_seconds=0.05).start()
+    try:
+        first, coalesced, _ = queue.submit("acme/api", 7, {"user_id": "u1"})
+        assert not coalesced
+        pipeline.started.wait(5) # running jobs still take waiters
+        assert queue.submit("acme/api", 7, {"user_id": "u2"})[:2] == (first, True)
+        assert queue.submit("acme/api", 7, {"user_id": "u3"})[:2] == (first, True)
+        other, coalesced, queued = queue.submit("acme/web", 7, {"user_id": "u4"})
+        assert other != first and not coalesced and queued == 1 # waits for the single worker
+
+        stats = queue.stats()
+        assert stats["running"] == 1 and stats["queued"] == 1 and stats["coalesced_requests"] == 2
+
+        time.sleep(0.1) # acme/web measurably waits behind acme/api
+        pipeline.release.set()
+        _wait_for(lambda: len(pipeline.notified) == 4)
+        assert pipeline.runs == ["acme/api", "acme/web"] and pipeline.max_in_flight == 1
+        assert {pipeline.notified[u] for u in ("u1", "u2", "u3")} == {"report for acme/api"}
+
+        # Once a job is done, a new request starts a fresh one
+        again, coalesced, _ = queue.submit("acme/api", 7, {"user_id": "u5"})
+        assert again not in (first, other) and not coalesced
+        _wait_for(lambda: "u5" in pipeline.notified)
+        assert queue.stats()["done"] == 3 and queue.stats()["max_wait_seconds"] > 0
+    finally:
+        pipeline.release.set()
+        queue.stop(5)
+
+
+def test_failures_are_reported_and_workers_are_bounded(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "bounded.sqlite"))
+    pipeline = Pipeline()
+    queue = ReportQueue(pipeline.runner, pipeline.notifier, workers=2, poll_seconds=0.05).start()
+    try:
+        for i, repo in enumerate(["acme/a", "acme/b", "acme/c", "acme/broken"]):
+            queue.submit(repo, 7, {"user_id": f"u{i}"})
+        _wait_for(lambda: len(pipeline.runs) == 2)
+        time.sleep(0.1)
+        assert len(pipeline.runs) == 2 and queue.stats()["queued"] == 2
+        pipeline.release.set()
+        _wait_for(lambda: len(pipeline.notified) == 4)
+        assert pipeline.max_in_flight == 2
+        assert pipeline.notified["u3"] == "RuntimeError: harvest failed" and queue.stats()["failed"] == 1
+    finally:
+        queue.stop(5)
+
+
+def test_jobs_survive_a_restart(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "restart.sqlite"))
+    db = get_db_connection()
+    job_id, _ = enqueue_job(db, "acme/api", 14, {"user_id": "u1", "response_url": "https://hooks.example/1"})
+    assert claim_job(db)["id"] == job_id # picked up, then the process "dies" mid-run
+
+    pipeline = Pipeline()
+    pipeline.release.set()
+    queue = ReportQueue(pipeline.runner, pipeline.notifier, workers=1, poll_seconds=0.05).start()
+    try:
+        _wait_for(lambda: "u1" in pipeline.notified)
+        job = get_job(db, job_id)
+        assert job["status"] == "done" and job["attempts"] == 2 and job["window_days"] == 14
+    finally:
+        queue.stop(5)
+
+
+def test_jobs_that_keep_dying_fail_and_notify(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "attempts.sqlite"))
+    db = get_db_connection()
+    job_id, _ = enqueue_job(db, "acme/api", 7, {"user_id": "u1"})
+    claim_job(db, max_attempts=2) # the process dies mid-run...
+    assert requeue_running(db, max_attempts=2) == 1
+    claim_job(db, max_attempts=2) # ...twice
+    assert requeue_running(db, max_attempts=2) == 0
+    job = get_job(db, job_id)
+    assert (job["status"], job["attempts"]) == ("failed", 2) and "2 attempt(s)" in job["error"] # ...and is not retried
+
+    # A queued job that already used its attempts is failed when claimed, and its waiters still hear back
+    stuck, _ = enqueue_job(db, "acme/web", 7, {"user_id": "u2"})
+    with db.conn:
+        db.execute("UPDATE report_jobs SET attempts = 3 WHERE id = ?", [stuck])
+    pipeline = Pipeline()
+    pipeline.release.set()
+    queue = ReportQueue(pipeline.runner, pipeline.notifier, workers=1, poll_seconds=0.05).start()
+    try:
+        _wait_for(lambda: {"u1", "u2"} <= set(pipeline.notified))
+        assert pipeline.runs == [] and "3 attempt(s)" in pipeline.notified["u2"]
+    finally:
+        queue.stop(5)
+
+
+def test_requests_only_join_jobs_with_their_options(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "options.sqlite"))
+    db = get_db_connection()
+    fresh = {"bypass_narration_cache": True}
+    plain, _ = enqueue_job(db, "acme/api", 7, {"user_id": "u1"})
+    assert enqueue_job(db, "acme/api", 7, {"user_id": "u2"}, fresh) == (plain, True) # still queued: upgraded
+    assert get_job(db, plain)["options"] == fresh
+    assert enqueue_job(db, "acme/api", 7, {"user_id": "u3"}) == (plain, True) # a fresh report is fine for everyone
+
+    claim_job(db)
+    other, _ = enqueue_job(db, "acme/web", 7, {"user_id": "u4"})
+    claim_job(db)
+    # A running plain job can't become fresh, so a fresh request gets its own job
+    assert enqueue_job(db, "acme/web", 7, {"user_id": "u5"}, fresh) != (other, True)
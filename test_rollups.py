@@ -0,0 +1,98 @@
+"""Checks that rollups follow replaced rows and that a failed rollup write rolls the rows back with it."""
+import pytest
+
+import store.db as store_db
+from store.db import (
+    get_author_churn, get_db_connection, get_metric_sketch, get_weekly_pr_metrics, record_first_reviews,
+    save_commits, save_pull_requests, upsert_pull_requests,
+)
+from store.rollups import rebuild_rollups
+
+REPO = "acme/api"
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "rollups.sqlite"))
+    return get_db_connection()
+
+
+def _commit(date, additions=10, author="alice", sha="abc"):
+    return {"sha": sha, "author": author, "date": date, "additions": additions, "deletions": 2, "files_changed": 1}
+
+
+def _pr(created_at="2024-05-06T09:00:00Z", merged_at="2024-05-07T09:00:00Z", **extra):
+    return {"number": 7, "title": "fix", "state": "closed", "created_at": created_at, "closed_at": merged_at,
+            "merged_at": merged_at, "updated_at": merged_at, "author": "alice", **extra}
+
+
+def _snapshot(db):
+    return {table: sorted(map(tuple, db.execute(f"SELECT * FROM {table}").fetchall()))
+            for table in ("rollup_daily_churn", "rollup_weekly_prs", "rollup_sketches")}
+
+
+def _rebuilt_matches(db):
+    incremental = _snapshot(db)
+    rebuild_rollups(db)
+    return incremental == _snapshot(db)
+
+
+def test_replaced_commit_moves_its_contribution(db):
+    save_commits([_commit("2024-05-06T10:00:00Z")], repo=REPO)
+    save_commits([_commit("2024-05-06T10:00:00Z", additions=30)], repo=REPO) # same sha, new numbers
+    assert [(a["additions"], a["commits"]) for a in get_author_churn(REPO)] == [(30, 1)]
+
+    # Re-dated into the next week and re-attributed: the old day, week and author buckets empty out
+    save_commits([_commit("2024-05-14T10:00:00Z", additions=30, author="bob")], repo=REPO)
+    assert [(a["author"], a["commits"]) for a in get_author_churn(REPO)] == [("bob", 1)]
+    assert db.execute("SELECT day FROM rollup_daily_churn").fetchall() == [("2024-05-14",)]
+    assert get_metric_sketch(REPO, "commit_churn", until_week="2024-05-13").count == 0
+    assert get_metric_sketch(REPO, "commit_churn", since_week="2024-05-13").count == 1
+    assert _rebuilt_matches(db)
+
+
+def test_replaced_pull_request_moves_its_contribution(db):
+    save_pull_requests([_pr()], repo=REPO)
+    record_first_reviews(REPO, [(7, "2024-05-06T11:00:00Z")])
+    record_first_reviews(REPO, [(7, "2024-05-06T15:00:00Z")]) # later review: first_review_at keeps 11:00
+    (week,) = get_weekly_pr_metrics(REPO)
+    assert (week["opened_count"], week["merged_count"], week["review_latency_seconds_sum"]) == (1, 1, 7200)
+
+    # Reopened and merged a week later: upsert keeps the review time and moves the merge to the new week
+    upsert_pull_requests([{"repo": REPO, "number": 7, "merged_at": "2024-05-14T09:00:00Z", "updated_at": "2024-05-14T09:00:00Z"}])
+    first, second = get_weekly_pr_metrics(REPO)
+    assert (first["week"], first["opened_count"], first["merged_count"], first["review_latency_count"]) == ("2024-05-06", 1, 0, 1)
+    assert (second["week"], second["merged_count"], second["cycle_time_seconds_sum"]) == ("2024-05-13", 1, 8 * 86400)
+
+    # A full replace without the review time backs the latency out again
+    save_pull_requests([_pr(merged_at="2024-05-14T09:00:00Z")], repo=REPO)
+    assert get_weekly_pr_metrics(REPO)[0]["review_latency_count"] == 0
+    assert _rebuilt_matches(db)
+
+
+@pytest.mark.parametrize("replace", [False, True])
+def test_failed_rollup_rolls_back_the_commit(db, monkeypatch, replace):
+    if replace:
+        save_commits([_commit("2024-05-06T10:00:00Z")], repo=REPO)
+    before = (db.execute("SELECT * FROM commits").fetchall(), _snapshot(db))
+
+    def broken(*args):
+        raise RuntimeError("rollup write failed")
+    monkeypatch.setattr(store_db, "apply_commit_changes", broken)
+    assert save_commits([_commit("2024-05-13T10:00:00Z", additions=99), _commit("2024-05-13T11:00:00Z", sha="def")], repo=REPO) is False
+    assert (db.execute("SELECT * FROM commits").fetchall(), _snapshot(db)) == before
+    assert not db.conn.in_transaction
+
+
+def test_failed_rollup_rolls_back_the_pull_request(db, monkeypatch):
+    save_pull_requests([_pr()], repo=REPO)
+    before = (db.execute("SELECT * FROM pull_requests").fetchall(), _snapshot(db))
+
+    def broken(*args):
+        raise RuntimeError("rollup write failed")
+    monkeypatch.setattr(store_db, "apply_pull_request_changes", broken)
+    assert save_pull_requests([_pr(merged_at="2024-05-14T09:00:00Z")], repo=REPO) is False
+    upsert_pull_requests([{"repo": REPO, "number": 7, "title": "renamed"}])
+    with pytest.raises(RuntimeError):
+        record_first_reviews(REPO, [(8, "2024-05-06T11:00:00Z")]) # would have created a stub row for #8
+    assert (db.execute("SELECT * FROM pull_requests").fetchall(), _snapshot(db)) == before
@@ -0,0 +1,90 @@
+"""Checks the structured run log: payload dedup, compression, compaction and what agents write to it."""
+import sqlite3
+
+import pytest
+
+import store.db as store_db
+from agents.diff_analyst import DiffAnalyst
+from store.db import compact_logs, flush_logs, get_db_connection, load_log_payload, log_event
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "log.sqlite"))
+    return get_db_connection()
+
+
+def _events(db):
+    flush_logs()
+    return db.execute("SELECT node, action, input_hash, output_hash FROM log_events ORDER BY id").fetchall()
+
+
+def test_identical_payloads_are_stored_once(db):
+    commits = [{"sha": f"c{i}", "additions": i} for i in range(50)]
+    log_event("DataHarvester", "harvest_commits", {"repo": "api"}, commits, run_id="r1")
+    log_event("Other", "reuse", list(commits), {"ok": True}, run_id="r1") # an equal copy, not the same object
+
+    (_, _, _, first_output), (_, _, second_input, _) = _events(db)
+    assert first_output == second_input
+    assert db.execute("SELECT COUNT(*) FROM log_payloads").fetchone()[0] == 3
+    assert load_log_payload(first_output) == commits
+
+
+@pytest.mark.parametrize("zstd", [True, False])
+def test_large_payloads_are_compressed(db, monkeypatch, zstd):
+    if not zstd:
+        monkeypatch.setattr(store_db, "zstandard", None)
+    big = {"files": [f"src/module_{i}.py" for i in range(500)]}
+    log_event("Agent", "big", {"small": 1}, big)
+
+    ((_, _, small_hash, big_hash),) = _events(db)
+    rows = {h: (encoding, size, len(body)) for h, encoding, size, body in
+            db.execute("SELECT hash, encoding, size, body FROM log_payloads")}
+    assert rows[small_hash][0] == "json" # below LOG_COMPRESS_MIN_BYTES: kept as plain JSON
+    encoding, size, stored = rows[big_hash]
+    assert encoding == ("zstd" if zstd else "zlib") and stored < size / 4
+    assert load_log_payload(big_hash) == big
+
+
+def test_compaction_prunes_old_runs_and_orphaned_payloads(db):
+    shared = {"analysis": "same in both runs"}
+    log_event("Agent", "old", {"blob": "x" * 50_000, "run": "old"}, shared, run_id="old")
+    log_event("Agent", "new", {"run": "new"}, shared, run_id="new")
+    flush_logs()
+    with db.conn:
+        db.execute("UPDATE log_events SET finished_at = '2020-01-01T00:00:00.000+00:00' WHERE run_id = 'old'")
+
+    assert db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2 # new databases are created ready for incremental vacuum
+    assert compact_logs(max_age_days=30) == {"events_deleted": 1, "payloads_deleted": 1}
+    ((_, action, input_hash, output_hash),) = _events(db)
+    assert action == "new" and load_log_payload(output_hash) == shared # still referenced, so kept
+    assert db.execute("SELECT COUNT(*) FROM log_payloads").fetchone()[0] == 2
+    assert db.execute("PRAGMA freelist_count").fetchone()[0] == 0 # freed pages went back to the filesystem
+
+
+def test_compaction_switches_legacy_databases_to_incremental_vacuum(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.sqlite"
+    legacy = sqlite3.connect(path)
+    legacy.execute("CREATE TABLE logs (agent_name TEXT, action TEXT, input_data TEXT, output_data TEXT)")
+    legacy.commit()
+    legacy.close()
+    monkeypatch.setenv("SQLITE_DB_PATH", str(path))
+
+    db = get_db_connection()
+    assert db.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    compact_logs()
+    assert db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def test_analyst_logs_a_reference_to_the_state(db):
+    commits = [{"sha": f"c{i}", "author": "alice", "date": "2024-05-01T00:00:00Z", "additions": 10, "deletions": 1,
+                "files_changed": 1} for i in range(20)]
+    state = {"run_id": "r1", "repo": "acme/api", "commit_diff_data": commits, "pull_request_details": []}
+    DiffAnalyst().run(state)
+
+    ((node, action, input_hash, _),) = _events(db)
+    reference = load_log_payload(input_hash)
+    assert (node, action) == ("DiffAnalyst", "analyze_metrics")
+    assert reference["repo"] == "acme/api" and reference["commits"] == 20 and "commit_diff_data" not in reference
+    DiffAnalyst().run(dict(state, commit_diff_data=list(reversed(commits))))
+    assert _events(db)[1][2] == input_hash # the same commits hash the same, whatever their order
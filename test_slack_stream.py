@@ -0,0 +1,62 @@
+"""Checks the throttled in-place Slack message and InsightNarrator's token streaming."""
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from agents.insight_narrator import InsightNarrator
+from bot.slack_stream import StreamingMessage, format_metrics_header
+
+
+class FakeSlack:
+    def __init__(self):
+        self.posts, self.updates = [], []
+
+    def chat_postMessage(self, channel, text):
+        self.posts.append(text)
+        return {"channel": "C123", "ts": "1.0"}
+
+    def chat_update(self, channel, ts, text):
+        self.updates.append((channel, ts, text))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_updates_are_throttled_and_finish_flushes():
+    slack, clock = FakeSlack(), Clock()
+    message = StreamingMessage(slack, "U1", "*header*", interval=0.5, clock=clock).post()
+    assert slack.posts == ["*header*\n\n_Writing the summary..._"]
+
+    message.update("a") # too soon after the post
+    clock.now = 0.6
+    message.update("a b")
+    clock.now = 0.7
+    message.update("a b c")
+    assert [text for _, _, text in slack.updates] == ["*header*\n\na b"]
+
+    message.finish("a b c d")
+    assert slack.updates[-1] == ("C123", "1.0", "*header*\n\na b c d")
+    assert message.updates == 2
+
+
+def test_narrator_streams_tokens(monkeypatch, tmp_path):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "stream.sqlite"))
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setenv("OPENROUTER_MODEL_NAME", "test-model")
+    narrator = InsightNarrator("Ada", "Lead", use_cache=False)
+    narrator.llm = GenericFakeChatModel(messages=iter([AIMessage(content="churn is steady this week")]))
+
+    partials = []
+    state = narrator.run({"analysis": {"total_additions": 10}}, on_token=partials.append)
+    assert state["summary"] == "churn is steady this week"
+    assert len(partials) > 1 and partials[-1] == state["summary"]
+
+
+def test_metrics_header():
+    header = format_metrics_header("acme", "api", {"total_additions": 5, "total_deletions": 2, "spikes": [{}],
+                                                   "defect_risk_flag": "Medium"})
+    assert header.startswith("*Dev report for acme/api*") and "+5 / -2 (spikes: 1)" in header and "Medium" in header
@@ -0,0 +1,65 @@
+"""Checks the half-open [since, until) windows served by the store and DiffAnalyst.run_window."""
+import pytest
+
+from agents.diff_analyst import DiffAnalyst
+from store.db import iter_stored_commits, iter_stored_pull_requests, save_commits, save_pull_requests
+
+SINCE, UNTIL = "2024-05-01T00:00:00Z", "2024-05-08T00:00:00Z"
+
+
+def _commit(sha, date, author="alice", additions=10):
+    return {"sha": sha, "author": author, "date": date, "additions": additions, "deletions": 0, "files_changed": 1}
+
+
+def _pr(number, created_at, merged_at="2024-05-20T00:00:00Z", author="alice"):
+    return {"number": number, "title": f"PR {number}", "state": "closed", "created_at": created_at, "closed_at": merged_at,
+            "merged_at": merged_at, "updated_at": merged_at, "author": author}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "window.sqlite"))
+    save_commits([
+        _commit("before", "2024-04-30T23:59:59Z"),
+        _commit("at-since", SINCE),
+        _commit("inside", "2024-05-04T12:00:00Z", author="bob"),
+        _commit("before-until", "2024-05-07T23:59:59Z"),
+        _commit("at-until", UNTIL),
+    ], repo="acme/api")
+    save_commits([_commit("other-repo", "2024-05-04T12:00:00Z")], repo="acme/web")
+    save_pull_requests([
+        _pr(1, "2024-04-30T23:59:59Z"),
+        _pr(2, SINCE),
+        _pr(3, "2024-05-07T23:59:59Z", merged_at=UNTIL, author="bob"),
+        _pr(4, UNTIL),
+    ], repo="acme/api")
+
+
+def test_commit_window_includes_since_and_excludes_until(store):
+    assert [c["sha"] for c in iter_stored_commits("acme/api", SINCE, UNTIL)] == ["at-since", "inside", "before-until"]
+    assert [c["sha"] for c in iter_stored_commits("acme/api", since=UNTIL)] == ["at-until"]
+    assert [c["sha"] for c in iter_stored_commits("acme/api", until=SINCE)] == ["before"]
+    assert len(list(iter_stored_commits("acme/api"))) == 5 # no bounds: the whole repo, and only that repo
+    assert [c["sha"] for c in iter_stored_commits("acme/api", SINCE, UNTIL, authors=["bob"])] == ["inside"]
+    assert list(iter_stored_commits("acme/api", UNTIL, UNTIL)) == [] # an empty window
+
+
+def test_pull_request_window_follows_the_chosen_field(store):
+    assert [pr["number"] for pr in iter_stored_pull_requests("acme/api", SINCE, UNTIL)] == [2, 3]
+    # by merge date, PR 3 (merged exactly at until) falls out and nothing else merged that week
+    assert [pr["number"] for pr in iter_stored_pull_requests("acme/api", SINCE, UNTIL, window_field="merged_at")] == []
+    assert [pr["number"] for pr in iter_stored_pull_requests("acme/api", UNTIL, window_field="merged_at")] == [3, 1, 2, 4]
+    with pytest.raises(ValueError):
+        list(iter_stored_pull_requests("acme/api", window_field="title"))
+
+
+def test_run_window_counts_only_the_window(store):
+    result = DiffAnalyst().run_window("acme/api", SINCE, UNTIL)
+    assert result["total_additions"] == 30 and set(result["per_author_diffs"]) == {"alice", "bob"}
+    assert result["pr_throughput_count"] == 2
+
+    # Consecutive windows split the history without counting a boundary commit twice
+    earlier = DiffAnalyst().run_window("acme/api", until=SINCE)
+    later = DiffAnalyst().run_window("acme/api", since=UNTIL)
+    assert earlier["total_additions"] + result["total_additions"] + later["total_additions"] == 50
+    assert DiffAnalyst().run_window("acme/api", SINCE, UNTIL, authors=["bob"])["pr_throughput_count"] == 1
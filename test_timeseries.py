@@ -0,0 +1,96 @@
+"""Checks adaptive churn spikes: scale-relative flags, persisted baselines and incomplete buckets."""
+import math
+from datetime import date, timedelta
+
+from agents.diff_analyst import DiffAnalyst
+from agents.timeseries import ChurnTimeSeries, EwmaDetector
+from store.db import save_commits
+
+
+def _commits(churns, start="2024-04-01", author="alice", prefix="c"):
+    first = date.fromisoformat(start)
+    return [
+        {"sha": f"{prefix}{i:03d}", "author": author, "date": f"{first + timedelta(days=i)}T12:00:00Z",
+         "additions": churn, "deletions": 0, "files": 1}
+        for i, churn in enumerate(churns)
+    ]
+
+
+def test_flags_are_relative_to_the_repo():
+    small = _commits([20, 25, 18, 22, 30, 24, 21, 400])  # 400 lines is huge for this repo
+    large = _commits([3000, 2800, 3500, 3100, 2900, 3300, 3050, 3400])  # every commit is above 500
+    series = ChurnTimeSeries(persist=False)
+    small_report = series.analyze(small, today="2024-06-01")
+    large_report = series.analyze(large, today="2024-06-01")
+    assert [s["sha"] for s in small_report["spikes"]] == ["c007"]
+    assert small_report["defect_risk_flag"] != "Low"
+    assert large_report["spikes"] == [] and large_report["defect_risk_flag"] == "Low"
+
+
+def test_baselines_persist_between_runs(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "ts.sqlite"))
+    series = ChurnTimeSeries()
+    series.analyze(_commits([40, 45, 38, 42, 50, 44]), repo="acme/api", today="2024-06-01")
+    # The second report only sees its own window, but is scored against the saved baseline
+    report = series.analyze(_commits([41, 900], start="2024-04-10", prefix="d"), repo="acme/api", today="2024-06-01")
+    assert [s["sha"] for s in report["spikes"]] == ["d001"]
+    assert {"scope": "repo", "period": "day", "bucket": "2024-04-11"}.items() <= report["churn_anomalies"][0].items()
+
+
+def test_partial_buckets_are_scored_but_not_folded():
+    detector = EwmaDetector(alpha=0.5)
+    series = ChurnTimeSeries(warmup=0, persist=False)
+    series._observe(detector, "2024-06-01", 100, complete=False)
+    assert detector.n == 0
+    series._observe(detector, "2024-05-31", 100)
+    assert detector.n == 1 and detector.last == "2024-05-31"
+
+
+def test_window_starting_mid_week_learns_whole_weeks_only():
+    # 100 lines a day is 700 a week; the window opens on a Thursday and closes on a Wednesday
+    scan = ChurnTimeSeries(persist=False).scan(since="2024-04-04T00:00:00Z", until="2024-04-24T00:00:00Z")
+    for commit in _commits([100] * 20, start="2024-04-04"):
+        scan.add(commit)
+    scan.finish()
+    weekly = scan.baselines["repo:week"]
+    assert weekly.n == 2 and math.isclose(weekly.mean, math.log1p(700)) # not the 400 of Thursday-Sunday
+    assert scan.baselines["repo:day"].n == 20
+
+
+def test_rollup_spikes_follow_the_baseline(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / "rollups.sqlite"))
+    rows = [dict(c, files_changed=c.pop("files")) for c in _commits([20, 25, 18, 22, 30, 24, 21, 400])]
+    save_commits(rows, repo="acme/small")
+    save_commits([dict(c, files_changed=c.pop("files")) for c in _commits([3000, 2800, 3500, 3100, 2900, 3300])],
+                 repo="acme/large")
+    analyst = DiffAnalyst()
+    assert [s["sha"] for s in analyst.run_rollups("acme/small")["spikes"]] == ["c007"] # well under 500 lines
+    assert analyst.run_rollups("acme/large")["spikes"] == []
+    # With a warm baseline only the commits above its threshold are read back, with the same result
+    assert [s["sha"] for s in analyst.run_rollups("acme/small")["spikes"]] == ["c007"]
+    assert [s["sha"] for s in analyst.run_window("acme/small")["spikes"]] == ["c007"]
+
+
+def test_array_scan_matches_commit_by_commit(tmp_path, monkeypatch):
+    churns = [40, 45, 38, 42, 50, 44, 900, 41, 39, 47, 1200, 43, 44, 40, 46]
+    # The second run overlaps what the first folded, including the flagged c006
+    batches = [_commits(churns[:9]), _commits(churns[5:]) + _commits([35, 800, 42], start="2024-04-20", prefix="d")]
+    reports, baselines = {}, {}
+    for mode in ("array", "loop"):
+        monkeypatch.setenv("SQLITE_DB_PATH", str(tmp_path / f"{mode}.sqlite"))
+        series = ChurnTimeSeries(warmup=3)
+        for batch in batches:
+            if mode == "array":
+                report = series.analyze(list(reversed(batch)), repo="acme/api", today="2024-06-01")
+            else:
+                scan = series.scan("acme/api", today="2024-06-01")
+                for commit in batch:
+                    scan.add(commit)
+                report = scan.finish()
+            reports.setdefault(mode, []).append(report)
+        baselines[mode] = series.scan("acme/api").baselines["commit"]
+    assert reports["array"] == reports["loop"]
+    assert [s["sha"] for s in reports["array"][1]["spikes"]] == ["c006", "d001"]
+    array, loop = baselines["array"], baselines["loop"]
+    assert (array.n, array.last, array.flagged) == (loop.n, loop.last, loop.flagged)
+    assert math.isclose(array.mean, loop.mean) and math.isclose(array.var, loop.var)